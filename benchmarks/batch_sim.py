@@ -0,0 +1,160 @@
+"""
+Simulación masiva de partidas de Evil Clutches.
+
+Juega muchas partidas sin pantalla, una por semilla, repartidas en un
+pool de procesos, con un bot sencillo como jugador. Sirve para ajustar
+la dificultad (CHANCE_DEMON / CHANCE_BABY) y para medir cuántas
+simulaciones por segundo se pueden ejecutar.
+
+Uso, desde la raíz del repositorio:
+
+    python -m benchmarks.batch_sim
+    python -m benchmarks.batch_sim --sims 2000 --frames 900 \\
+        --chance-demon 50 30 20 --workers 4
+"""
+
+__author__ = 'andriu'
+
+import argparse
+import functools
+import json
+import os
+import sys
+
+from pyhandru.game import *
+from games.evil_clutches import evil_clutches
+
+GAME_DIR = os.path.dirname(os.path.abspath(evil_clutches.__file__))
+
+DEFAULT_SIMS = 200
+# 30 segundos de partida a los FPS del juego
+DEFAULT_FRAMES = 30 * evil_clutches.FPS
+DEFAULT_FIRST_SEED = 1
+
+# Cada cuántos fotogramas dispara el bot
+FIRE_PERIOD = 4
+
+
+def _sin_salida(*args, **kwargs):
+    pass
+
+
+def make_game(chance_demon, chance_baby):
+    """
+    Crea una partida nueva de Evil Clutches con la dificultad indicada.
+    Las variables globales del juego se reinician porque un mismo proceso
+    ejecuta muchas partidas.
+    """
+    os.chdir(GAME_DIR)
+    evil_clutches.CHANCE_DEMON = chance_demon
+    evil_clutches.CHANCE_BABY = chance_baby
+    evil_clutches.score = 0
+    # El juego imprime la puntuación en cada colisión
+    evil_clutches.print = _sin_salida
+    return evil_clutches.GameEvilClutches()
+
+
+def bot(sim):
+    """
+    Jugador automático: se coloca a la altura del demonio más cercano y
+    dispara cada FIRE_PERIOD fotogramas.
+    """
+    eventos = []
+    dragon = sim.game.dragon
+    demonios = [objeto for objeto in sim.game.room.objetos_de_juego
+                if isinstance(objeto, evil_clutches.DemonObject)]
+    if demonios:
+        objetivo = min(demonios, key=lambda demonio: demonio.pos_x)
+        diferencia = objetivo.rect.centery - dragon.rect.centery
+        if diferencia > evil_clutches.PLAYER_SPEED:
+            if dragon.despl_y <= 0:
+                eventos.append((KEYDOWN, {'key': K_DOWN}))
+        elif diferencia < -evil_clutches.PLAYER_SPEED:
+            if dragon.despl_y >= 0:
+                eventos.append((KEYDOWN, {'key': K_UP}))
+        elif dragon.despl_y:
+            eventos.append((KEYUP, {'key': K_UP}))
+    if sim.frame % FIRE_PERIOD == 0:
+        eventos.append((KEYDOWN, {'key': K_SPACE}))
+    return eventos
+
+
+def observe(sim):
+    return {'score': evil_clutches.score, 'frames': sim.frame,
+            'survived': not sim.finished}
+
+
+def run_setting(chance_demon, chance_baby, seeds, frames, workers):
+    """
+    Juega una partida por semilla con una dificultad.
+
+    :return: Diccionario con la dificultad, las estadísticas de las
+    partidas y el rendimiento
+    """
+    runner = BatchRunner(functools.partial(make_game, chance_demon,
+                                           chance_baby),
+                         frames, inputs=bot, observe=observe,
+                         workers=workers)
+    resultado = runner.run(seeds)
+    puntuaciones = [partida['score'] for partida in resultado.results]
+    return {
+        'chance_demon': chance_demon,
+        'chance_baby': chance_baby,
+        'sims': len(resultado),
+        'mean_score': sum(puntuaciones) / float(len(puntuaciones)),
+        'survival': sum(partida['survived'] for partida in
+                        resultado.results) / float(len(resultado)),
+        'mean_frames': resultado.frames / float(len(resultado)),
+        'seconds': resultado.seconds,
+        'sims_per_second': resultado.simulations_per_second,
+        'frames_per_second': resultado.frames_per_second,
+    }
+
+
+def print_results(resultados, out=sys.stdout):
+    out.write('%6s %6s %6s %10s %9s %10s %9s %11s\n' % (
+        'demon', 'baby', 'sims', 'score', 'survival', 'frames', 'sims/s',
+        'frames/s'))
+    for resultado in resultados:
+        out.write('%6d %6d %6d %10.1f %8.1f%% %10.1f %9.1f %11.0f\n' % (
+            resultado['chance_demon'], resultado['chance_baby'],
+            resultado['sims'], resultado['mean_score'],
+            100.0 * resultado['survival'], resultado['mean_frames'],
+            resultado['sims_per_second'], resultado['frames_per_second']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.batch_sim',
+        description='Simulación masiva de partidas de Evil Clutches')
+    parser.add_argument('--sims', type=int, default=DEFAULT_SIMS,
+                        help='Partidas por dificultad')
+    parser.add_argument('--frames', type=int, default=DEFAULT_FRAMES,
+                        help='Máximo de fotogramas por partida')
+    parser.add_argument('--first-seed', type=int,
+                        default=DEFAULT_FIRST_SEED)
+    parser.add_argument('--chance-demon', type=int, nargs='+',
+                        default=[evil_clutches.CHANCE_DEMON])
+    parser.add_argument('--chance-baby', type=int,
+                        default=evil_clutches.CHANCE_BABY)
+    parser.add_argument('--workers', type=int,
+                        help='Procesos (por defecto uno por CPU, 0 para '
+                             'no usar el pool)')
+    parser.add_argument('--json', help='Guarda los resultados en un fichero '
+                                       'JSON')
+    args = parser.parse_args(argv)
+
+    semillas = range(args.first_seed, args.first_seed + args.sims)
+    resultados = [run_setting(chance_demon, args.chance_baby, semillas,
+                              args.frames, args.workers)
+                  for chance_demon in args.chance_demon]
+
+    print_results(resultados)
+    if args.json:
+        with open(args.json, 'w') as fichero:
+            json.dump(resultados, fichero, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,360 @@
+"""
+Benchmark del bucle de una habitación en modo headless.
+
+Ejecuta escenarios al estilo de Evil Clutches (demonios, bolas de fuego y
+bebés moviéndose y colisionando) con distintas poblaciones de objetos
+vivos y mide los fotogramas por segundo y el reparto del tiempo de cada
+fotograma entre eventos, 'step', 'actualiza_estado' y 'blit'.
+
+La pantalla es siempre de 640x480. Con muchos objetos la habitación
+crece (columna 'room') y una cámara muestra sólo una parte, de forma que
+'blit' mide lo que se ve y no el tamaño de la habitación.
+
+Uso, desde la raíz del repositorio:
+
+    python -m benchmarks.room_loop
+    python -m benchmarks.room_loop --sizes 100 1000 --frames 300
+"""
+
+__author__ = 'andriu'
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+from pyhandru.game import *
+
+GAME_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'games', 'evil_clutches')
+
+DEMON_IMG_PATH = os.path.join(GAME_DIR, 'images', 'Demon.gif')
+FIREBALL_IMG_PATH = os.path.join(GAME_DIR, 'images', 'Fireball.gif')
+BABY_IMG_PATH = os.path.join(GAME_DIR, 'images', 'Baby.gif')
+ROOM_IMG_PATH = os.path.join(GAME_DIR, 'images', 'Background.bmp')
+
+COLOR_KEY_MOB = (82, 46, 41)
+COLOR_KEY_FIREBALL = (97, 14, 8)
+
+SCREEN_DIMENSIONS = (640, 480)
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+DEFAULT_FRAMES = 200
+MIN_FRAMES = 10
+# Sin '--frames' explícito, las poblaciones grandes miden menos fotogramas
+# para que el benchmark completo termine en un tiempo razonable
+OBJECT_FRAME_BUDGET = 200000
+DEFAULT_WARMUP = 10
+DEFAULT_SEED = 1234
+
+# Densidad de objetos por pantalla de 640x480. Con más objetos la
+# habitación crece para mantener la densidad (y la tasa de colisiones)
+# de una partida real.
+DEFAULT_OBJECTS_PER_SCREEN = 100
+
+# Cada cuántos fotogramas se inyecta una pulsación de tecla
+KEY_EVENT_PERIOD = 10
+
+PHASES = ('eventos', 'step', 'actualiza_estado', 'blit')
+
+
+#----------------------------------------------------------------------
+#   OBJETOS DEL ESCENARIO
+#----------------------------------------------------------------------
+# A diferencia de los de Evil Clutches, estos objetos no se destruyen al
+# salir de la habitación o al colisionar: vuelven a aparecer, de forma
+# que la población se mantiene constante durante el benchmark.
+
+class BenchDemon(GameObject):
+    def __init__(self, pos_xy):
+        GameObject.__init__(self, DEMON_IMG_PATH, pos_xy, COLOR_KEY_MOB)
+        self.bound_rect.top += 40
+        self.bound_rect.height -= 30
+        self.bound_rect.left += 40
+        self.bound_rect.width -= 40
+
+    def on_create(self):
+        self.despl_x = -12
+        self.despl_y = random.choice((-12, 0, 12))
+
+    def respawn(self):
+        self.pos_x = self.room.width - self.width
+        self.pos_y = random.randint(1, self.room.height - self.height - 1)
+
+    def intersect_boundary(self):
+        self.despl_y = -self.despl_y
+
+    def out_of_bounds(self):
+        self.respawn()
+
+    def collision(self, sprite_colliding):
+        if isinstance(sprite_colliding, BenchFireball):
+            self.respawn()
+
+
+class BenchFireball(GameObject):
+    def __init__(self, pos_xy):
+        GameObject.__init__(self, FIREBALL_IMG_PATH, pos_xy,
+                            COLOR_KEY_FIREBALL)
+
+    def on_create(self):
+        self.despl_x = 32
+
+    def respawn(self):
+        self.pos_x = 1
+        self.pos_y = random.randint(1, self.room.height - self.height - 1)
+
+    def out_of_bounds(self):
+        self.respawn()
+
+    def collision(self, sprite_colliding):
+        if isinstance(sprite_colliding, (BenchDemon, BenchBaby)):
+            self.respawn()
+
+    def on_key_down(self, key):
+        if key == K_SPACE:
+            self.despl_x = 32
+
+
+class BenchBaby(GameObject):
+    def __init__(self, pos_xy):
+        GameObject.__init__(self, BABY_IMG_PATH, pos_xy, COLOR_KEY_MOB)
+
+    def on_create(self):
+        self.despl_x = -8
+
+    def out_of_bounds(self):
+        self.pos_x = self.room.width - self.width
+
+
+class BenchRoom(RoomObject):
+    def __init__(self, dimensions, dirty_rects=False):
+        # La pantalla mide siempre SCREEN_DIMENSIONS, para que el coste de
+        # dibujar sea comparable entre poblaciones; si la habitación es
+        # mayor, una cámara muestra sólo una parte
+        grande = tuple(dimensions) != SCREEN_DIMENSIONS
+        RoomObject.__init__(
+            self,
+            None if grande else ROOM_IMG_PATH,
+            SCREEN_DIMENSIONS,
+            'Benchmark',
+            UNCAPPED_FPS,
+            dirty_rects=dirty_rects,
+            world_size=tuple(dimensions) if grande else None)
+
+    def on_close(self):
+        # Nunca se sale al sistema durante un benchmark
+        pass
+
+
+#----------------------------------------------------------------------
+#   BENCHMARK
+#----------------------------------------------------------------------
+def room_dimensions(num_objects, objects_per_screen):
+    """
+    Calcula las dimensiones de la habitación para una población dada,
+    manteniendo la densidad de objetos por pantalla.
+    """
+    escala = max(1.0, math.sqrt(float(num_objects) / objects_per_screen))
+    return (int(SCREEN_DIMENSIONS[0] * escala),
+            int(SCREEN_DIMENSIONS[1] * escala))
+
+
+def default_frames(num_objects):
+    """
+    Fotogramas a medir por defecto para una población dada.
+    """
+    return min(DEFAULT_FRAMES,
+               max(MIN_FRAMES, OBJECT_FRAME_BUDGET // max(1, num_objects)))
+
+
+def populate(room, num_objects):
+    """
+    Llena la habitación con un 60% de demonios, un 30% de bolas de fuego y
+    un 10% de bebés en posiciones aleatorias.
+    """
+    for i in range(num_objects):
+        eleccion = i % 10
+        if eleccion < 6:
+            clase = BenchDemon
+        elif eleccion < 9:
+            clase = BenchFireball
+        else:
+            clase = BenchBaby
+        pos_xy = (random.randint(1, room.width - 150),
+                  random.randint(1, room.height - 150))
+        room.add(clase(pos_xy))
+
+
+def _inyecta_eventos(frame):
+    if frame % KEY_EVENT_PERIOD == 0:
+        pygame.event.post(pygame.event.Event(KEYDOWN, key=K_SPACE))
+    elif frame % KEY_EVENT_PERIOD == 1:
+        pygame.event.post(pygame.event.Event(KEYUP, key=K_SPACE))
+
+
+def run_scenario(num_objects, frames=DEFAULT_FRAMES, warmup=DEFAULT_WARMUP,
+                 seed=DEFAULT_SEED,
+                 objects_per_screen=DEFAULT_OBJECTS_PER_SCREEN,
+                 dirty_rects=False, vectorized=False):
+    """
+    Ejecuta un escenario y devuelve sus resultados.
+
+    :param num_objects: Número de objetos vivos
+    :param frames: Fotogramas medidos
+    :param warmup: Fotogramas previos sin medir
+    :param seed: Semilla de 'random'
+    :param objects_per_screen: Densidad de objetos por pantalla
+    :param dirty_rects: True para usar el renderizado por rectángulos sucios
+    :param vectorized: True para mover los objetos con NumPy
+    :return: Diccionario con fps y milisegundos por fotograma de cada fase
+    """
+    random.seed(seed)
+    room = BenchRoom(room_dimensions(num_objects, objects_per_screen),
+                     dirty_rects)
+    populate(room, num_objects)
+    if vectorized:
+        room.enable_vectorized_movement()
+
+    fases = (room.procesa_eventos, room.step, room.actualiza_estado,
+             room.blit)
+    tiempos = [0.0] * len(fases)
+    reloj = time.perf_counter
+
+    for frame in range(warmup):
+        _inyecta_eventos(frame)
+        room.frame()
+
+    inicio = reloj()
+    for frame in range(frames):
+        _inyecta_eventos(frame)
+        for indice, fase in enumerate(fases):
+            t0 = reloj()
+            fase()
+            tiempos[indice] += reloj() - t0
+        room.frame_count += 1
+        room.clock.tick(room.frames_per_second)
+    total = reloj() - inicio
+
+    resultado = {
+        'objects': num_objects,
+        'live_objects': len(room.objetos_de_juego),
+        'dimensions': [room.width, room.height],
+        'screen': list(SCREEN_DIMENSIONS),
+        'frames': frames,
+        'fps': frames / total if total else float('inf'),
+        'frame_ms': 1000.0 * total / frames,
+    }
+    for nombre, tiempo in zip(PHASES, tiempos):
+        resultado[nombre + '_ms'] = 1000.0 * tiempo / frames
+    return resultado
+
+
+# Desplazamientos con parte fraccionaria de ambos signos para comprobar
+# que el motor vectorizado redondea igual que pygame.Rect
+PARITY_DESPLS = (0.6, -0.6, 0.5, -0.5, 1.5, -1.5, 2.4, -2.4, 3, -3)
+PARITY_STEPS = 50
+
+
+class ParityObject(GameObject):
+    def __init__(self, pos_xy, despl_xy):
+        GameObject.__init__(self, DEMON_IMG_PATH, pos_xy, COLOR_KEY_MOB)
+        self.despl_x, self.despl_y = despl_xy
+
+
+def check_vectorized_parity(steps=PARITY_STEPS):
+    """
+    Comprueba que el motor vectorizado deja los objetos en las mismas
+    posiciones que GameObject.update.
+
+    :return: Lista de (despl_x, despl_y, posición normal, posición
+    vectorizada) de los objetos que no coinciden
+    """
+    habitaciones = []
+    for vectorized in (False, True):
+        room = BenchRoom((2000, 2000))
+        for despl_x in PARITY_DESPLS:
+            for despl_y in PARITY_DESPLS:
+                room.add(ParityObject((1000, 1000), (despl_x, despl_y)))
+        if vectorized:
+            room.enable_vectorized_movement()
+        for _ in range(steps):
+            room.actualiza_estado()
+        habitaciones.append(room.objetos_de_juego.sprites())
+    return [(normal.despl_x, normal.despl_y, normal.rect.topleft,
+             vectorizado.rect.topleft)
+            for normal, vectorizado in zip(*habitaciones)
+            if (normal.rect.topleft != vectorizado.rect.topleft or
+                normal.despl_x != vectorizado.despl_x or
+                type(normal.despl_x) is not type(vectorizado.despl_x))]
+
+
+def print_results(resultados, out=sys.stdout):
+    cabecera = '%8s %12s %9s %10s' % ('objects', 'room', 'fps', 'frame_ms')
+    cabecera += ''.join(' %17s' % (fase + '_ms') for fase in PHASES)
+    out.write(cabecera + '\n')
+    for resultado in resultados:
+        linea = '%8d %12s %9.1f %10.3f' % (
+            resultado['objects'],
+            '%dx%d' % tuple(resultado['dimensions']),
+            resultado['fps'],
+            resultado['frame_ms'])
+        linea += ''.join(' %17.3f' % resultado[fase + '_ms']
+                         for fase in PHASES)
+        out.write(linea + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.room_loop',
+        description='Benchmark headless del bucle de una habitación')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=list(DEFAULT_SIZES),
+                        help='Poblaciones de objetos a medir')
+    parser.add_argument('--frames', type=int,
+                        help='Fotogramas medidos (por defecto hasta %d, '
+                             'menos en poblaciones grandes)' % DEFAULT_FRAMES)
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--objects-per-screen', type=int,
+                        default=DEFAULT_OBJECTS_PER_SCREEN)
+    parser.add_argument('--dirty-rects', action='store_true',
+                        help='Usa el renderizado por rectángulos sucios')
+    parser.add_argument('--vectorized', action='store_true',
+                        help='Mueve los objetos con el motor de NumPy')
+    parser.add_argument('--json', help='Guarda los resultados en un fichero '
+                                       'JSON')
+    args = parser.parse_args(argv)
+
+    Game(UNCAPPED_FPS, headless=True, seed=args.seed)
+
+    if args.vectorized:
+        # Con el motor vectorizado el juego debe comportarse igual
+        distintos = check_vectorized_parity()
+        if distintos:
+            for despl_x, despl_y, normal, vectorizado in distintos:
+                sys.stderr.write('despl (%r, %r): %r != %r\n' % (
+                    despl_x, despl_y, normal, vectorizado))
+            sys.stderr.write('El motor vectorizado no coincide con '
+                             'GameObject.update\n')
+            return 1
+
+    resultados = []
+    for num_objects in args.sizes:
+        frames = args.frames or default_frames(num_objects)
+        resultados.append(run_scenario(
+            num_objects, frames, args.warmup, args.seed,
+            args.objects_per_screen, args.dirty_rects, args.vectorized))
+
+    print_results(resultados)
+    if args.json:
+        with open(args.json, 'w') as fichero:
+            json.dump(resultados, fichero, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
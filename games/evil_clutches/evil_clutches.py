@@ -36,12 +36,16 @@ ROOM_FULLSCREEN = False
 CHANCE_DEMON = 50
 CHANCE_BABY = 100
 
+SPARKS_PER_DEMON = 12
+
 score = 0
 
 #----------------------------------------------------------------------
 #   CLASES ESPECIFICAS PARA ESTE JUEGO
 #----------------------------------------------------------------------
 class DragonObject(GameObject):
+    collision_group = 'player'
+
     # Constructor
     def __init__(self, image_filename):
         GameObject.__init__(self, image_filename)
@@ -62,9 +66,8 @@ class DragonObject(GameObject):
             self.despl_y = -PLAYER_SPEED
         # disparo
         elif (key == K_SPACE):
-            fireball = FireballObject(FIREBALL_IMG_PATH,
-                                (self.pos_x+100, self.pos_y+10))
-            self.room.add (fireball)
+            self.room.spawn (FireballObject, FIREBALL_IMG_PATH,
+                             (self.pos_x+100, self.pos_y+10))
 
     def on_key_up(self, key):
         """
@@ -93,6 +96,8 @@ class DragonObject(GameObject):
 
 
 class BossObject(GameObject):
+    collision_group = 'boss'
+
     # Constructor
     def __init__(self, image_filename):
         GameObject.__init__(self, image_filename)
@@ -114,19 +119,23 @@ class BossObject(GameObject):
         test_chance = random.randint(1,CHANCE_DEMON)
         if test_chance == CHANCE_DEMON:
             # Demon
-            self.demon = DemonObject(DEMON_IMG_PATH,(self.pos_x, self.pos_y))
-            self.room.add(self.demon)
+            self.demon = self.room.spawn(DemonObject, DEMON_IMG_PATH,
+                                         (self.pos_x, self.pos_y))
 
         # genera objetos Baby una vez cada 'CHANCE_BABY'
         # disminuyendo 'CHANCE_BABY' se generan más Babies por segundo
         test_chance = random.randint(1, CHANCE_BABY)
         if test_chance == CHANCE_BABY:
             # Baby
-            self.baby = BabyObject(BABY_IMG_PATH, (self.pos_x, self.pos_y))
-            self.room.add(self.baby)
+            self.baby = self.room.spawn(BabyObject, BABY_IMG_PATH,
+                                        (self.pos_x, self.pos_y))
 
 
 class FireballObject(GameObject):
+    # Las bolas de fuego eliminadas se reciclan (ver RoomObject.spawn)
+    pool_size = 32
+    collision_group = 'fireball'
+
     # Constructor
     def __init__(self, image_filename, pos_xy):
         GameObject.__init__(self, image_filename, pos_xy)
@@ -142,14 +151,15 @@ class FireballObject(GameObject):
 
 
 class DemonObject(GameObject):
+    pool_size = 32
+    collision_group = 'demon'
+    # Colisiones por pixels en lugar de recortar el bound_rect a mano
+    pixel_perfect = True
+
     # Constructor
     def __init__(self, image_filename, pos_xy):
         GameObject.__init__(self, image_filename, pos_xy)
         self.set_colorkey(COLOR_KEY_MOB)
-        self.bound_rect.top += 40
-        self.bound_rect.height -=30
-        self.bound_rect.left += 40
-        self.bound_rect.width -= 40
         self.sound_demon = SoundDemon()
 
     def on_create(self):
@@ -167,32 +177,35 @@ class DemonObject(GameObject):
 
     def out_of_bounds(self):
         self.kill()
-        new_demon = DemonObject(DEMON_IMG_PATH,
-                                  (ROOM_DIMENSIONS[0],
-                                   ROOM_DIMENSIONS[1]//2))
-        self.room.add(new_demon)
+        self.room.spawn(DemonObject, DEMON_IMG_PATH,
+                        (ROOM_DIMENSIONS[0], ROOM_DIMENSIONS[1]//2))
 
     def intersect_boundary(self):
         self.despl_y = -self.despl_y
 
-    def collision(self, sprite_colliding):
+    # Demon <-> Fireball --> Destroy both and +score
+    def collision_fireball(self, sprite_colliding):
         global score
+        self.sound_demon.play()
+        # Las chispas sólo existen en la habitación del juego (Room)
+        sparks = getattr(self.room, 'sparks', None)
+        if sparks is not None:
+            sparks.emit(self.rect.center, SPARKS_PER_DEMON)
+        self.kill()
+        sprite_colliding.kill()
+        score += 100
+        print (score)
 
-        # Demon <-> Fireball --> Destroy both and +score
-        if isinstance(sprite_colliding, FireballObject):
-            self.sound_demon.play()
-            self.kill()
-            sprite_colliding.kill()
-            score += 100
-            print (score)
-
-        # Demon <-> Player --> End of Game
-        if isinstance(sprite_colliding, DragonObject):
-            print ('El baby dragon te tocó')
-            self.room.on_close()
+    # Demon <-> Player --> End of Game
+    def collision_player(self, sprite_colliding):
+        print ('El baby dragon te tocó')
+        self.room.on_close()
 
 
 class BabyObject(GameObject):
+    pool_size = 16
+    collision_group = 'baby'
+
     def __init__(self, image_filename, pos_xy):
         GameObject.__init__(self, image_filename, pos_xy)
         self.set_colorkey(COLOR_KEY_MOB)
@@ -205,22 +218,22 @@ class BabyObject(GameObject):
     def out_of_bounds(self):
         self.kill()
 
-    def collision(self, sprite_colliding):
+    # Baby <-> Fireball --> se destruyen ambos y -score
+    def collision_fireball(self, sprite_colliding):
         global score
-        # Baby <-> Fireball --> se destruyen ambos y -score
-        if isinstance(sprite_colliding, FireballObject):
-            self.sound_baby.play()
+        self.sound_baby.play()
 
-            sprite_colliding.kill()
-            self.kill()
-            score -= 300
-            print(score)
+        sprite_colliding.kill()
+        self.kill()
+        score -= 300
+        print(score)
 
-        # Baby <-> Player --> Se destruye el Baby y +score
-        if isinstance(sprite_colliding, DragonObject):
-            self.kill()
-            score += 500
-            print(score)
+    # Baby <-> Player --> Se destruye el Baby y +score
+    def collision_player(self, sprite_colliding):
+        global score
+        self.kill()
+        score += 500
+        print(score)
 
 
 class Room(RoomObject):
@@ -237,6 +250,18 @@ class Room(RoomObject):
         # Establece los FPS del juego
         self.frames_per_second = FPS
 
+        # Sólo colisionan los enemigos con las bolas de fuego y con el
+        # jugador; el resto de parejas ni siquiera se comprueban
+        self.set_collision_default(False)
+        for enemigo in ('demon', 'baby'):
+            self.set_collides(enemigo, 'fireball')
+            self.set_collides(enemigo, 'player')
+
+        # Chispas al destruir un demonio
+        self.sparks = self.add_emitter(ParticleEmitter(
+            FIREBALL_IMG_PATH, lifetime=12, speed=(4.0, 10.0),
+            gravity=1.0, color_key=COLOR_KEY_FIREBALL, capacity=256))
+
 
 class BgMusic(SoundObject):
     def __init__(self, music_file_name):
@@ -13,6 +13,13 @@ BG_MUSIC        = 'sound/Music.mp3'
 
 FPS = 30
 
+# Recursos que se cargan en paralelo al arrancar: sólo los que usa el
+# juego
+MANIFEST = AssetManifest(
+    images=[SPR_MOON],
+    sounds=[SND_EXPLOSION],
+    music=[BG_MUSIC])
+
 class SndExplosion(SoundObject):
     def __init__(self):
         super().__init__(SND_EXPLOSION, is_music=False)
@@ -26,6 +33,9 @@ class SndMusic(SoundObject):
         super().__init__(BG_MUSIC, is_music=True)
 
 class ObjectMoon(GameObject):
+    # La luna no se mueve: se dibuja una sola vez dentro del fondo
+    static = True
+
     def __init__(self):
         super().__init__(SPR_MOON)
 
@@ -36,6 +46,8 @@ class RoomMain(RoomObject):
 
 
 class GameGalacticMail(Game):
+    manifest = MANIFEST
+
     def __init__(self):
         super().__init__()
 
@@ -1 +1,4 @@
 __author__ = 'andriu'
+
+# Debe ser el primer import: empieza a contar el tiempo de arranque
+from pyhandru import startup
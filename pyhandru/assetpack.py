@@ -0,0 +1,260 @@
+"""
+Paquetes de imágenes pre-decodificadas ('asset packs').
+
+Un paquete contiene los píxeles en crudo de todas las imágenes de un juego
+junto con sus metadatos (tamaño, formato de píxel y color_key). Al cargarlo
+se proyecta en memoria con mmap y las superficies se construyen
+directamente sobre los bytes proyectados, sin decodificar ni copiar.
+
+Para generar el paquete de un juego:
+
+    python -m pyhandru.assetpack games/evil_clutches
+
+Un juego lo usa si lo indica en Game.asset_pack:
+
+    class MiJuego(Game):
+        asset_pack = assetpack.DEFAULT_PACK_NAME
+
+o montándolo a mano antes de crear los objetos:
+
+    assetpack.mount('assets.pack')
+
+El paquete no se regenera solo: hay que volver a generarlo al cambiar las
+imágenes del juego.
+
+Formato del fichero:
+
+    MAGIC (8 bytes) | versión (uint32) | longitud cabecera (uint32) |
+    cabecera JSON (utf-8) | datos de píxel, alineados a DATA_ALIGN bytes
+"""
+
+__author__ = 'andriu'
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+
+import pygame
+from pygame.locals import SRCALPHA
+
+from pyhandru.images import image_cache
+
+MAGIC = b'PYMKPACK'
+VERSION = 1
+DATA_ALIGN = 16
+DEFAULT_PACK_NAME = 'assets.pack'
+IMAGE_EXTENSIONS = ('.bmp', '.gif', '.png', '.jpg', '.jpeg', '.tga')
+
+_PREAMBULO = struct.Struct('<8sII')
+
+# Ruta absoluta -> AssetPack montado en image_cache (ver 'mount')
+_montados = {}
+
+
+def normalize_name(path):
+    """
+    Normaliza el nombre de un recurso para buscarlo en un paquete. Los
+    nombres son rutas relativas al directorio del juego con '/' como
+    separador, p.ej. 'images/Demon.gif'.
+
+    :param path: Ruta del recurso
+    :return: Nombre normalizado
+    """
+    return os.path.normpath(path).replace(os.sep, '/')
+
+
+def _alinea(offset):
+    return (offset + DATA_ALIGN - 1) // DATA_ALIGN * DATA_ALIGN
+
+
+def bake(game_dir, output=None, subdirs=('images',)):
+    """
+    Genera el paquete de imágenes de un juego.
+
+    :param game_dir: Directorio del juego
+    :param output: Ruta del paquete, por defecto 'assets.pack' dentro del
+    directorio del juego
+    :param subdirs: Subdirectorios del juego donde buscar imágenes
+    :return: Ruta del paquete generado
+    """
+    if output is None:
+        output = os.path.join(game_dir, DEFAULT_PACK_NAME)
+
+    entradas = {}
+    bloques = []
+    offset = 0
+    for subdir in subdirs:
+        directorio = os.path.join(game_dir, subdir)
+        if not os.path.isdir(directorio):
+            continue
+        for nombre in sorted(os.listdir(directorio)):
+            if not nombre.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            superficie = pygame.image.load(os.path.join(directorio, nombre))
+            formato = 'RGBA' if superficie.get_flags() & SRCALPHA else 'RGB'
+            pixels = pygame.image.tobytes(superficie, formato)
+            color_key = superficie.get_colorkey()
+
+            offset = _alinea(offset)
+            entradas[normalize_name(os.path.join(subdir, nombre))] = {
+                'offset': offset,
+                'length': len(pixels),
+                'size': list(superficie.get_size()),
+                'format': formato,
+                'colorkey': list(color_key[:3]) if color_key else None,
+            }
+            bloques.append((offset, pixels))
+            offset += len(pixels)
+
+    cabecera = json.dumps({'entries': entradas}, sort_keys=True).encode('utf-8')
+    inicio_datos = _alinea(_PREAMBULO.size + len(cabecera))
+
+    with open(output, 'wb') as fichero:
+        fichero.write(_PREAMBULO.pack(MAGIC, VERSION, len(cabecera)))
+        fichero.write(cabecera)
+        for offset_bloque, pixels in bloques:
+            fichero.seek(inicio_datos + offset_bloque)
+            fichero.write(pixels)
+    return output
+
+
+class AssetPack(object):
+    """
+    Paquete de imágenes proyectado en memoria.
+
+    Las superficies devueltas comparten memoria con la proyección (que es
+    copy-on-write), así que el paquete debe seguir abierto mientras se
+    usen.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Ruta del fichero de paquete
+        """
+        self.path = path
+        self._fichero = open(path, 'rb')
+        self._mmap = mmap.mmap(self._fichero.fileno(), 0,
+                               access=mmap.ACCESS_COPY)
+
+        magic, version, longitud = _PREAMBULO.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("'%s' no es un paquete de imágenes" % path)
+        if version != VERSION:
+            self.close()
+            raise ValueError("Versión de paquete no soportada: %d" % version)
+
+        cabecera = self._mmap[_PREAMBULO.size:_PREAMBULO.size + longitud]
+        self.entries = json.loads(cabecera.decode('utf-8'))['entries']
+        self._inicio_datos = _alinea(_PREAMBULO.size + longitud)
+        self._vista = memoryview(self._mmap)
+
+    def __contains__(self, path):
+        return normalize_name(path) in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def surface(self, path):
+        """
+        Construye la superficie de una imagen del paquete directamente
+        sobre los bytes proyectados.
+
+        :param path: Ruta de la imagen, tal y como la usa el juego
+        :return: pygame.Surface
+        """
+        entrada = self.entries[normalize_name(path)]
+        inicio = self._inicio_datos + entrada['offset']
+        pixels = self._vista[inicio:inicio + entrada['length']]
+        superficie = pygame.image.frombuffer(
+            pixels, tuple(entrada['size']), entrada['format'])
+        if entrada['colorkey'] is not None:
+            superficie.set_colorkey(entrada['colorkey'])
+        return superficie
+
+    @property
+    def closed(self):
+        return self._mmap.closed
+
+    def close(self):
+        """
+        Cierra el paquete. Si aún hay superficies que lo usan lanza
+        BufferError y el paquete sigue abierto y utilizable.
+        """
+        if self._mmap.closed:
+            return
+        vista = getattr(self, '_vista', None)
+        if vista is not None:
+            vista.release()
+        try:
+            # Falla mientras quede algún trozo de la vista exportado
+            self._mmap.close()
+        except BufferError:
+            if vista is not None:
+                self._vista = memoryview(self._mmap)
+            raise BufferError("'%s' tiene superficies en uso" % self.path)
+        self._vista = None
+        self._fichero.close()
+
+
+def mount(path):
+    """
+    Abre un paquete y lo monta en la caché de imágenes. Un mismo fichero
+    sólo se abre y se monta una vez por proceso.
+
+    :param path: Ruta del paquete
+    :return: AssetPack montado
+    """
+    clave = os.path.abspath(path)
+    paquete = _montados.get(clave)
+    if paquete is None:
+        paquete = AssetPack(path)
+        image_cache.mount(paquete)
+        _montados[clave] = paquete
+    return paquete
+
+
+def unmount(path):
+    """
+    Desmonta y cierra un paquete montado con 'mount'. Las imágenes que
+    procedían de él se invalidan en la caché. Si algún objeto usa aún una
+    de sus superficies lanza BufferError y el paquete sigue montado.
+
+    :param path: Ruta del paquete
+    """
+    clave = os.path.abspath(path)
+    paquete = _montados.pop(clave, None)
+    if paquete is None:
+        return
+    image_cache.unmount(paquete)
+    try:
+        paquete.close()
+    except BufferError:
+        image_cache.mount(paquete)
+        _montados[clave] = paquete
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m pyhandru.assetpack',
+        description='Genera el paquete de imágenes de un juego')
+    parser.add_argument('game_dir', help='Directorio del juego')
+    parser.add_argument('-o', '--output',
+                        help='Fichero de salida (por defecto %s)'
+                             % DEFAULT_PACK_NAME)
+    parser.add_argument('-s', '--subdir', action='append',
+                        help='Subdirectorio con imágenes (por defecto images)')
+    args = parser.parse_args(argv)
+
+    salida = bake(args.game_dir, args.output,
+                  tuple(args.subdir) if args.subdir else ('images',))
+    print('%s: %d bytes' % (salida, os.path.getsize(salida)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Cámara para habitaciones más grandes que la pantalla.
+
+La cámara es un rectángulo del tamaño de la pantalla ('view') que se
+mueve dentro de la habitación ('world'). La habitación sólo dibuja la
+parte visible del fondo y los objetos que se solapan con la vista,
+obtenidos de la fase amplia de colisiones, así que el coste de dibujar
+depende de lo que hay en pantalla y no del total de objetos.
+
+    room = Room(IMG_FONDO, (640, 480), world_size=(4000, 3000))
+    room.camera.follow(jugador, deadzone=(160, 120))
+
+Las coordenadas de los objetos son siempre de la habitación; para
+convertir las del ratón se usa 'to_world'.
+"""
+
+__author__ = 'andriu'
+
+import pygame
+
+
+class Camera(object):
+    """
+    Vista de la habitación que se muestra en pantalla.
+    """
+
+    def __init__(self, size, world_size):
+        """
+        :param size: Ancho y alto de la vista (la pantalla)
+        :param world_size: Ancho y alto de la habitación
+        """
+        self.view = pygame.Rect((0, 0), size)
+        self.world = pygame.Rect((0, 0), world_size)
+        self.target = None
+        self.deadzone = None
+
+    def follow(self, target, deadzone=None):
+        """
+        Hace que la cámara siga a un objeto.
+
+        :param target: GameObject a seguir, None para dejar de seguir
+        :param deadzone: Ancho y alto de la zona central de la vista en la
+        que el objeto puede moverse sin que se mueva la cámara. None para
+        mantenerlo siempre centrado
+        """
+        self.target = target
+        self.deadzone = deadzone
+        if target is not None:
+            self.look_at(target.rect.center)
+
+    def look_at(self, pos_xy):
+        """
+        Centra la vista en un punto, sin salirse de la habitación.
+
+        :param pos_xy: Tupla (x, y) en coordenadas de la habitación
+        """
+        self.view.center = pos_xy
+        self.view.clamp_ip(self.world)
+
+    def update(self):
+        """
+        Mueve la vista para seguir al objeto. Se llama al dibujar cada
+        fotograma.
+
+        :return: pygame.Rect de la vista en coordenadas de la habitación
+        """
+        objetivo = self.target
+        if objetivo is None:
+            return self.view
+        if not objetivo.alive():
+            # El objeto ha salido de la habitación: la cámara se queda
+            self.target = None
+            return self.view
+
+        vista = self.view
+        if self.deadzone is None:
+            vista.center = objetivo.rect.center
+        else:
+            zona = pygame.Rect((0, 0), self.deadzone)
+            zona.center = vista.center
+            x, y = objetivo.rect.center
+            if x < zona.left:
+                vista.x -= zona.left - x
+            elif x > zona.right:
+                vista.x += x - zona.right
+            if y < zona.top:
+                vista.y -= zona.top - y
+            elif y > zona.bottom:
+                vista.y += y - zona.bottom
+        vista.clamp_ip(self.world)
+        return vista
+
+    @property
+    def offset(self):
+        """
+        Desplazamiento a sumar a las coordenadas de la habitación para
+        obtener las de la pantalla
+        """
+        return -self.view.x, -self.view.y
+
+    def to_screen(self, pos_xy):
+        """
+        :param pos_xy: Punto en coordenadas de la habitación
+        :return: Punto en coordenadas de la pantalla
+        """
+        return pos_xy[0] - self.view.x, pos_xy[1] - self.view.y
+
+    def to_world(self, pos_xy):
+        """
+        :param pos_xy: Punto en coordenadas de la pantalla (p.ej. el ratón)
+        :return: Punto en coordenadas de la habitación
+        """
+        return pos_xy[0] + self.view.x, pos_xy[1] + self.view.y
@@ -0,0 +1,317 @@
+"""
+Fase amplia ('broad phase') de detección de colisiones.
+
+La habitación delega en un objeto 'broad phase' la tarea de proponer las
+parejas de objetos candidatas a colisionar. Sólo sobre esas parejas se
+realiza después la comprobación exacta con 'bound_rect.colliderect'.
+
+Cada objeto pertenece a un grupo de colisión (GameObject.collision_group)
+y una CollisionMatrix indica qué grupos pueden colisionar entre sí. La
+fase amplia agrupa los objetos por grupo y nunca genera parejas de grupos
+que la matriz descarta.
+
+Cualquier clase que implemente 'add', 'remove', 'move' y 'pairs' puede
+usarse como 'broad phase' de una habitación.
+"""
+
+__author__ = 'andriu'
+
+
+class CollisionMatrix(object):
+    """
+    Matriz simétrica que indica qué grupos de colisión colisionan entre sí.
+    Las parejas de grupos no declaradas toman el valor 'default'.
+    """
+
+    def __init__(self, default=True, pairs=()):
+        """
+        :param default: Si colisionan las parejas de grupos no declaradas
+        :param pairs: Parejas de grupos (a, b) que colisionan
+        """
+        self.default = default
+        self._parejas = {}
+        for grupo_a, grupo_b in pairs:
+            self.set(grupo_a, grupo_b, True)
+
+    def set(self, grupo_a, grupo_b, collides=True):
+        """
+        Declara si dos grupos colisionan.
+
+        :param grupo_a: Grupo de colisión
+        :param grupo_b: Grupo de colisión (puede ser el mismo que grupo_a)
+        :param collides: True si colisionan
+        """
+        self._parejas[(grupo_a, grupo_b)] = collides
+        self._parejas[(grupo_b, grupo_a)] = collides
+
+    def collides(self, grupo_a, grupo_b):
+        """
+        :return: True si los objetos de los dos grupos pueden colisionar
+        """
+        return self._parejas.get((grupo_a, grupo_b), self.default)
+
+    def allowed(self, grupos):
+        """
+        Calcula las parejas de grupos que colisionan entre los indicados.
+
+        :param grupos: Lista de grupos
+        :return: Lista de tuplas (grupo_a, grupo_b), incluidas parejas de un
+        grupo consigo mismo
+        """
+        return [(grupos[i], grupos[j])
+                for i in range(len(grupos))
+                for j in range(i, len(grupos))
+                if self.collides(grupos[i], grupos[j])]
+
+
+def _group_of(objeto):
+    return getattr(objeto, 'collision_group', None)
+
+
+def _pairs_between(por_grupo, matrix, vistas, parejas):
+    """
+    Añade a 'parejas' las parejas de objetos de los grupos de 'por_grupo'
+    que la matriz permite. 'vistas' evita repetir parejas (puede ser None
+    si no hay riesgo de repetición).
+    """
+    grupos = list(por_grupo)
+    if matrix is None:
+        combinaciones = [(grupos[i], grupos[j])
+                         for i in range(len(grupos))
+                         for j in range(i, len(grupos))]
+    else:
+        combinaciones = matrix.allowed(grupos)
+
+    for grupo_a, grupo_b in combinaciones:
+        objetos_a = list(por_grupo[grupo_a])
+        if grupo_a == grupo_b:
+            candidatas = ((objetos_a[i], objetos_a[j])
+                          for i in range(len(objetos_a))
+                          for j in range(i + 1, len(objetos_a)))
+        else:
+            objetos_b = list(por_grupo[grupo_b])
+            candidatas = ((objeto_a, objeto_b)
+                          for objeto_a in objetos_a
+                          for objeto_b in objetos_b)
+        if vistas is None:
+            parejas.extend(candidatas)
+            continue
+        for objeto_a, objeto_b in candidatas:
+            id_a, id_b = id(objeto_a), id(objeto_b)
+            clave = (id_a, id_b) if id_a < id_b else (id_b, id_a)
+            if clave not in vistas:
+                vistas.add(clave)
+                parejas.append((objeto_a, objeto_b))
+
+
+class BroadPhase(object):
+    """
+    Fase amplia trivial: propone todas las parejas posibles de grupos que
+    colisionan, cada una una única vez. Sirve como referencia y para
+    habitaciones con muy pocos objetos.
+    """
+
+    def __init__(self, matrix=None):
+        """
+        :param matrix: CollisionMatrix, None para que todos los grupos
+        colisionen
+        """
+        self.matrix = matrix
+        # objeto -> grupo
+        self._objetos = {}
+
+    def add(self, objeto):
+        """
+        Registra un objeto en la fase amplia.
+
+        :param objeto: GameObject a registrar
+        """
+        self._objetos[objeto] = _group_of(objeto)
+
+    def remove(self, objeto):
+        """
+        Elimina un objeto de la fase amplia. No hace nada si el objeto
+        no estaba registrado.
+
+        :param objeto: GameObject a eliminar
+        """
+        self._objetos.pop(objeto, None)
+
+    def move(self, objeto):
+        """
+        Notifica que el 'bound_rect' del objeto ha cambiado.
+
+        :param objeto: GameObject que se ha movido
+        """
+        pass
+
+    def clear(self):
+        """
+        Elimina todos los objetos registrados.
+        """
+        self._objetos.clear()
+
+    def pairs(self):
+        """
+        Genera las parejas candidatas a colisionar. Cada pareja se genera
+        una sola vez.
+
+        :return: Lista de tuplas (objeto_a, objeto_b)
+        """
+        por_grupo = {}
+        for objeto, grupo in self._objetos.items():
+            por_grupo.setdefault(grupo, {})[objeto] = None
+        parejas = []
+        _pairs_between(por_grupo, self.matrix, None, parejas)
+        return parejas
+
+    def query(self, rect):
+        """
+        Devuelve los objetos candidatos a solaparse con un rectángulo.
+
+        :param rect: pygame.Rect a consultar
+        :return: Lista de objetos candidatos
+        """
+        return list(self._objetos)
+
+    def __len__(self):
+        return len(self._objetos)
+
+
+class SpatialHash(BroadPhase):
+    """
+    Fase amplia basada en una rejilla uniforme (spatial hash). Cada objeto
+    se registra en las celdas que ocupa su 'bound_rect' y sólo se proponen
+    parejas de objetos que comparten al menos una celda.
+
+    La rejilla se actualiza de forma incremental: cuando un objeto se
+    mueve sólo se recalculan sus celdas, y si no cambia de celda no se
+    toca la tabla.
+    """
+
+    def __init__(self, cell_size=64, matrix=None):
+        """
+        :param cell_size: Tamaño en pixels del lado de cada celda. Conviene
+        que sea similar al tamaño típico de los sprites de la habitación.
+        :type cell_size: int
+
+        :param matrix: CollisionMatrix, None para que todos los grupos
+        colisionen
+        """
+        BroadPhase.__init__(self, matrix)
+        assert cell_size > 0, "El tamaño de celda debe ser positivo"
+        self.cell_size = cell_size
+
+        # objeto -> (rango de celdas, grupo)
+        self._objetos = {}
+        # celda (cx, cy) -> {grupo: {objeto: None}}
+        self._celdas = {}
+
+    def _celdas_de(self, rect):
+        """
+        Calcula el rango de celdas que ocupa un rectángulo.
+
+        :return: Tupla (cx0, cy0, cx1, cy1), ambos extremos incluidos
+        """
+        size = self.cell_size
+        # Un rect vacío ocupa igualmente la celda de su esquina
+        right = max(rect.left, rect.right - 1)
+        bottom = max(rect.top, rect.bottom - 1)
+        return (rect.left // size, rect.top // size,
+                right // size, bottom // size)
+
+    def _inserta(self, objeto, rango, grupo):
+        cx0, cy0, cx1, cy1 = rango
+        celdas = self._celdas
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                celda = celdas.get((cx, cy))
+                if celda is None:
+                    celda = celdas[(cx, cy)] = {}
+                del_grupo = celda.get(grupo)
+                if del_grupo is None:
+                    del_grupo = celda[grupo] = {}
+                del_grupo[objeto] = None
+
+    def _extrae(self, objeto, rango, grupo):
+        cx0, cy0, cx1, cy1 = rango
+        celdas = self._celdas
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                celda = celdas.get((cx, cy))
+                if celda is None:
+                    continue
+                del_grupo = celda.get(grupo)
+                if del_grupo is not None:
+                    del_grupo.pop(objeto, None)
+                    if not del_grupo:
+                        del celda[grupo]
+                        if not celda:
+                            del celdas[(cx, cy)]
+
+    def add(self, objeto):
+        if objeto in self._objetos:
+            self.move(objeto)
+            return
+        rango = self._celdas_de(objeto.bound_rect)
+        grupo = _group_of(objeto)
+        self._objetos[objeto] = (rango, grupo)
+        self._inserta(objeto, rango, grupo)
+
+    def remove(self, objeto):
+        registro = self._objetos.pop(objeto, None)
+        if registro is not None:
+            self._extrae(objeto, registro[0], registro[1])
+
+    def move(self, objeto):
+        registro = self._objetos.get(objeto)
+        if registro is None:
+            return
+        rango_anterior, grupo = registro
+        rango = self._celdas_de(objeto.bound_rect)
+        if rango == rango_anterior:
+            # Sigue en las mismas celdas, no hay nada que actualizar
+            return
+        self._extrae(objeto, rango_anterior, grupo)
+        self._inserta(objeto, rango, grupo)
+        self._objetos[objeto] = (rango, grupo)
+
+    def clear(self):
+        BroadPhase.clear(self)
+        self._celdas.clear()
+
+    def pairs(self):
+        # Una pareja puede compartir varias celdas: se usa 'vistas' para
+        # generarla una sola vez.
+        vistas = set()
+        parejas = []
+        matrix = self.matrix
+        for celda in self._celdas.values():
+            if len(celda) == 1:
+                # Un único grupo: sólo hay parejas si colisiona consigo
+                # mismo y hay al menos dos objetos
+                (grupo, objetos), = celda.items()
+                if len(objetos) < 2 or (matrix is not None and
+                                        not matrix.collides(grupo, grupo)):
+                    continue
+            _pairs_between(celda, matrix, vistas, parejas)
+        return parejas
+
+    def query(self, rect):
+        """
+        Devuelve los objetos registrados cuyas celdas se solapan con las
+        del rectángulo indicado (candidatos, sin comprobación exacta).
+
+        :param rect: pygame.Rect a consultar
+        :return: Lista de objetos candidatos
+        """
+        cx0, cy0, cx1, cy1 = self._celdas_de(rect)
+        encontrados = {}
+        celdas = self._celdas
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                celda = celdas.get((cx, cy))
+                if celda:
+                    for objetos in celda.values():
+                        encontrados.update(objetos)
+        return list(encontrados)
@@ -0,0 +1,120 @@
+"""
+Enrutado de eventos por suscripción.
+
+En lugar de pasar cada evento de pygame a todos los objetos de la
+habitación, los objetos se suscriben a tipos de evento concretos (o a
+teclas concretas de un tipo de evento) y sólo reciben esos. El coste de
+despachar un evento depende del número de suscriptores, no del número de
+objetos.
+"""
+
+__author__ = 'andriu'
+
+# Tipo de evento comodín: el suscriptor recibe todos los eventos
+ALL_EVENTS = None
+
+
+class EventRouter(object):
+
+    def __init__(self):
+        # tipo de evento -> {objeto: callback}
+        self._por_tipo = {}
+        # (tipo de evento, tecla) -> {objeto: callback}
+        self._por_tecla = {}
+        # objeto -> set de claves a las que está suscrito
+        self._suscripciones = {}
+
+    def subscribe(self, objeto, event_type=ALL_EVENTS, key=None,
+                  callback=None):
+        """
+        Suscribe un objeto a un tipo de evento, o a una tecla concreta de
+        un tipo de evento (KEYDOWN / KEYUP).
+
+        :param objeto: Objeto suscriptor
+        :param event_type: Tipo de evento de pygame, o ALL_EVENTS para
+        recibir todos
+        :param key: Tecla (K_xxx) para filtrar eventos de teclado, o None
+        :param callback: Función a la que se pasa el evento. Por defecto
+        'objeto.procesa_evento'
+        """
+        if callback is None:
+            callback = objeto.procesa_evento
+        if key is None:
+            clave = event_type
+            tabla = self._por_tipo
+        else:
+            clave = (event_type, key)
+            tabla = self._por_tecla
+        tabla.setdefault(clave, {})[objeto] = callback
+        self._suscripciones.setdefault(objeto, set()).add((key is None, clave))
+
+    def unsubscribe(self, objeto, event_type=ALL_EVENTS, key=None):
+        """
+        Cancela una suscripción concreta de un objeto.
+        """
+        if key is None:
+            clave, tabla = event_type, self._por_tipo
+        else:
+            clave, tabla = (event_type, key), self._por_tecla
+        self._quita(objeto, tabla, clave)
+        suscripciones = self._suscripciones.get(objeto)
+        if suscripciones is not None:
+            suscripciones.discard((key is None, clave))
+            if not suscripciones:
+                del self._suscripciones[objeto]
+
+    def remove(self, objeto):
+        """
+        Cancela todas las suscripciones de un objeto.
+        """
+        for por_tipo, clave in self._suscripciones.pop(objeto, ()):
+            tabla = self._por_tipo if por_tipo else self._por_tecla
+            self._quita(objeto, tabla, clave)
+
+    @staticmethod
+    def _quita(objeto, tabla, clave):
+        suscriptores = tabla.get(clave)
+        if suscriptores is not None:
+            suscriptores.pop(objeto, None)
+            if not suscriptores:
+                del tabla[clave]
+
+    def is_subscribed(self, objeto):
+        return objeto in self._suscripciones
+
+    def listeners(self, evento):
+        """
+        Devuelve los callbacks que deben recibir un evento. Un objeto
+        suscrito por varias vías sólo recibe el evento una vez.
+
+        :param evento: pygame.event.Event
+        :return: Lista de callbacks
+        """
+        encontrados = {}
+        todos = self._por_tipo.get(ALL_EVENTS)
+        if todos:
+            encontrados.update(todos)
+        del_tipo = self._por_tipo.get(evento.type)
+        if del_tipo:
+            encontrados.update(del_tipo)
+        if self._por_tecla:
+            key = getattr(evento, 'key', None)
+            if key is not None:
+                de_tecla = self._por_tecla.get((evento.type, key))
+                if de_tecla:
+                    encontrados.update(de_tecla)
+        return list(encontrados.values())
+
+    def dispatch(self, evento):
+        """
+        Despacha un evento a sus suscriptores. Se trabaja sobre una copia,
+        así que los objetos creados o eliminados durante el despacho no
+        alteran la lista de destinatarios de este evento.
+
+        :param evento: pygame.event.Event
+        """
+        for callback in self.listeners(evento):
+            callback(evento)
+
+    def __len__(self):
+        return len(self._suscripciones)
@@ -1,16 +1,119 @@
 __author__ = 'andriu'
 
 
-import pygame, random, sys
+import itertools, operator, os, pygame, random, sys, time
 from pygame.locals import *
+from pyhandru.collision import BroadPhase, SpatialHash, CollisionMatrix
+from pyhandru.images import (ImageCache, image_cache, display_format,
+                             is_slow_blit, DEFAULT_ANGLE_STEP)
+from pyhandru.render import DirtyRectRenderer
+from pyhandru.profiler import Profiler
+from pyhandru.events import EventRouter, ALL_EVENTS
+from pyhandru.vectorized import VectorMovementEngine
+from pyhandru.pool import ObjectPool
+from pyhandru.particles import ParticleEmitter
+from pyhandru.camera import Camera
+from pyhandru.tilemap import TileMap, DEFAULT_CHUNK_TILES, EMPTY
+from pyhandru.loader import AssetManifest, AssetLoader, DEFAULT_WORKERS
+from pyhandru.rooms import RoomManager, DEFAULT_ROOM_BUDGET
+from pyhandru import startup, replay, simulation, assetpack
+from pyhandru.assetpack import AssetPack
+from pyhandru.replay import InputRecorder, InputReplay
+from pyhandru.simulation import Simulation, BatchRunner, BatchResult
+from pyhandru.sound import (SoundCache, VoiceManager, sound_cache,
+                            voice_manager, DEFAULT_MAX_INSTANCES,
+                            set_silent, is_silent)
 
 COLLISION_VISIBLE = False
+# Si es True, RoomObject.blit cuenta en 'slow_blits' los objetos cuya
+# imagen no está en el formato de pantalla o usa color_key sin RLEACCEL
+DEBUG_SLOW_BLITS = False
 DEFAULT_FPS = 60
+# FPS de una habitación sin límite de fotogramas (clock.tick(0))
+UNCAPPED_FPS = 0
+# Pasos de simulación extra que se permiten por fotograma dibujado en el
+# modo de paso fijo (ver RoomObject.set_fixed_timestep)
+DEFAULT_MAX_FRAME_SKIP = 5
+# Margen en pixels con el que se consulta la fase amplia para saber qué
+# objetos ve la cámara: la imagen de un objeto puede sobresalir de su
+# bound_rect, que es lo que registra la fase amplia
+DEFAULT_CULL_MARGIN = 64
+
+
+# Último modo de pantalla creado: (dimensiones, flags)
+_modo_pantalla = None
+
+
+def get_display(dimensions, display_flags):
+    """
+    Devuelve la superficie de pantalla con el modo indicado. Si ya existe
+    una pantalla con ese mismo modo se reutiliza en lugar de volver a
+    llamar a pygame.display.set_mode.
+
+    :param dimensions: Ancho y alto de pantalla en formato tupla
+    :param display_flags: Flags de pygame.display.set_mode
+    :return: pygame.Surface de la pantalla
+    """
+    global _modo_pantalla
+    startup.ensure_video()
+    modo = (tuple(dimensions), display_flags)
+    pantalla = pygame.display.get_surface()
+    if pantalla is None or modo != _modo_pantalla:
+        t0 = time.perf_counter()
+        pantalla = pygame.display.set_mode (dimensions, display_flags)
+        startup.mark('set_mode', time.perf_counter() - t0)
+        _modo_pantalla = modo
+    return pantalla
+
+
+def set_headless():
+    """
+    Configura SDL para usar los drivers 'dummy' de vídeo y audio, de forma
+    que el juego pueda ejecutarse sin ventana ni tarjeta de sonido (tests,
+    benchmarks, servidores). Debe llamarse antes de inicializar pygame.
+    :return:
+    """
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
 
 class GameObject(pygame.sprite.Sprite):
 
+    # Tipos de evento a los que se suscribe el objeto al entrar en una
+    # habitación. None los detecta automáticamente según los métodos
+    # 'on_xxxx' que redefina la subclase (ver 'event_subscriptions').
+    event_types = None
+
+    # Teclas que interesan al objeto en KEYDOWN / KEYUP. None para
+    # recibir todas.
+    event_keys = None
+
+    # Número máximo de instancias eliminadas que la habitación guarda para
+    # reutilizarlas con RoomObject.spawn. 0 desactiva el reciclado.
+    pool_size = 0
+
+    # Grupo de colisión del objeto (cualquier valor hashable, normalmente
+    # una cadena). La matriz de colisiones de la habitación decide qué
+    # grupos colisionan entre sí (ver RoomObject.set_collides). Al
+    # colisionar con un objeto del grupo 'xxxx' se ejecuta el método
+    # 'collision_xxxx' si la clase lo define, y si no 'collision'.
+    collision_group = None
+
+    # Si es True, tras comprobar que los 'bound_rect' se solapan se
+    # comprueba además que se solapen los pixels opacos de las imágenes
+    # (máscaras de colisión compartidas, ver ImageCache.mask). Basta con
+    # que uno de los dos objetos lo active.
+    pixel_perfect = False
+
+    # Los objetos estáticos no se mueven: se dibujan una sola vez dentro
+    # de una copia del fondo de la habitación, no ejecutan 'step' ni
+    # 'update' y en las colisiones sólo actúan como parte pasiva (no se
+    # llama a su 'collision'). Debe fijarse antes de añadir el objeto a la
+    # habitación.
+    static = False
+
     # Constructor.
-    def __init__(self, img_path, pos_xy=(0, 0)):
+    def __init__(self, img_path, pos_xy=(0, 0), color_key=None, alpha=False):
 
         """
         Inicializa un objeto de juego, carga la imagen especificada
@@ -24,12 +127,53 @@ class GameObject(pygame.sprite.Sprite):
         
         :type pos_xy: Tupla de dos elementos
         :param pos_xy: Posición X,Y inicial del objeto
+
+        :type color_key: Tupla (R, G, B)
+        :param color_key: Color usado como transparencia (opcional)
+
+        :type alpha: bool
+        :param alpha: True si la imagen usa canal alpha
         """
         # Llama al constructor padre
         pygame.sprite.Sprite.__init__(self)
 
-        # Carga la imagen y la asigna al sprite
-        self.image = pygame.image.load(img_path)
+        # Habitación a la que pertenece el objeto. Se asigna en
+        # RoomObject.add
+        self.room = None
+
+        # Motor de movimiento vectorizado que gestiona el objeto, si la
+        # habitación lo usa, y posición del objeto en sus arrays
+        self._motor = None
+        self._indice_motor = -1
+
+        # Obtiene la imagen de la caché compartida y la asigna al sprite.
+        # La imagen es compartida con el resto de objetos que usan la misma
+        # ruta, por lo que no debe modificarse directamente.
+        self.img_path = img_path
+        self.alpha = alpha
+        self.color_key = color_key
+        self.image = image_cache.get(img_path, color_key, alpha)
+
+        # Animación (ver 'set_animation'). Con 'frame_size' a None la
+        # imagen es estática.
+        self.frame_size = None
+        self.frames = None
+        self._image_index = 0
+        # Fotogramas que avanza la animación por paso de lógica, o por
+        # segundo si 'image_fps' es True
+        self.image_speed = 0
+        self.image_fps = False
+
+        # Giros precalculados (ver 'set_rotation'): tupla (paso de
+        # ángulo, escala), o None si la imagen no se gira
+        self._giro = None
+        self._image_angle = 0
+        self._indice_giro = 0
+        self._bound_giro = True
+
+        # Orden de dibujado dentro de la habitación (ver
+        # RoomObject.visible_objects)
+        self._orden_dibujo = 0
 
         # Asigna el 'Rect' con las dimensiones de la imagen
         # Actualiza tambien la posicion del objeto al asignar los valores
@@ -60,6 +204,41 @@ class GameObject(pygame.sprite.Sprite):
         # Ejecuta el método 'on_create'
         self.on_create()
 
+    def reset(self, img_path, pos_xy=(0, 0), color_key=None, alpha=False):
+        """
+        Reinicia un objeto reciclado (ver RoomObject.spawn) como si se
+        acabase de crear, sin reservar memoria nueva: lo coloca en la
+        posición inicial, anula sus desplazamientos y vuelve a ejecutar
+        'on_create'. La forma del 'bound_rect' se conserva.
+
+        Recibe los mismos argumentos que el constructor; las subclases
+        con un constructor distinto deben redefinirlo.
+
+        :param img_path: Ruta de la imagen del sprite
+        :param pos_xy: Posición X,Y inicial del objeto
+        :param color_key: Color usado como transparencia, None para
+        conservar el actual
+        :param alpha: True si la imagen usa canal alpha
+        """
+        if img_path != self.img_path or alpha != self.alpha:
+            self.img_path = img_path
+            self.alpha = alpha
+            self._image_index = 0
+            self.prepare_image()
+            self.rect.size = self.image.get_size()
+        if color_key is not None:
+            self.set_colorkey(color_key)
+        self.image_index = 0
+
+        desfase_x = self.bound_rect.left - self.rect.left
+        desfase_y = self.bound_rect.top - self.rect.top
+        self.rect.topleft = pos_xy
+        self.bound_rect.topleft = (self.rect.x + desfase_x,
+                                   self.rect.y + desfase_y)
+        self.despl_x, self.despl_y = (0, 0)
+
+        self.on_create()
+
     @ property
     def pos_x (self):
         """
@@ -81,6 +260,12 @@ class GameObject(pygame.sprite.Sprite):
         diff = self.bound_rect.left - self.rect.left
         self.rect.x = x
         self.bound_rect.x = self.rect.x + diff
+        if self._motor is not None:
+            self._motor.x[self._indice_motor] = self.rect.x
+        if self.room is not None:
+            self.room.broad_phase.move(self)
+            if self.static:
+                self.room.invalidate_static()
 
     @ property
     def pos_y (self):
@@ -102,6 +287,44 @@ class GameObject(pygame.sprite.Sprite):
         diff = self.bound_rect.top - self.rect.top
         self.rect.y = y
         self.bound_rect.y = self.rect.y + diff
+        if self._motor is not None:
+            self._motor.y[self._indice_motor] = self.rect.y
+        if self.room is not None:
+            self.room.broad_phase.move(self)
+            if self.static:
+                self.room.invalidate_static()
+
+    @ property
+    def despl_x (self):
+        """
+        Desplazamiento en X por paso de lógica. Si el objeto está en un
+        motor de movimiento vectorizado el valor se copia también a sus
+        arrays; aquí se devuelve tal y como se asignó (int o float).
+        :return: Desplazamiento en X
+        """
+        return self._despl_x
+
+    @ despl_x.setter
+    def despl_x (self, despl):
+        self._despl_x = despl
+        if self._motor is not None:
+            self._motor.dx[self._indice_motor] = despl
+
+    @ property
+    def despl_y (self):
+        """
+        Desplazamiento en Y por paso de lógica. Si el objeto está en un
+        motor de movimiento vectorizado el valor se copia también a sus
+        arrays; aquí se devuelve tal y como se asignó (int o float).
+        :return: Desplazamiento en Y
+        """
+        return self._despl_y
+
+    @ despl_y.setter
+    def despl_y (self, despl):
+        self._despl_y = despl
+        if self._motor is not None:
+            self._motor.dy[self._indice_motor] = despl
 
     @ property
     def width (self):
@@ -123,21 +346,213 @@ class GameObject(pygame.sprite.Sprite):
         """
         Establece el color_key (color usado como transparencia)
 
+        Como la imagen es compartida, en lugar de modificarla se obtiene
+        de la caché la variante con el color_key indicado.
+
         :param color_key: Tupla en formato (R, G, B)
         """
-        self.image.set_colorkey (color_key)
+        self.color_key = color_key
+        self.prepare_image()
+        if self.static and self.room is not None:
+            self.room.invalidate_static()
+
+    def prepare_image(self):
+        """
+        Vuelve a obtener la imagen del objeto de la caché, convertida al
+        formato de la pantalla actual y con el color_key aplicado con
+        aceleración RLE. La habitación lo llama al añadir el objeto y
+        cuando cambia el modo de pantalla.
+        """
+        if self._giro is not None:
+            self.image = image_cache.rotations(
+                self.img_path, self._giro[0], self._giro[1], self.color_key,
+                self.alpha)[self._indice_giro]
+        elif self.frame_size is None:
+            self.image = image_cache.get(self.img_path, self.color_key,
+                                         self.alpha)
+        else:
+            self.frames = image_cache.frames(self.img_path, self.frame_size,
+                                             self.color_key, self.alpha)
+            self.image = self.frames[int(self._image_index)]
+
+    def set_animation (self, frame_size, image_speed=1, image_fps=False):
+        """
+        Convierte la imagen del objeto en una tira (u hoja) de animación
+        con fotogramas del tamaño indicado. Los fotogramas se recortan una
+        sola vez y se comparten con el resto de objetos que usan la misma
+        tira. El 'rect' pasa a tener el tamaño de un fotograma; el
+        'bound_rect' se ajusta si era igual al 'rect'.
+
+        :param frame_size: Tupla (ancho, alto) de cada fotograma
+        :param image_speed: Fotogramas que avanza la animación por paso
+        de lógica (puede ser fraccionario), 0 para detenerla
+        :param image_fps: True si 'image_speed' se mide en fotogramas por
+        segundo de tiempo real en lugar de por paso
+        """
+        assert self._giro is None, "Un objeto animado no puede girarse"
+        ajusta_bound = self.bound_rect == self.rect
+        self.frame_size = tuple(frame_size)
+        self.image_speed = image_speed
+        self.image_fps = image_fps
+        self._image_index = 0
+        self.prepare_image()
+        self.rect.size = self.image.get_size()
+        if ajusta_bound:
+            self.bound_rect = self.rect.copy()
+        if self._motor is not None:
+            self._motor.refresh(self)
+        if self.room is not None:
+            self.room.broad_phase.move(self)
+            self.room._on_animation_changed(self)
+
+    def set_rotation (self, angle_step=DEFAULT_ANGLE_STEP, scale=1.0,
+                      fit_bound=True):
+        """
+        Permite girar y escalar la imagen del objeto con 'image_angle'.
+        Todas las versiones giradas se calculan una sola vez por imagen y
+        se comparten entre instancias, así que cambiar el ángulo sólo
+        busca la imagen en la caché.
+
+        :param angle_step: Resolución de los giros en grados
+        :param scale: Factor de escala de la imagen
+        :param fit_bound: True para ajustar el 'bound_rect' en cada giro
+        a los pixels opacos de la imagen girada; False para conservar su
+        tamaño y centrarlo en el objeto
+        """
+        assert self.frame_size is None, "Un objeto animado no puede girarse"
+        self._giro = (angle_step, scale)
+        self._bound_giro = fit_bound
+        self.image_angle = self._image_angle
+
+    @ property
+    def image_angle (self):
+        """
+        Ángulo de la imagen en grados, en sentido antihorario (0 mira a
+        la derecha). Requiere 'set_rotation'.
+        """
+        return self._image_angle
+
+    @ image_angle.setter
+    def image_angle (self, angle):
+        assert self._giro is not None, "Falta llamar a set_rotation"
+        angle_step, scale = self._giro
+        self._image_angle = angle % 360
+        giros = image_cache.rotations(self.img_path, angle_step, scale,
+                                      self.color_key, self.alpha)
+        self._indice_giro = int(round(self._image_angle / angle_step)) % len(
+            giros)
+        self.image = giros[self._indice_giro]
+
+        # El giro no debe desplazar el objeto: se conserva el centro
+        centro = self.rect.center
+        self.rect.size = self.image.get_size()
+        self.rect.center = centro
+        if self._bound_giro:
+            envolvente = image_cache.rotation_masks(
+                self.img_path, angle_step, scale, self.color_key,
+                self.alpha)[self._indice_giro][1]
+            self.bound_rect = envolvente.move(self.rect.topleft)
+        else:
+            self.bound_rect.center = centro
+        if self._motor is not None:
+            self._motor.x[self._indice_motor] = self.rect.x
+            self._motor.y[self._indice_motor] = self.rect.y
+            self._motor.refresh(self)
+        if self.room is not None:
+            self.room.broad_phase.move(self)
+            if self.static:
+                self.room.invalidate_static()
+
+    @ property
+    def image_number (self):
+        """
+        Número de fotogramas de la animación (1 si la imagen es estática)
+        """
+        return len(self.frames) if self.frames is not None else 1
+
+    @ property
+    def image_index (self):
+        """
+        Fotograma actual de la animación. Puede ser fraccionario: se
+        muestra su parte entera.
+        """
+        return self._image_index
+
+    @ image_index.setter
+    def image_index (self, index):
+        if self.frames is None:
+            return
+        self._image_index = index % len(self.frames)
+        self.image = self.frames[int(self._image_index)]
+
+    def animate (self, step_ms):
+        """
+        Avanza la animación. La habitación lo llama en cada paso de lógica
+        para los objetos animados. Al completar un ciclo ejecuta el evento
+        'animation_end'.
 
-    def draw(self, canvas, draw_rect=False):
+        :param step_ms: Milisegundos que dura el paso, para las
+        animaciones medidas en fotogramas por segundo
+        """
+        if not self.image_speed or self.frames is None:
+            return
+        avance = self.image_speed
+        if self.image_fps:
+            avance = avance * step_ms / 1000.0
+        indice = self._image_index + avance
+        fin = indice >= len(self.frames) or indice < 0
+        self.image_index = indice
+        if fin:
+            self.animation_end()
+
+    @ property
+    def mask (self):
+        """
+        Máscara de colisión de la imagen actual del objeto (del fotograma
+        actual si está animado). Es compartida con el resto de objetos que
+        usan la misma imagen y color_key.
+        :return: pygame.mask.Mask
+        """
+        if self._giro is not None:
+            return image_cache.rotation_masks(
+                self.img_path, self._giro[0], self._giro[1], self.color_key,
+                self.alpha)[self._indice_giro][0]
+        if self.frame_size is None:
+            return image_cache.mask(self.img_path, self.color_key,
+                                    self.alpha)
+        return image_cache.mask(self.img_path, self.color_key, self.alpha,
+                                self.frame_size, int(self._image_index))
+
+    def overlaps_pixels (self, other):
+        """
+        Comprueba si los pixels opacos de las imágenes de dos objetos se
+        solapan, según su posición actual.
+
+        :param other: GameObject con el que se comprueba
+        :return: True si se solapan
+        """
+        desfase = (other.rect.x - self.rect.x, other.rect.y - self.rect.y)
+        return self.mask.overlap(other.mask, desfase) is not None
+
+    def draw(self, canvas, draw_rect=False, offset=None):
         """
         Transfiere la imagen correspondiente al sprite a la superficie
         de trabajo.
 
         :param canvas: Superficie de trabajo donde copiar la imagen
+        :param offset: Tupla (dx, dy) a sumar a la posición, p.ej. el de
+        la cámara de la habitación, o None
 
         """
-        canvas.blit(self.image, self.rect)
+        if offset is None:
+            canvas.blit(self.image, self.rect)
+            if draw_rect:
+                pygame.draw.rect(canvas, (255,255,255), self.bound_rect, 2)
+            return
+        canvas.blit(self.image, self.rect.move(offset))
         if draw_rect:
-            pygame.draw.rect(canvas, (255,255,255), self.bound_rect, 2)
+            pygame.draw.rect(canvas, (255,255,255),
+                             self.bound_rect.move(offset), 2)
 
     def procesa_evento (self, evento):
         """
@@ -153,6 +568,61 @@ class GameObject(pygame.sprite.Sprite):
         if evento.type == KEYUP:
             self.on_key_up (evento.key)
 
+    @classmethod
+    def event_subscriptions (cls):
+        """
+        Calcula las suscripciones a eventos de la clase: una lista de
+        tuplas (tipo de evento, tecla o None). Si la clase no declara
+        'event_types', se suscribe a KEYDOWN / KEYUP sólo si redefine
+        'on_key_down' / 'on_key_up', y a todos los eventos si redefine
+        'procesa_evento'.
+        :return: Lista de tuplas (tipo, tecla)
+        """
+        suscripciones = _event_subscriptions.get(cls)
+        if suscripciones is not None:
+            return suscripciones
+
+        tipos = cls.event_types
+        if tipos is None:
+            if cls.procesa_evento is not GameObject.procesa_evento:
+                tipos = (ALL_EVENTS,)
+            else:
+                tipos = []
+                if cls.on_key_down is not GameObject.on_key_down:
+                    tipos.append(KEYDOWN)
+                if cls.on_key_up is not GameObject.on_key_up:
+                    tipos.append(KEYUP)
+
+        suscripciones = []
+        for tipo in tipos:
+            if cls.event_keys is not None and tipo in (KEYDOWN, KEYUP):
+                suscripciones.extend((tipo, key) for key in cls.event_keys)
+            else:
+                suscripciones.append((tipo, None))
+        _event_subscriptions[cls] = suscripciones
+        return suscripciones
+
+    @classmethod
+    def get_collision_handler (cls, grupo):
+        """
+        Nombre del método que atiende las colisiones con objetos de un
+        grupo: 'collision_<grupo>' si la clase lo define, 'collision' en
+        otro caso. El resultado se guarda por clase y grupo.
+
+        :param grupo: Grupo de colisión del otro objeto
+        :return: Nombre del método
+        """
+        clave = (cls, grupo)
+        nombre = _collision_handlers.get(clave)
+        if nombre is None:
+            nombre = 'collision'
+            if grupo is not None:
+                especifico = 'collision_%s' % (grupo,)
+                if callable(getattr(cls, especifico, None)):
+                    nombre = especifico
+            _collision_handlers[clave] = nombre
+        return nombre
+
     def update (self, width, height):
         """
         Actualiza el estado del objeto: cambios de posición, etc.
@@ -182,6 +652,12 @@ class GameObject(pygame.sprite.Sprite):
             self.out_of_bounds()
 
     def check_for_collisions(self):
+        """
+        Comprueba la colisión de este objeto contra todos los demás objetos
+        de la habitación. La habitación ya no usa este método (delega en su
+        'broad_phase'), pero se mantiene para comprobaciones explícitas.
+        :return:
+        """
         for sprite2 in self.room.objetos_de_juego:
             if (self != sprite2):
                 self.check_for_collision (sprite2)
@@ -192,6 +668,9 @@ class GameObject(pygame.sprite.Sprite):
         # comprobar colisión entre dos sprites
 
         if self.bound_rect.colliderect(sprite2.bound_rect):
+            if ((self.pixel_perfect or sprite2.pixel_perfect)
+                    and not self.overlaps_pixels(sprite2)):
+                return
             self.collision(sprite2)
 
     def step(self):
@@ -244,6 +723,15 @@ class GameObject(pygame.sprite.Sprite):
     def collision(self, sprite_colliding):
         pass
 
+    # animation_end
+    def animation_end(self):
+        """
+        Evento que se produce cuando la animación completa un ciclo (ver
+        'set_animation').
+        :return:
+        """
+        pass
+
     # on_key_down
     def on_key_down(self, key):
         pass
@@ -253,6 +741,35 @@ class GameObject(pygame.sprite.Sprite):
         pass
 
 
+# Caché de GameObject.event_subscriptions por clase
+_event_subscriptions = {}
+
+# Caché de GameObject.get_collision_handler por (clase, grupo)
+_collision_handlers = {}
+
+
+class GameObjectGroup(pygame.sprite.Group):
+    """
+    Grupo de sprites de una habitación. Notifica a la habitación cada vez
+    que un objeto entra o sale del grupo (incluido 'kill()'), de forma que
+    la habitación pueda mantener sus estructuras auxiliares al día.
+    """
+    def __init__(self, room):
+        self.room = room
+        pygame.sprite.Group.__init__(self)
+
+    def add_internal(self, sprite, layer=None):
+        pygame.sprite.Group.add_internal(self, sprite)
+        self.room._on_object_added(sprite)
+
+    def remove_internal(self, sprite):
+        pygame.sprite.Group.remove_internal(self, sprite)
+        self.room._on_object_removed(sprite)
+
+
+_orden_dibujo = operator.attrgetter('_orden_dibujo')
+
+
 class RoomObject():
     def __init__(
             self,
@@ -261,7 +778,10 @@ class RoomObject():
             title='New Room',
             room_fps=DEFAULT_FPS,
             is_fullscreen=False,
-            hw_surface=False):
+            hw_surface=False,
+            broad_phase=None,
+            dirty_rects=False,
+            world_size=None):
         """
             Inicializa una habitación con las dimensiones y el fondo de
         pantalla indicados. Opcionalmente se puede especificar si se quiere
@@ -288,6 +808,20 @@ class RoomObject():
         , False para crearla en ventana
         :type is_fullscreen: bool
 
+        :param broad_phase: Fase amplia de detección de colisiones. Por
+        defecto se usa un SpatialHash
+        :type broad_phase: BroadPhase
+
+        :param dirty_rects: True para redibujar sólo las zonas de la pantalla
+        que cambian en cada fotograma en lugar de la pantalla completa
+        :type dirty_rects: bool
+
+        :param world_size: Ancho y alto de la habitación si es más grande
+        que la pantalla. Se crea entonces una cámara ('camera') que
+        muestra sólo una parte; por defecto la habitación mide lo mismo
+        que la pantalla y no hay cámara
+        :type world_size: Tuple
+
         :return: None
         """
         # Flags para la creación de la ventana
@@ -298,48 +832,391 @@ class RoomObject():
         self.is_fullscreen = is_fullscreen
         self.display_flags |= pygame.FULLSCREEN if self.is_fullscreen else 0
 
-        # Crea la superficie de trabajo con los flags indicados
-        self.canvas = pygame.display.set_mode (dimensions, self.display_flags)
+        # Crea la superficie de trabajo con los flags indicados, o
+        # reutiliza la pantalla si ya tiene ese modo
+        self.display_size = tuple(dimensions)
+        self.canvas = get_display (dimensions, self.display_flags)
+        self._display_format = display_format(self.canvas)
+
+        # Número de blits del último fotograma que no van por el camino
+        # rápido (sólo se calcula si DEBUG_SLOW_BLITS es True)
+        self.slow_blits = 0
 
         self.title = title
         # Establece el título
         pygame.display.set_caption (self.title)
 
+        # Matriz que indica qué grupos de colisión colisionan entre sí.
+        # Por defecto todos colisionan con todos.
+        self.collision_matrix = CollisionMatrix()
+
+        # Fase amplia de colisiones: propone las parejas candidatas de
+        # grupos que la matriz permite
+        self.broad_phase = (broad_phase if broad_phase is not None
+                            else SpatialHash())
+        if self.broad_phase.matrix is None:
+            self.broad_phase.matrix = self.collision_matrix
+
+        # Enrutador de eventos: cada objeto recibe sólo los eventos a los
+        # que está suscrito
+        self.event_router = EventRouter()
+
         # Objetos en la Room
-        self.objetos_de_juego = pygame.sprite.Group()
+        self.objetos_de_juego = GameObjectGroup(self)
+
+        # Objetos estáticos (ver GameObject.static) y fondo con los
+        # objetos estáticos ya dibujados, None si hay que recomponerlo
+        self.objetos_estaticos = GameObjectGroup(self)
+        self._fondo_estatico = None
 
+        self.img_path_background = img_path
         if img_path is not None:
         # Imagen de fondo
-            self.image_background = pygame.image.load (img_path).convert()
+            self.image_background = image_cache.get (img_path)
         else:
-            self.image_background = pygame.Surface(dimensions)
+            self.image_background = pygame.Surface(world_size or dimensions)
             self.image_background.fill((20, 50, 210))
 
         # Dimensiones de la Room
-        self.width, self.height = dimensions
+        self.width, self.height = world_size or dimensions
+
+        # Cámara (ver pyhandru.camera), None si la habitación cabe en
+        # pantalla. Con cámara sólo se dibujan los objetos visibles.
+        self.camera = (Camera(dimensions, world_size)
+                       if world_size is not None else None)
+        self.cull_margin = DEFAULT_CULL_MARGIN
+        self._contador_dibujo = itertools.count()
 
         # Reloj para el control de FPS
         self.clock = pygame.time.Clock()
 
-        # Fotogramas por segundo, por defecto 60
+        # Fotogramas por segundo, por defecto 60. UNCAPPED_FPS ejecuta la
+        # habitación sin límite.
         self.frames_per_second = room_fps
 
+        # Fotogramas ejecutados desde que se creó la habitación
+        self.frame_count = 0
+
+        # Modo de paso fijo (ver 'set_fixed_timestep'). Con
+        # 'simulation_fps' a None se ejecuta un paso de lógica por
+        # fotograma dibujado.
+        self.simulation_fps = None
+        self.max_frame_skip = DEFAULT_MAX_FRAME_SKIP
+        self.interpolate = False
+        self.tick_count = 0
+        self._acumulado_ms = 0.0
+        self._posiciones_previas = {}
+
+        # Perfilador activo (ver Profiler.attach), None si no se mide
+        self.profiler = None
+
+        # False para no dibujar nada (simulaciones sin pantalla, ver
+        # pyhandru.simulation). La lógica se ejecuta igual.
+        self.draw_enabled = True
+
+        # Grabación o reproducción de la entrada (ver pyhandru.replay),
+        # None si se juega normalmente
+        self.input_recorder = None
+        self.input_source = None
+
+        # Motor de movimiento vectorizado (ver
+        # 'enable_vectorized_movement'), None para usar GameObject.update
+        self.movement_engine = None
+
+        # Pools de objetos reciclables por clase (ver 'spawn'). Los objetos
+        # eliminados no vuelven al pool hasta el final de
+        # 'actualiza_estado', para que no se reutilicen a mitad de fotograma.
+        # Los pendientes se guardan como claves de un diccionario para que
+        # un objeto eliminado dos veces en el mismo fotograma (p.ej. tras
+        # volver a añadirlo) sólo se recicle una vez.
+        self.pools = {}
+        self._por_reciclar = {}
+
+        # Objetos animados (ver GameObject.set_animation)
+        self._animados = {}
+
+        # Emisores de partículas (ver 'add_emitter'). Se actualizan tras
+        # los objetos y se dibujan encima de ellos.
+        self.emitters = []
+
+        # Capas de tiles (ver 'add_tilemap'). Se dibujan sobre el fondo y
+        # debajo de los objetos, en el orden en que se añaden.
+        self.tilemaps = []
+
+        # Renderizador por rectángulos sucios (opcional). Con doble buffer
+        # display.update no es fiable, así que se dibuja siempre completo.
+        if dirty_rects and not self.display_flags & DOUBLEBUF:
+            self.dirty_renderer = DirtyRectRenderer(self)
+        else:
+            self.dirty_renderer = None
+
+
+    def set_display_mode (self, dimensions, display_flags=None):
+        """
+        Cambia el modo de pantalla y vuelve a preparar todas las
+        superficies de la habitación para el nuevo formato.
+
+        :param dimensions: Ancho y alto de pantalla en formato tupla
+        :param display_flags: Flags de pygame.display.set_mode, por defecto
+        los actuales de la habitación
+        :return:
+        """
+        global _modo_pantalla
+        if display_flags is not None:
+            self.display_flags = display_flags
+        self.display_size = tuple(dimensions)
+        if self.camera is not None:
+            self.camera.view.size = self.display_size
+            self.camera.view.clamp_ip(self.camera.world)
+        self.canvas = pygame.display.set_mode (dimensions, self.display_flags)
+        _modo_pantalla = (tuple(dimensions), self.display_flags)
+        self._on_display_changed()
+
+    def resume (self):
+        """
+        Reactiva una habitación que estaba en pausa (ver RoomManager.pop):
+        recupera la pantalla con su modo y fuerza un redibujado completo.
+        :return:
+        """
+        self.canvas = get_display (self.display_size, self.display_flags)
+        if display_format(self.canvas) != self._display_format:
+            self._on_display_changed()
+        elif self.dirty_renderer is not None:
+            self.dirty_renderer.invalidate()
+        # El tiempo en pausa no cuenta para el paso fijo
+        self.clock.tick()
+
+    def prepare_surfaces (self):
+        """
+        Prepara el fondo y las imágenes de todos los objetos para el formato
+        de la pantalla actual.
+        :return:
+        """
+        if self.img_path_background is not None:
+            self.image_background = image_cache.get (self.img_path_background)
+        else:
+            self.image_background = self.image_background.convert()
+        for objeto_de_juego in self.objetos_de_juego:
+            objeto_de_juego.prepare_image()
+        for objeto_de_juego in self.objetos_estaticos:
+            objeto_de_juego.prepare_image()
+        for capa in self.tilemaps:
+            capa.invalidate()
+        self.invalidate_static()
+
+    def background (self):
+        """
+        Devuelve el fondo de la habitación con los objetos estáticos ya
+        dibujados. Sólo se recompone cuando cambia alguno de ellos.
+        :return: pygame.Surface
+        """
+        if self._fondo_estatico is None:
+            if not self.objetos_estaticos:
+                self._fondo_estatico = self.image_background
+            else:
+                # El fondo de la caché es compartido: se dibuja en una copia
+                fondo = self.image_background.copy()
+                for objeto_de_juego in self.objetos_estaticos:
+                    objeto_de_juego.draw(fondo, COLLISION_VISIBLE)
+                self._fondo_estatico = fondo
+        return self._fondo_estatico
+
+    def invalidate_static (self):
+        """
+        Marca el fondo con los objetos estáticos para recomponerlo en el
+        siguiente fotograma. Se llama automáticamente al añadir, eliminar,
+        mover o cambiar el color_key de un objeto estático; debe llamarse
+        a mano si se cambia de otra forma su imagen.
+        :return:
+        """
+        self._fondo_estatico = None
+        if self.dirty_renderer is not None:
+            self.dirty_renderer.invalidate()
+
+    def _on_display_changed (self):
+        """
+        Se ejecuta al detectar un cambio en el modo de pantalla.
+        """
+        self.canvas = pygame.display.get_surface()
+        self._display_format = display_format(self.canvas)
+        image_cache.display_changed()
+        self.prepare_surfaces()
+        if self.dirty_renderer is not None:
+            self.dirty_renderer.invalidate()
 
     def blit (self):
         """
         Dibuja todos los elementos de juego
         :return:
         """
-        # Primero dibuja el fondo
-        self.canvas.blit (self.image_background, (0,0))
+        if not self.draw_enabled:
+            return
+
+        # Si alguien ha cambiado el modo de pantalla hay que volver a
+        # preparar las superficies
+        if display_format(self.canvas) != self._display_format:
+            self._on_display_changed()
+
+        if DEBUG_SLOW_BLITS:
+            self.slow_blits = sum(
+                1 for objeto_de_juego in self.objetos_de_juego
+                if is_slow_blit(objeto_de_juego.image, self.canvas))
+
+        # El renderizador por rectángulos sucios sólo redibuja y muestra
+        # las zonas que han cambiado
+        if self.dirty_renderer is not None:
+            self.dirty_renderer.render(COLLISION_VISIBLE)
+            if not self.frame_count:
+                startup.first_frame()
+            return
+
+        if self.camera is not None:
+            # Sólo la parte visible del fondo y los objetos visibles
+            vista = self.camera.update()
+            desplazamiento = self.camera.offset
+            self.canvas.blit (self.background(), (0,0), vista)
+            self.draw_tilemaps(self.canvas, vista, desplazamiento)
+            for objeto_de_juego in self.visible_objects():
+                objeto_de_juego.draw(self.canvas, COLLISION_VISIBLE,
+                                     desplazamiento)
+            self.draw_effects(self.canvas, desplazamiento)
+            pygame.display.flip()
+            if not self.frame_count:
+                startup.first_frame()
+            return
+
+        # Primero dibuja el fondo, con los objetos estáticos
+        self.canvas.blit (self.background(), (0,0))
+        self.draw_tilemaps(self.canvas)
 
         # Ahora dibuja todos los objetos de la habitación
         # llamando al metodo 'blit' de cada objeto
         for objeto_de_juego in self.objetos_de_juego:
             objeto_de_juego.draw(self.canvas, COLLISION_VISIBLE)
 
+        # Las partículas van encima de los objetos
+        self.draw_effects(self.canvas)
+
         # Y finalmente muestra la superficie de trabajo
         pygame.display.flip()
+        if not self.frame_count:
+            startup.first_frame()
+
+    def visible_objects (self):
+        """
+        Objetos de juego que hay que dibujar, en orden de dibujado. Con
+        cámara son sólo los que se solapan con la vista, obtenidos de la
+        fase amplia en lugar de recorrer todos los objetos.
+        :return: Lista de GameObject
+        """
+        if self.camera is None:
+            return self.objetos_de_juego.sprites()
+        vista = self.camera.view
+        activos = self.objetos_de_juego.spritedict
+        visibles = [objeto_de_juego for objeto_de_juego in
+                    self.broad_phase.query(vista.inflate(
+                        2 * self.cull_margin, 2 * self.cull_margin))
+                    if objeto_de_juego in activos and
+                    vista.colliderect(objeto_de_juego.rect)]
+        visibles.sort(key=_orden_dibujo)
+        return visibles
+
+    def draw_tilemaps (self, canvas, area=None, offset=None):
+        """
+        Dibuja las capas de tiles de la habitación.
+
+        :param canvas: Superficie donde dibujar
+        :param area: Zona de la habitación a dibujar, None para la de la
+        superficie
+        :param offset: Desplazamiento de la cámara o None
+        :return:
+        """
+        for capa in self.tilemaps:
+            capa.draw(canvas, area, offset)
+
+    def add_tilemap (self, capa):
+        """
+        Añade una capa de tiles a la habitación.
+
+        :param capa: TileMap
+        :return: La propia capa
+        """
+        capa.room = self
+        self.tilemaps.append(capa)
+        if self.dirty_renderer is not None:
+            self.dirty_renderer.invalidate()
+        return capa
+
+    def remove_tilemap (self, capa):
+        """
+        Retira una capa de tiles de la habitación.
+
+        :param capa: TileMap
+        :return:
+        """
+        self.tilemaps.remove(capa)
+        capa.room = None
+        if self.dirty_renderer is not None:
+            self.dirty_renderer.invalidate()
+
+    def place_free (self, rect):
+        """
+        Indica si una zona de la habitación está libre de tiles sólidos.
+        Se consulta directamente la rejilla de cada capa.
+
+        :param rect: pygame.Rect en coordenadas de la habitación, p.ej.
+        el bound_rect de un objeto desplazado a donde se quiere mover
+        :return: True si ninguna capa tiene tiles sólidos en la zona
+        """
+        for capa in self.tilemaps:
+            if capa.collides(rect):
+                return False
+        return True
+
+    def draw_effects (self, canvas, offset=None):
+        """
+        Dibuja las partículas de todos los emisores de la habitación.
+
+        :param canvas: Superficie donde dibujar
+        :param offset: Desplazamiento de la cámara o None
+        :return:
+        """
+        for emisor in self.emitters:
+            emisor.draw(canvas, offset)
+
+    def effects_bounds (self):
+        """
+        Rectángulo que envuelve las partículas de todos los emisores.
+
+        :return: pygame.Rect o None si no hay partículas
+        """
+        zona = None
+        for emisor in self.emitters:
+            limites = emisor.bounds()
+            if limites is not None:
+                zona = limites if zona is None else zona.union(limites)
+        return zona
+
+    def add_emitter (self, emisor):
+        """
+        Añade un emisor de partículas a la habitación.
+
+        :param emisor: ParticleEmitter
+        :return: El propio emisor
+        """
+        self.emitters.append(emisor)
+        return emisor
+
+    def remove_emitter (self, emisor):
+        """
+        Retira un emisor de partículas de la habitación.
+
+        :param emisor: ParticleEmitter
+        :return:
+        """
+        self.emitters.remove(emisor)
+        if self.dirty_renderer is not None:
+            self.dirty_renderer.invalidate()
 
     def add (self, objeto_de_juego):
         """
@@ -348,29 +1225,84 @@ class RoomObject():
         :return:
         """
         assert self is not None, "No hay ninguna habitación creada"
-        # Convierte la imagen del sprite al formato de pantalla para
-        # acelerar las operaciones de blit.
-        objeto_de_juego.image.convert()
-        # Añade el objeto a la lista de objetos en la habitación actual
-        self.objetos_de_juego.add (objeto_de_juego)
-        # y añade una referencia a la habitación actual al objeto de juego
+        # Prepara la imagen del sprite (formato de pantalla y color_key
+        # con RLEACCEL) para acelerar las operaciones de blit.
+        objeto_de_juego.prepare_image()
+        # Añade una referencia a la habitación actual al objeto de juego
         # para así poder referenciar la habitación desde éste.
         objeto_de_juego.room = self
+        # y añade el objeto a la lista de objetos en la habitación actual
+        if objeto_de_juego.static:
+            self.objetos_estaticos.add (objeto_de_juego)
+        else:
+            self.objetos_de_juego.add (objeto_de_juego)
 
     def procesa_eventos (self):
         """
-        Procesa los eventos del juego. Llama a cada objeto de
-        la habitación para que procese los eventos que les corresponda.
+        Procesa los eventos del juego. Cada evento se pasa sólo a los
+        objetos de la habitación suscritos a él (ver 'subscribe').
+
+        Durante una reproducción (ver pyhandru.replay) se procesan los
+        eventos grabados en lugar de los reales.
         :return:
         """
-        for evento in pygame.event.get():
+        eventos = pygame.event.get()
+        if self.input_source is not None:
+            eventos = self.input_source.events_for_frame()
+        if self.input_recorder is not None:
+            self.input_recorder.record_events(eventos)
+
+        for evento in eventos:
             if (evento.type == QUIT or
                     (evento.type == KEYDOWN and
                      evento.key == K_ESCAPE)):
                 self.on_close ()
 
-            for objeto_de_juego in self.objetos_de_juego:
-                objeto_de_juego.procesa_evento (evento)
+            self.event_router.dispatch (evento)
+
+    def subscribe (self, objeto_de_juego, event_type=ALL_EVENTS, key=None,
+                   callback=None):
+        """
+        Suscribe un objeto de la habitación a un tipo de evento o a una
+        tecla concreta, además de sus suscripciones automáticas.
+
+        :param objeto_de_juego: Objeto suscriptor
+        :param event_type: Tipo de evento de pygame o ALL_EVENTS
+        :param key: Tecla para eventos KEYDOWN / KEYUP, o None
+        :param callback: Función que recibe el evento, por defecto
+        'objeto_de_juego.procesa_evento'
+        :return:
+        """
+        self.event_router.subscribe (objeto_de_juego, event_type, key,
+                                     callback)
+
+    def unsubscribe (self, objeto_de_juego, event_type=ALL_EVENTS, key=None):
+        """
+        Cancela una suscripción de un objeto.
+        :return:
+        """
+        self.event_router.unsubscribe (objeto_de_juego, event_type, key)
+
+    def set_collides (self, grupo_a, grupo_b, collides=True):
+        """
+        Indica si los objetos de dos grupos de colisión colisionan entre
+        sí. Las parejas de grupos que no colisionan no llegan a
+        proponerse en la fase amplia.
+
+        :param grupo_a: Grupo de colisión
+        :param grupo_b: Grupo de colisión (puede ser el mismo)
+        :param collides: True si colisionan
+        :return:
+        """
+        self.collision_matrix.set (grupo_a, grupo_b, collides)
+
+    def set_collision_default (self, collides):
+        """
+        Indica si colisionan las parejas de grupos no declaradas con
+        'set_collides'. Con False sólo colisionan las parejas declaradas.
+        :return:
+        """
+        self.collision_matrix.default = collides
 
     def actualiza_estado (self):
         """
@@ -379,28 +1311,325 @@ class RoomObject():
         :return:
         """
         self.check_for_collisions()
-        self.objetos_de_juego.update(self.width, self.height)
+        if self.movement_engine is not None:
+            self.movement_engine.update(self.width, self.height)
+        else:
+            self.objetos_de_juego.update(self.width, self.height)
+        if self._animados:
+            self._anima()
+        for emisor in self.emitters:
+            emisor.update()
+        if self._por_reciclar:
+            self._recicla()
+
+    def _anima(self):
+        """
+        Avanza un paso la animación de los objetos animados.
+        """
+        if self.simulation_fps is not None:
+            paso_ms = 1000.0 / self.simulation_fps
+        else:
+            paso_ms = self.clock.get_time()
+        for objeto_de_juego in list(self._animados):
+            objeto_de_juego.animate(paso_ms)
+
+    def _on_animation_changed(self, objeto_de_juego):
+        """
+        Se ejecuta cuando un objeto de la habitación pasa a estar animado.
+        """
+        if objeto_de_juego.static:
+            # Los estáticos no se animan, pero su imagen ha cambiado
+            self.invalidate_static()
+        elif objeto_de_juego in self.objetos_de_juego:
+            self._animados[objeto_de_juego] = None
+
+    def pool_for(self, clase):
+        """
+        Devuelve el pool de una clase, creándolo si hace falta con
+        capacidad 'clase.pool_size'.
+
+        :param clase: Subclase de GameObject
+        :return: ObjectPool
+        """
+        pool = self.pools.get(clase)
+        if pool is None:
+            pool = self.pools[clase] = ObjectPool(clase, clase.pool_size)
+        return pool
+
+    def set_pool_size(self, clase, size):
+        """
+        Cambia la capacidad del pool de una clase en esta habitación.
+
+        :param clase: Subclase de GameObject
+        :param size: Número máximo de instancias libres, 0 para no reciclar
+        :return:
+        """
+        self.pool_for(clase).resize(size)
+
+    def spawn(self, clase, *args, **kwargs):
+        """
+        Crea un objeto de la clase indicada y lo añade a la habitación. Si
+        hay una instancia reciclada disponible se reutiliza llamando a su
+        método 'reset' con los mismos argumentos que recibiría el
+        constructor.
+
+        :param clase: Subclase de GameObject
+        :return: El objeto añadido
+        """
+        pool = self.pool_for(clase)
+        objeto_de_juego = pool.acquire()
+        if objeto_de_juego is None:
+            objeto_de_juego = clase(*args, **kwargs)
+            pool.created += 1
+        else:
+            objeto_de_juego.reset(*args, **kwargs)
+        self.add(objeto_de_juego)
+        return objeto_de_juego
+
+    def pool_stats(self):
+        """
+        :return: Diccionario nombre de clase -> estadísticas de su pool
+        """
+        return dict((clase.__name__, pool.stats())
+                    for clase, pool in self.pools.items())
+
+    def _recicla(self):
+        """
+        Pasa a sus pools los objetos eliminados durante el fotograma.
+        """
+        por_reciclar = self._por_reciclar
+        self._por_reciclar = {}
+        for objeto_de_juego in por_reciclar:
+            # Puede haber vuelto a añadirse a la habitación
+            if not objeto_de_juego.alive():
+                self.pool_for(type(objeto_de_juego)).release(objeto_de_juego)
+
+    def enable_vectorized_movement(self, capacity=None):
+        """
+        Mueve los objetos de la habitación con un VectorMovementEngine
+        (requiere NumPy) en lugar de llamar a 'update' en cada objeto.
+
+        :param capacity: Capacidad inicial de los arrays del motor
+        :return: El motor creado
+        """
+        if self.movement_engine is None:
+            if capacity is None:
+                capacity = max(len(self.objetos_de_juego), 1)
+            self.movement_engine = VectorMovementEngine(self, capacity)
+            for objeto_de_juego in self.objetos_de_juego:
+                self.movement_engine.add(objeto_de_juego, GameObject)
+        return self.movement_engine
+
+    def disable_vectorized_movement(self):
+        """
+        Vuelve a mover los objetos con GameObject.update.
+        :return:
+        """
+        if self.movement_engine is not None:
+            for objeto_de_juego in self.objetos_de_juego:
+                self.movement_engine.remove(objeto_de_juego)
+            self.movement_engine = None
 
     def check_for_collisions(self):
-        # Comprueba colisiones entre sprites dentro del grupo
-        for object_sprite in self.objetos_de_juego:
-            object_sprite.check_for_collisions()
+        """
+        Comprueba colisiones entre los objetos de la habitación. La fase
+        amplia propone cada pareja candidata una sola vez; si sus
+        'bound_rect' colisionan (y sus pixels, si alguno es
+        'pixel_perfect') se ejecuta en cada objeto el método que atiende el
+        grupo del otro ('collision_<grupo>' o 'collision').
+        :return:
+        """
+        activos = self.objetos_de_juego.spritedict
+        estaticos = self.objetos_estaticos.spritedict
+        for objeto_a, objeto_b in self.broad_phase.pairs():
+            # Un 'collision' anterior puede haber eliminado alguno de los
+            # objetos de la pareja. Los estáticos sólo son parte pasiva:
+            # dos estáticos no se comprueban entre sí.
+            a_activo = objeto_a in activos
+            b_activo = objeto_b in activos
+            if not (a_activo or b_activo):
+                continue
+            if not (a_activo or objeto_a in estaticos):
+                continue
+            if not (b_activo or objeto_b in estaticos):
+                continue
+            if not objeto_a.bound_rect.colliderect(objeto_b.bound_rect):
+                continue
+            # Fase estrecha por pixels, sólo si alguno la pide
+            if ((objeto_a.pixel_perfect or objeto_b.pixel_perfect)
+                    and not objeto_a.overlaps_pixels(objeto_b)):
+                continue
+            if a_activo:
+                getattr(objeto_a, objeto_a.get_collision_handler(
+                    objeto_b.collision_group))(objeto_b)
+            if b_activo:
+                getattr(objeto_b, objeto_b.get_collision_handler(
+                    objeto_a.collision_group))(objeto_a)
+
+    def _on_object_added(self, objeto_de_juego):
+        """
+        Se ejecuta cuando un objeto entra en 'objetos_de_juego' o en
+        'objetos_estaticos'.
+        """
+        self.broad_phase.add(objeto_de_juego)
+        objeto_de_juego._orden_dibujo = next(self._contador_dibujo)
+        if objeto_de_juego.static:
+            self.invalidate_static()
+        else:
+            if self.movement_engine is not None:
+                self.movement_engine.add(objeto_de_juego, GameObject)
+            if objeto_de_juego.frame_size is not None:
+                self._animados[objeto_de_juego] = None
+        for tipo, key in objeto_de_juego.event_subscriptions():
+            self.event_router.subscribe(objeto_de_juego, tipo, key)
+        if self.profiler is not None:
+            self.profiler.instrument(type(objeto_de_juego))
+
+    def _on_object_removed(self, objeto_de_juego):
+        """
+        Se ejecuta cuando un objeto sale de 'objetos_de_juego' o de
+        'objetos_estaticos', ya sea con 'remove' o con 'kill()'.
+        """
+        if objeto_de_juego.static:
+            self.invalidate_static()
+        self._animados.pop(objeto_de_juego, None)
+        self.broad_phase.remove(objeto_de_juego)
+        self.event_router.remove(objeto_de_juego)
+        if self.movement_engine is not None:
+            self.movement_engine.remove(objeto_de_juego)
+        clase = type(objeto_de_juego)
+        if clase.pool_size or clase in self.pools:
+            self._por_reciclar[objeto_de_juego] = None
+        if self.dirty_renderer is not None:
+            self.dirty_renderer.forget(objeto_de_juego)
+
+    def set_fixed_timestep(self, simulation_fps,
+                           max_frame_skip=DEFAULT_MAX_FRAME_SKIP,
+                           interpolate=False):
+        """
+        Activa el modo de paso fijo: la lógica ('step' y
+        'actualiza_estado') se ejecuta a 'simulation_fps' pasos por
+        segundo de tiempo real, independientemente de los fotogramas que
+        se dibujen ('frames_per_second'). Si dibujar va lento se ejecutan
+        varios pasos de lógica por fotograma, hasta 'max_frame_skip'
+        pasos extra; por encima de eso el juego se ralentiza.
+
+        :param simulation_fps: Pasos de lógica por segundo, o None para
+        volver al modo normal (un paso por fotograma)
+        :param max_frame_skip: Máximo de pasos extra por fotograma dibujado
+        :param interpolate: True para dibujar los objetos en una posición
+        interpolada entre los dos últimos pasos de lógica
+        :return:
+        """
+        assert simulation_fps is None or simulation_fps > 0
+        self.simulation_fps = simulation_fps
+        self.max_frame_skip = max_frame_skip
+        self.interpolate = interpolate
+        self._posiciones_previas.clear()
+        # El primer fotograma ejecuta un paso de lógica
+        self._acumulado_ms = 1000.0 / simulation_fps if simulation_fps else 0.0
+
+    def frame(self):
+        """
+        Ejecuta un único fotograma de la habitación.
+        :return:
+        """
+        if self.simulation_fps is not None:
+            self._frame_paso_fijo()
+            return
 
-    def loop(self):
-        while True:
-            # Procesa los eventos
-            self.procesa_eventos()
+        # Procesa los eventos
+        self.procesa_eventos()
 
-            # Llama al metodo step
-            self.step()
+        # Llama al metodo step
+        self.step()
+
+        # Actualiza el estado del juego
+        self.actualiza_estado()
+
+        # Muestra el contenido del juego por pantalla
+        self.blit()
+
+        self.frame_count += 1
+        self.tick_count += 1
+        self.clock.tick (self.frames_per_second)
 
-            # Actualiza el estado del juego
+    def _frame_paso_fijo(self):
+        """
+        Fotograma en modo de paso fijo: procesa los eventos, ejecuta tantos
+        pasos de lógica como correspondan al tiempo transcurrido y dibuja.
+        """
+        paso_ms = 1000.0 / self.simulation_fps
+
+        self.procesa_eventos()
+
+        pasos = 0
+        while self._acumulado_ms >= paso_ms:
+            if pasos > self.max_frame_skip:
+                # Demasiado retraso: se descarta para no entrar en una
+                # espiral en la que cada fotograma va más lento
+                self._acumulado_ms = 0.0
+                break
+            if self.interpolate:
+                self._guarda_posiciones()
+            self.step()
             self.actualiza_estado()
+            self._acumulado_ms -= paso_ms
+            self.tick_count += 1
+            pasos += 1
 
-            # Muestra el contenido del juego por pantalla
+        if self.interpolate:
+            self._blit_interpolado(self._acumulado_ms / paso_ms)
+        else:
             self.blit()
 
-            self.clock.tick (self.frames_per_second)
+        self.frame_count += 1
+        self._acumulado_ms += self.clock.tick (self.frames_per_second)
+
+    def _guarda_posiciones(self):
+        posiciones = self._posiciones_previas
+        posiciones.clear()
+        for objeto_de_juego in self.objetos_de_juego:
+            posiciones[objeto_de_juego] = objeto_de_juego.rect.topleft
+
+    def _blit_interpolado(self, alpha):
+        """
+        Dibuja cada objeto en la posición interpolada entre el paso de
+        lógica anterior y el actual. Sólo se mueve 'rect' mientras se
+        dibuja; la posición lógica no cambia.
+
+        :param alpha: Fracción de paso transcurrida, entre 0 y 1
+        """
+        posiciones = self._posiciones_previas
+        reales = []
+        for objeto_de_juego in self.objetos_de_juego:
+            anterior = posiciones.get(objeto_de_juego)
+            if anterior is None:
+                continue
+            rect = objeto_de_juego.rect
+            reales.append((rect, rect.x, rect.y))
+            # Posición dibujada entre el paso anterior y el actual
+            rect.x = int(round(anterior[0] + (rect.x - anterior[0]) * alpha))
+            rect.y = int(round(anterior[1] + (rect.y - anterior[1]) * alpha))
+        try:
+            self.blit()
+        finally:
+            for rect, x, y in reales:
+                rect.x = x
+                rect.y = y
+
+    def loop(self, max_frames=None):
+        """
+        Bucle de la habitación. Si se indica 'max_frames' termina tras
+        ejecutar ese número de fotogramas; si no, no termina nunca.
+
+        :param max_frames: Número de fotogramas a ejecutar o None
+        :return:
+        """
+        frames = 0
+        while max_frames is None or frames < max_frames:
+            self.frame()
+            frames += 1
 
     def step(self):
         """
@@ -427,7 +1656,8 @@ class RoomObject():
 
 
 class SoundObject():
-    def __init__(self, file_name, is_music=True):
+    def __init__(self, file_name, is_music=True, priority=0,
+                 max_instances=DEFAULT_MAX_INSTANCES, volume=0.5):
         """
         SoundObject sirve tanto para música de fondo como para efectos
         sonoros. Si
@@ -441,49 +1671,176 @@ class SoundObject():
         :param file_name: Nombre completo del archivo a usar para el sonido
         :param is_music: True, crea un objeto para música de fondo, False
         para crear un objeto de efectos de sonido.
+        :param priority: Prioridad del efecto al competir por los canales
+        del mixer (ver VoiceManager)
+        :param max_instances: Máximo de reproducciones simultáneas del
+        efecto, None para no limitar
+        :param volume: Volumen del efecto, entre 0.0 y 1.0
         :return: Nada
         """
         self.is_music = is_music
         self.__objeto_sonido = None
+        self.priority = priority
+        self.max_instances = max_instances
+        self.volume = volume
+
+        # Sin sonido (ver set_silent) no se carga nada
+        self.silent = is_silent()
+        if self.silent:
+            return
 
         #pygame.mix
+        startup.ensure_mixer()
         if is_music:
-            # Load a mixer.music file
-            pygame.mixer.music.load(file_name)
+            # Load a mixer.music file (desde memoria si se precargó)
+            pygame.mixer.music.load(*sound_cache.music_source(file_name))
 
         else:
-            # Load a mixer.sound file
-            self.__objeto_sonido = pygame.mixer.Sound(file_name)
-            self.__objeto_sonido.set_volume(0.5)
+            # Obtiene el sonido decodificado de la caché compartida
+            self.__objeto_sonido = sound_cache.get(file_name)
 
     def play(self, loop=0):
+        if self.silent:
+            return None
         if self.is_music:
             pygame.mixer.music.play(loop)
         else:
             assert self.__objeto_sonido is not None
-            self.__objeto_sonido.play(loop)
+            # El gestor de voces limita las instancias simultáneas y
+            # reparte los canales por prioridad
+            return voice_manager.play(self.__objeto_sonido, loop,
+                                      self.priority, self.max_instances,
+                                      self.volume)
 
 
 class Game():
-    def __init__(self, fps=60):
+
+    # Recursos del juego (AssetManifest) que se cargan en paralelo al
+    # crear el juego, antes de crear la habitación. None para no
+    # precargar nada.
+    manifest = None
+
+    # Paquete de imágenes pre-decodificadas (ver pyhandru.assetpack) que
+    # se monta al crear el juego si el fichero existe, p.ej.
+    # assetpack.DEFAULT_PACK_NAME; la ruta es relativa al directorio
+    # actual, como las de las imágenes. El paquete no se comprueba contra
+    # las imágenes originales, así que sólo deben activarlo los juegos que
+    # lo regeneran al cambiarlas. None carga las imágenes desde disco.
+    asset_pack = None
+
+    def __init__(self, fps=60, headless=False, seed=None):
         """
         Inicializa PyGame y el mixer, random, etc.
 
+        :param fps: Fotogramas por segundo del juego
+        :param headless: True para ejecutar sin ventana ni sonido (drivers
+        'dummy' de SDL)
+        :param seed: Semilla para 'random'. None usa una semilla aleatoria,
+        que queda en 'seed' para poder repetir la partida
         """
+        # Reproducción de una partida grabada (ver pyhandru.replay): usa
+        # su semilla y se ejecuta sin ventana ni sonido. Lo mismo para una
+        # simulación (ver pyhandru.simulation), con la semilla que indique.
+        self.input_replay = replay.pending_replay()
+        self.input_recorder = None
+        self.simulation = simulation.pending_simulation()
+        if self.input_replay is not None:
+            seed = self.input_replay.seed
+            headless = True
+        elif self.simulation is not None:
+            if self.simulation.seed is not None:
+                seed = self.simulation.seed
+            headless = True
+        if seed is None:
+            seed = random.SystemRandom().randrange(2 ** 32)
+        if headless:
+            set_headless()
+
         # mixer.pre_init soluciona los problemas de lag que tenía con los
-        # efectos sonoros.
+        # efectos sonoros. Los subsistemas de pygame no se arrancan aquí
+        # sino la primera vez que se usan (ver pyhandru.startup).
         pygame.mixer.pre_init(44100, -16, 1, 512)
-        pygame.init()
-        random.seed()
+        random.seed(seed)
+        self.seed = seed
+
+        path = replay.recording_path()
+        if path:
+            self.record(path)
 
         self.game_fps = fps
         self.room = None
 
+        # Gestor de habitaciones, para juegos con varias (ver
+        # pyhandru.rooms). Mantiene 'room' apuntando a la activa.
+        self.rooms = RoomManager(self)
+
+        # Se monta antes de precargar para que las imágenes del paquete
+        # no se decodifiquen
+        if self.asset_pack is not None and os.path.isfile(self.asset_pack):
+            assetpack.mount(self.asset_pack)
+
+        # Segundos que ha durado la precarga del 'manifest'
+        self.load_time = 0.0
+        if self.manifest is not None:
+            self.load_time = self.preload(self.manifest)
+
+    def preload(self, manifest, workers=DEFAULT_WORKERS):
+        """
+        Carga en paralelo los recursos de un AssetManifest en las cachés
+        compartidas, llamando a 'on_loading' con el progreso.
+
+        :param manifest: AssetManifest con los recursos
+        :param workers: Número de hilos de carga
+        :return: Segundos que ha durado la carga
+        """
+        return AssetLoader(manifest, workers).load(self.on_loading)
+
+    def record(self, path):
+        '''
+        Graba la entrada de la partida para repetirla con
+        pyhandru.replay. La grabación se guarda al terminar 'loop'.
+        :param path: Fichero de la grabación
+        :return: InputRecorder
+        '''
+        self.input_recorder = InputRecorder(self.seed, path)
+        return self.input_recorder
+
+    def on_loading(self, progress):
+        '''
+        Evento que se produce durante la precarga de recursos cada vez
+        que se completa alguno. Puede redefinirse para dibujar una
+        pantalla de carga.
+        :param progress: Fracción cargada, entre 0 y 1
+        :return:
+        '''
+        pass
 
-    def loop(self):
+    def loop(self, max_frames=None):
         '''
         Bucle principal del juego, llama al bucle de la habitación.
+        :param max_frames: Número de fotogramas a ejecutar o None para no
+        terminar nunca
         :return:
         '''
         assert self.room is not None, "No hay ninguna habitación creada"
-        self.room.loop()
\ No newline at end of file
+        # Se vuelve a leer 'room' en cada fotograma por si se ha cambiado
+        # de habitación
+        sesion = self.input_replay or self.input_recorder
+        if self.input_replay is not None:
+            if (max_frames is None or
+                    max_frames > self.input_replay.remaining):
+                max_frames = self.input_replay.remaining
+        frames = 0
+        try:
+            while max_frames is None or frames < max_frames:
+                if sesion is not None and sesion.room is not self.room:
+                    sesion.attach(self.room)
+                self.room.frame()
+                frames += 1
+        finally:
+            # on_close sale con sys.exit: la grabación se guarda igualmente
+            if self.input_recorder is not None:
+                self.input_recorder.save()
+
+
+startup.mark('import pyhandru.game')
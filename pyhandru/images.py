@@ -0,0 +1,459 @@
+"""
+Caché de imágenes compartida por todo el proceso.
+
+Las superficies se cargan una sola vez por combinación de ruta, color_key
+y modo alpha, se convierten al formato de pantalla (con RLEACCEL cuando
+tienen color_key) y se comparten entre todas las instancias que las usan.
+Las superficies devueltas son compartidas: no deben modificarse.
+
+La caché guarda también las máscaras de colisión (pygame.mask) de cada
+combinación, calculadas la primera vez que se piden, y los fotogramas de
+las tiras de animación (ver ImageCache.frames) y de las versiones giradas
+y escaladas de cada imagen (ver ImageCache.rotations).
+"""
+
+__author__ = 'andriu'
+
+from collections import OrderedDict
+
+import pygame
+from pygame.locals import RLEACCEL, RLEACCELOK
+
+# Presupuesto de memoria por defecto para la caché de imágenes (bytes)
+DEFAULT_IMAGE_BUDGET = 64 * 1024 * 1024
+
+# Resolución por defecto de los giros precalculados (grados)
+DEFAULT_ANGLE_STEP = 5
+
+
+def surface_size(surface):
+    """
+    Calcula la memoria aproximada que ocupa una superficie.
+
+    :param surface: pygame.Surface
+    :return: Tamaño en bytes
+    """
+    return surface.get_pitch() * surface.get_height()
+
+
+def prepare_surface(surface, color_key=None, alpha=False):
+    """
+    Convierte una superficie al formato de la pantalla actual y aplica
+    el color_key con aceleración RLE. Si todavía no se ha creado la
+    pantalla la superficie no se convierte, sólo se le aplica el
+    color_key.
+
+    :param surface: Superficie original
+    :param color_key: Tupla (R, G, B) o None
+    :param alpha: True para conservar el canal alpha (convert_alpha)
+    :return: Tupla (superficie, convertida)
+    """
+    convertida = pygame.display.get_surface() is not None
+    if convertida:
+        surface = surface.convert_alpha() if alpha else surface.convert()
+    elif color_key is not None:
+        # No se modifica la superficie original, que es compartida
+        surface = surface.copy()
+    if color_key is not None:
+        surface.set_colorkey(color_key, RLEACCEL)
+    return surface, convertida
+
+
+def display_format(surface):
+    """
+    Devuelve una firma del formato de píxel de una superficie. Sirve para
+    detectar cambios de modo de pantalla.
+
+    :param surface: pygame.Surface (normalmente la pantalla)
+    :return: Tupla (tamaño, bits por pixel, máscaras)
+    """
+    return surface.get_size(), surface.get_bitsize(), surface.get_masks()
+
+
+def is_slow_blit(surface, target):
+    """
+    Indica si copiar 'surface' sobre 'target' obliga a SDL a convertir el
+    formato de píxel en cada blit, o si usa color_key sin aceleración RLE.
+
+    :param surface: Superficie origen
+    :param target: Superficie destino (normalmente la pantalla)
+    :return: True si el blit no va por el camino rápido
+    """
+    if surface.get_bytesize() != target.get_bytesize():
+        return True
+    if surface.get_masks()[:3] != target.get_masks()[:3]:
+        return True
+    flags = surface.get_flags()
+    if (surface.get_colorkey() is not None
+            and not flags & (RLEACCEL | RLEACCELOK)):
+        return True
+    return False
+
+
+class ImageCache(object):
+    """
+    Caché LRU de superficies con presupuesto de memoria.
+
+    Cuando la memoria ocupada supera 'max_bytes' se descartan las entradas
+    usadas hace más tiempo. Las instancias que ya tuvieran la superficie
+    la siguen conservando; sólo se pierde la entrada de la caché.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_IMAGE_BUDGET):
+        """
+        :param max_bytes: Presupuesto de memoria en bytes
+        :type max_bytes: int
+        """
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # (ruta, color_key, alpha) -> [superficie, convertida, bytes]
+        # (ruta, color_key, alpha, tamaño de fotograma) ->
+        #     [tupla de fotogramas, convertida, bytes]
+        # (ruta, color_key, alpha, 'rot', paso de ángulo, escala) ->
+        #     [tupla de giros, convertida, bytes]
+        self._entradas = OrderedDict()
+
+        # Superficies originales sin convertir, por ruta. Permiten volver
+        # a preparar una imagen (p.ej. al cambiar de modo de pantalla)
+        # sin leer de nuevo el disco.
+        self._originales = OrderedDict()
+
+        # Paquetes de imágenes pre-decodificadas (ver pyhandru.assetpack)
+        self._paquetes = []
+
+        # (ruta, color_key, alpha[, tamaño de fotograma, índice]) ->
+        # pygame.mask.Mask. Las máscaras no dependen del formato de
+        # pantalla y no cuentan en el presupuesto.
+        self._mascaras = {}
+
+    @staticmethod
+    def _clave(path, color_key, alpha):
+        if color_key is not None:
+            color_key = tuple(color_key)
+        return path, color_key, bool(alpha)
+
+    def mount(self, pack):
+        """
+        Monta un paquete de imágenes. Las imágenes incluidas en el paquete
+        se obtienen de él en lugar de decodificarse desde disco.
+
+        :param pack: AssetPack a montar
+        """
+        self._paquetes.append(pack)
+
+    def unmount(self, pack):
+        """
+        Desmonta un paquete de imágenes e invalida las entradas que
+        procedían de él.
+
+        :param pack: AssetPack a desmontar
+        """
+        self._paquetes.remove(pack)
+        for path in list(self._originales):
+            if path in pack:
+                self.invalidate(path)
+
+    def needs_decode(self, path):
+        """
+        :return: True si la imagen todavía no está decodificada ni se
+        puede obtener de un paquete montado
+        """
+        if path in self._originales:
+            return False
+        return not any(path in paquete for paquete in self._paquetes)
+
+    def put_original(self, path, surface):
+        """
+        Añade a la caché una imagen ya decodificada (p.ej. por
+        pyhandru.loader en otro hilo), como si se hubiese cargado de
+        disco. Si ya estaba no hace nada.
+
+        :param path: Ruta del fichero de imagen
+        :param surface: Superficie original, sin convertir
+        """
+        if path in self._originales:
+            return
+        self._originales[path] = surface
+        self.used_bytes += surface_size(surface)
+        self._ajusta_presupuesto()
+
+    def _carga(self, path):
+        original = self._originales.get(path)
+        if original is None:
+            for paquete in self._paquetes:
+                if path in paquete:
+                    original = paquete.surface(path)
+                    break
+            else:
+                original = pygame.image.load(path)
+            self._originales[path] = original
+            self.used_bytes += surface_size(original)
+        else:
+            self._originales.move_to_end(path)
+        return original
+
+    def get(self, path, color_key=None, alpha=False):
+        """
+        Obtiene la superficie preparada para la ruta, color_key y modo
+        alpha indicados, cargándola del disco sólo la primera vez.
+
+        :param path: Ruta del fichero de imagen
+        :param color_key: Tupla (R, G, B) o None
+        :param alpha: True para conservar el canal alpha
+        :return: pygame.Surface compartida
+        """
+        clave = self._clave(path, color_key, alpha)
+        entrada = self._entradas.get(clave)
+
+        if entrada is not None:
+            # Si se cargó antes de crear la pantalla, se convierte ahora
+            if entrada[1] or pygame.display.get_surface() is None:
+                self.hits += 1
+                self._entradas.move_to_end(clave)
+                return entrada[0]
+            self._descarta(clave)
+
+        self.misses += 1
+        superficie, convertida = prepare_surface(
+            self._carga(path), clave[1], alpha)
+        tamano = surface_size(superficie)
+        self._entradas[clave] = [superficie, convertida, tamano]
+        self.used_bytes += tamano
+        self._ajusta_presupuesto(clave)
+        return superficie
+
+    def frames(self, path, frame_size, color_key=None, alpha=False):
+        """
+        Obtiene los fotogramas de una tira o una hoja de animación,
+        recortados una sola vez en superficies independientes (cada una
+        convertida y con su color_key RLE) y compartidos por todas las
+        instancias. Los fotogramas se leen por filas, de izquierda a
+        derecha y de arriba a abajo.
+
+        :param path: Ruta del fichero de imagen
+        :param frame_size: Tupla (ancho, alto) de cada fotograma
+        :param color_key: Tupla (R, G, B) o None
+        :param alpha: True para conservar el canal alpha
+        :return: Tupla de pygame.Surface compartidas
+        """
+        frame_size = tuple(frame_size)
+        clave = self._clave(path, color_key, alpha) + (frame_size,)
+        entrada = self._entradas.get(clave)
+
+        if entrada is not None:
+            if entrada[1] or pygame.display.get_surface() is None:
+                self.hits += 1
+                self._entradas.move_to_end(clave)
+                return entrada[0]
+            self._descarta(clave)
+
+        self.misses += 1
+        hoja = self._carga(path)
+        ancho, alto = frame_size
+        assert ancho > 0 and alto > 0, "Tamaño de fotograma no válido"
+        columnas = hoja.get_width() // ancho
+        filas = hoja.get_height() // alto
+        fotogramas = []
+        convertida = True
+        for fila in range(filas):
+            for columna in range(columnas):
+                recorte = hoja.subsurface(
+                    (columna * ancho, fila * alto, ancho, alto)).copy()
+                fotograma, convertida = prepare_surface(
+                    recorte, clave[1], alpha)
+                fotogramas.append(fotograma)
+        fotogramas = tuple(fotogramas)
+        assert fotogramas, "La imagen es menor que un fotograma"
+        tamano = sum(surface_size(fotograma) for fotograma in fotogramas)
+        self._entradas[clave] = [fotogramas, convertida, tamano]
+        self.used_bytes += tamano
+        self._ajusta_presupuesto(clave)
+        return fotogramas
+
+    def rotations(self, path, angle_step=DEFAULT_ANGLE_STEP, scale=1.0,
+                  color_key=None, alpha=False):
+        """
+        Obtiene las versiones giradas y escaladas de una imagen, una por
+        cada 'angle_step' grados (el índice i corresponde a i * angle_step
+        grados en sentido antihorario). Se calculan todas de una vez la
+        primera vez que se piden y se comparten entre las instancias.
+
+        :param path: Ruta del fichero de imagen
+        :param angle_step: Resolución de los giros en grados
+        :param scale: Factor de escala
+        :param color_key: Tupla (R, G, B) o None
+        :param alpha: True para conservar el canal alpha
+        :return: Tupla de pygame.Surface compartidas
+        """
+        clave = (self._clave(path, color_key, alpha) +
+                 ('rot', angle_step, scale))
+        entrada = self._entradas.get(clave)
+
+        if entrada is not None:
+            if entrada[1] or pygame.display.get_surface() is None:
+                self.hits += 1
+                self._entradas.move_to_end(clave)
+                return entrada[0]
+            self._descarta(clave)
+
+        self.misses += 1
+        base = self.get(path, color_key, alpha)
+        if alpha:
+            escalar = pygame.transform.smoothscale
+        else:
+            escalar = pygame.transform.scale
+        if scale != 1:
+            ancho, alto = base.get_size()
+            base = escalar(base, (max(1, int(round(ancho * scale))),
+                                  max(1, int(round(alto * scale)))))
+        assert angle_step > 0, "El paso de ángulo debe ser positivo"
+        giros = []
+        convertida = True
+        for indice in range(int(round(360.0 / angle_step))):
+            # rotate rellena las esquinas con el color_key o con alpha 0
+            girada = pygame.transform.rotate(base, indice * angle_step)
+            girada, convertida = prepare_surface(girada, clave[1], alpha)
+            giros.append(girada)
+        giros = tuple(giros)
+        tamano = sum(surface_size(girada) for girada in giros)
+        self._entradas[clave] = [giros, convertida, tamano]
+        self.used_bytes += tamano
+        self._ajusta_presupuesto(clave)
+        return giros
+
+    def rotation_masks(self, path, angle_step=DEFAULT_ANGLE_STEP, scale=1.0,
+                       color_key=None, alpha=False):
+        """
+        Obtiene las máscaras de colisión de las versiones giradas de una
+        imagen (ver 'rotations') y el rectángulo que envuelve sus pixels
+        opacos, relativo a la esquina de cada imagen girada.
+
+        :return: Tupla de (pygame.mask.Mask, pygame.Rect) por giro
+        """
+        clave = (self._clave(path, color_key, alpha) +
+                 ('rot', angle_step, scale))
+        giros = self._mascaras.get(clave)
+        if giros is None:
+            datos = []
+            for girada in self.rotations(path, angle_step, scale,
+                                         color_key, alpha):
+                mascara = pygame.mask.from_surface(girada)
+                limites = mascara.get_bounding_rects()
+                if limites:
+                    envolvente = limites[0].unionall(limites[1:])
+                else:
+                    envolvente = girada.get_rect()
+                datos.append((mascara, envolvente))
+            giros = self._mascaras[clave] = tuple(datos)
+        return giros
+
+    def mask(self, path, color_key=None, alpha=False, frame_size=None,
+             index=0):
+        """
+        Obtiene la máscara de colisión de una imagen: los pixels que no
+        son del color_key, o con alpha superior a 127 si la imagen usa
+        canal alpha. Se calcula una sola vez por ruta, color_key y modo
+        alpha (y fotograma, en las tiras de animación).
+
+        :param path: Ruta del fichero de imagen
+        :param color_key: Tupla (R, G, B) o None
+        :param alpha: True si la imagen usa canal alpha
+        :param frame_size: Tamaño de fotograma si es una tira de
+        animación, o None
+        :param index: Índice del fotograma en la tira
+        :return: pygame.mask.Mask compartida
+        """
+        clave = self._clave(path, color_key, alpha)
+        if frame_size is not None:
+            clave += (tuple(frame_size), index)
+        mascara = self._mascaras.get(clave)
+        if mascara is None:
+            if frame_size is None:
+                superficie = self.get(path, color_key, alpha)
+            else:
+                superficie = self.frames(path, frame_size, color_key,
+                                         alpha)[index]
+            mascara = self._mascaras[clave] = pygame.mask.from_surface(
+                superficie)
+        return mascara
+
+    def _descarta(self, clave):
+        entrada = self._entradas.pop(clave)
+        self.used_bytes -= entrada[2]
+
+    def _ajusta_presupuesto(self, clave_protegida=None):
+        """
+        Descarta entradas (primero originales, luego superficies
+        preparadas) en orden LRU hasta quedar dentro del presupuesto.
+        """
+        while self.used_bytes > self.max_bytes and self._originales:
+            path, original = self._originales.popitem(last=False)
+            self.used_bytes -= surface_size(original)
+            self.evictions += 1
+        for clave in list(self._entradas):
+            if self.used_bytes <= self.max_bytes:
+                break
+            if clave != clave_protegida:
+                self._descarta(clave)
+                self.evictions += 1
+
+    def display_changed(self):
+        """
+        Marca todas las superficies como pendientes de convertir. Debe
+        llamarse tras cambiar el modo de pantalla; la siguiente petición
+        de cada imagen la vuelve a preparar a partir del original.
+        """
+        for entrada in self._entradas.values():
+            entrada[1] = False
+
+    def invalidate(self, path=None):
+        """
+        Elimina de la caché las entradas de una ruta, o todas si no se
+        indica ninguna.
+
+        :param path: Ruta a invalidar o None
+        """
+        for clave in list(self._entradas):
+            if path is None or clave[0] == path:
+                self._descarta(clave)
+        for clave in list(self._mascaras):
+            if path is None or clave[0] == path:
+                del self._mascaras[clave]
+        for ruta in list(self._originales):
+            if path is None or ruta == path:
+                self.used_bytes -= surface_size(self._originales.pop(ruta))
+
+    def clear(self):
+        """
+        Vacía la caché y reinicia los contadores.
+        """
+        self.invalidate()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        :return: Diccionario con los contadores de la caché
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entradas),
+            'masks': len(self._mascaras),
+            'used_bytes': self.used_bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+    def __contains__(self, clave):
+        return self._clave(*clave) in self._entradas
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+# Caché compartida por todos los objetos de juego del proceso
+image_cache = ImageCache()
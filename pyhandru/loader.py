@@ -0,0 +1,225 @@
+"""
+Carga de recursos en paralelo.
+
+Un juego declara en un AssetManifest las imágenes, efectos de sonido y
+música que necesita. AssetLoader decodifica esos ficheros en un pool de
+hilos (la decodificación de pygame/SDL libera el GIL) y, desde el hilo
+principal, los va añadiendo a las cachés compartidas (image_cache y
+sound_cache), de forma que al crear la habitación ya no se lee nada de
+disco. Mientras tanto informa del progreso para poder dibujar una
+pantalla de carga.
+
+    class MiJuego(Game):
+        manifest = AssetManifest(
+            images=['images/Moon.gif', ('images/Demon.gif', (82, 46, 41))],
+            sounds=['sound/Explosion.wav'],
+            music=['sound/Music.mp3'])
+"""
+
+__author__ = 'andriu'
+
+import os
+import time
+from concurrent import futures
+
+import pygame
+
+from pyhandru.images import image_cache
+from pyhandru.sound import sound_cache
+from pyhandru.startup import ensure_mixer
+
+# Hilos de carga por defecto
+DEFAULT_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+IMAGE = 'image'
+SOUND = 'sound'
+MUSIC = 'music'
+
+
+class AssetManifest(object):
+    """
+    Lista de recursos de un juego.
+
+    Las imágenes pueden indicarse como ruta, (ruta, color_key) o (ruta,
+    color_key, alpha); con color_key o alpha la imagen se deja además
+    preparada para la pantalla con esa combinación.
+    """
+
+    def __init__(self, images=(), sounds=(), music=()):
+        """
+        :param images: Imágenes del juego
+        :param sounds: Ficheros de efectos de sonido
+        :param music: Ficheros de música de fondo
+        """
+        self.images = []
+        self.sounds = list(sounds)
+        self.music = list(music)
+        for imagen in images:
+            self.add_image(imagen)
+
+    def add_image(self, image, color_key=None, alpha=False):
+        """
+        :param image: Ruta o tupla (ruta, color_key[, alpha])
+        """
+        if isinstance(image, (tuple, list)):
+            self.images.append((tuple(image) + (None, False))[:3])
+        else:
+            self.images.append((image, color_key, alpha))
+
+    def add_sound(self, file_name):
+        self.sounds.append(file_name)
+
+    def add_music(self, file_name):
+        self.music.append(file_name)
+
+    def __len__(self):
+        return len(self.images) + len(self.sounds) + len(self.music)
+
+
+def _lee_fichero(file_name):
+    with open(file_name, 'rb') as fichero:
+        return fichero.read()
+
+
+class AssetLoader(object):
+    """
+    Carga los recursos de un AssetManifest en un pool de hilos.
+
+    Los hilos sólo decodifican; las cachés se rellenan en el hilo
+    principal dentro de 'poll' o 'wait'.
+    """
+
+    def __init__(self, manifest, workers=DEFAULT_WORKERS):
+        """
+        :param manifest: AssetManifest con los recursos a cargar
+        :param workers: Número de hilos de carga
+        """
+        self.manifest = manifest
+        self.workers = workers
+        self._executor = None
+        # futuro -> (tipo, ruta)
+        self._pendientes = {}
+        self.total = 0
+        self.loaded = 0
+        self.started = None
+        self.elapsed = 0.0
+
+    def start(self):
+        """
+        Lanza la decodificación de los recursos que todavía no están en
+        las cachés.
+        """
+        assert self._executor is None, "La carga ya se ha iniciado"
+        self.started = time.perf_counter()
+        self._executor = futures.ThreadPoolExecutor(self.workers)
+        tareas = []
+        vistas = set()
+        for path, color_key, alpha in self.manifest.images:
+            if path not in vistas and image_cache.needs_decode(path):
+                vistas.add(path)
+                tareas.append((IMAGE, path, pygame.image.load))
+        for file_name in self.manifest.sounds:
+            if file_name not in vistas and file_name not in sound_cache:
+                vistas.add(file_name)
+                tareas.append((SOUND, file_name, pygame.mixer.Sound))
+        for file_name in self.manifest.music:
+            if file_name not in vistas:
+                vistas.add(file_name)
+                tareas.append((MUSIC, file_name, _lee_fichero))
+
+        if any(tipo == SOUND for tipo, _, _ in tareas):
+            # El mixer debe estar arrancado antes de crear sonidos en los
+            # hilos
+            ensure_mixer()
+
+        # Las imágenes con color_key o alpha se preparan al final
+        self.total = len(tareas) + 1
+        for tipo, path, carga in tareas:
+            futuro = self._executor.submit(carga, path)
+            self._pendientes[futuro] = (tipo, path)
+
+    @property
+    def progress(self):
+        """
+        :return: Fracción de recursos cargados, entre 0 y 1
+        """
+        if not self.total:
+            return 0.0
+        return self.loaded / float(self.total)
+
+    @property
+    def done(self):
+        return self.total > 0 and self.loaded == self.total
+
+    def poll(self):
+        """
+        Añade a las cachés los recursos ya decodificados. No bloquea.
+
+        :return: Progreso de la carga, entre 0 y 1
+        """
+        for futuro in [futuro for futuro in self._pendientes
+                       if futuro.done()]:
+            self._instala(futuro)
+        if not self._pendientes and not self.done:
+            self._finaliza()
+        return self.progress
+
+    def wait(self, on_progress=None):
+        """
+        Espera a que termine la carga.
+
+        :param on_progress: Función a la que se llama con el progreso
+        (entre 0 y 1) cada vez que se completa algún recurso
+        :return: Segundos que ha durado la carga
+        """
+        if self._executor is None:
+            self.start()
+        for futuro in futures.as_completed(list(self._pendientes)):
+            if futuro in self._pendientes:
+                self._instala(futuro)
+                if on_progress is not None:
+                    on_progress(self.progress)
+        if not self.done:
+            self._finaliza()
+            if on_progress is not None:
+                on_progress(self.progress)
+        return self.elapsed
+
+    def load(self, on_progress=None):
+        """
+        Inicia la carga y espera a que termine.
+
+        :return: Segundos que ha durado la carga
+        """
+        return self.wait(on_progress)
+
+    def _instala(self, futuro):
+        tipo, path = self._pendientes.pop(futuro)
+        try:
+            # Relanza en el hilo principal los errores de decodificación
+            recurso = futuro.result()
+        except BaseException:
+            self._cancela()
+            raise
+        if tipo == IMAGE:
+            image_cache.put_original(path, recurso)
+        elif tipo == SOUND:
+            sound_cache.put(path, recurso)
+        else:
+            sound_cache.put_music(path, recurso)
+        self.loaded += 1
+
+    def _finaliza(self):
+        # Prepara las combinaciones de color_key y alpha pedidas
+        for path, color_key, alpha in self.manifest.images:
+            if color_key is not None or alpha:
+                image_cache.get(path, color_key, alpha)
+        self.loaded += 1
+        self._executor.shutdown()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _cancela(self):
+        for futuro in self._pendientes:
+            futuro.cancel()
+        self._pendientes.clear()
+        self._executor.shutdown()
@@ -0,0 +1,229 @@
+"""
+Sistema de partículas por lotes.
+
+Cada ParticleEmitter guarda el estado de sus partículas (posición,
+velocidad y vida restante) en arrays compactos en lugar de usar un
+GameObject por partícula. En cada paso de lógica actualiza todas las
+partículas de una vez y las dibuja con una sola llamada a Surface.blits,
+todas con la misma imagen compartida de la caché.
+
+Con NumPy disponible los arrays son de NumPy; si no, se usan listas de
+Python con el mismo comportamiento.
+
+    chispas = ParticleEmitter('images/Fireball.gif', lifetime=20,
+                              gravity=0.5)
+    room.add_emitter(chispas)
+    chispas.emit(objeto.rect.center, 30)
+"""
+
+__author__ = 'andriu'
+
+import math
+import random
+from itertools import repeat
+
+import pygame
+
+from pyhandru.images import image_cache
+
+try:
+    import numpy
+except ImportError:  # NumPy es opcional
+    numpy = None
+
+# Máximo de partículas vivas por emisor por defecto
+DEFAULT_CAPACITY = 2048
+
+# Filas de la tabla de estado
+_X, _Y, _VX, _VY, _VIDA = range(5)
+
+
+class ParticleEmitter(object):
+    """
+    Emisor de partículas que comparten imagen y comportamiento.
+
+    Las partículas salen del punto de emisión en una dirección aleatoria
+    dentro de un abanico ('direction' +- 'spread' / 2, en grados, 0 hacia
+    la derecha y 90 hacia arriba), con una velocidad aleatoria entre
+    'speed'. Cada paso se mueven según su velocidad, 'gravity' se suma a
+    su velocidad vertical y pierden un paso de vida. No colisionan ni
+    reciben eventos.
+    """
+
+    def __init__(self, img_path, lifetime=30, speed=(1.0, 4.0),
+                 direction=0, spread=360, gravity=0.0, color_key=None,
+                 alpha=False, capacity=DEFAULT_CAPACITY):
+        """
+        :param img_path: Ruta de la imagen de las partículas
+        :param lifetime: Pasos de lógica que vive cada partícula
+        :param speed: Tupla (mínima, máxima) de la velocidad inicial en
+        pixels por paso
+        :param direction: Dirección central de emisión en grados
+        :param spread: Amplitud del abanico de emisión en grados
+        :param gravity: Aceleración vertical en pixels por paso
+        :param color_key: Tupla (R, G, B) usada como transparencia o None
+        :param alpha: True si la imagen usa canal alpha
+        :param capacity: Máximo de partículas vivas; las que se emitan por
+        encima se descartan
+        """
+        self.img_path = img_path
+        self.color_key = color_key
+        self.alpha = alpha
+        self.lifetime = lifetime
+        self.speed = speed
+        self.direction = direction
+        self.spread = spread
+        self.gravity = gravity
+        self.capacity = capacity
+
+        self.count = 0
+        if numpy is not None:
+            self._datos = numpy.zeros((5, capacity), dtype=numpy.float64)
+        else:
+            self._datos = [[], [], [], [], []]
+
+        # Estadísticas
+        self.emitted = 0
+        self.dropped = 0
+
+    @property
+    def image(self):
+        """
+        Imagen de las partículas, preparada para la pantalla actual.
+        """
+        return image_cache.get(self.img_path, self.color_key, self.alpha)
+
+    def emit(self, pos_xy, count=1):
+        """
+        Emite partículas desde un punto.
+
+        :param pos_xy: Tupla (x, y) del centro de emisión
+        :param count: Número de partículas a emitir
+        :return: Número de partículas emitidas
+        """
+        libres = self.capacity - self.count
+        if count > libres:
+            self.dropped += count - libres
+            count = libres
+        if count <= 0:
+            return 0
+
+        # Se usa el módulo 'random' para que la emisión sea reproducible
+        # con la semilla del juego
+        x, y = pos_xy
+        minima, maxima = self.speed
+        inicio = self.direction - self.spread / 2.0
+        nuevas = ([], [], [], [], [])
+        for _ in range(count):
+            angulo = math.radians(inicio + random.random() * self.spread)
+            velocidad = random.uniform(minima, maxima)
+            nuevas[_X].append(x)
+            nuevas[_Y].append(y)
+            nuevas[_VX].append(math.cos(angulo) * velocidad)
+            nuevas[_VY].append(-math.sin(angulo) * velocidad)
+            nuevas[_VIDA].append(self.lifetime)
+
+        if numpy is not None:
+            self._datos[:, self.count:self.count + count] = nuevas
+        else:
+            for fila, valores in zip(self._datos, nuevas):
+                fila.extend(valores)
+        self.count += count
+        self.emitted += count
+        return count
+
+    def update(self):
+        """
+        Avanza un paso todas las partículas y elimina las que han agotado
+        su vida.
+        """
+        n = self.count
+        if not n:
+            return
+        gravedad = self.gravity
+
+        if numpy is not None:
+            datos = self._datos[:, :n]
+            datos[_X] += datos[_VX]
+            datos[_Y] += datos[_VY]
+            datos[_VY] += gravedad
+            datos[_VIDA] -= 1
+            vivas = datos[_VIDA] > 0
+            quedan = int(numpy.count_nonzero(vivas))
+            if quedan < n:
+                # Compacta las vivas al principio de los arrays
+                self._datos[:, :quedan] = datos[:, vivas]
+            self.count = quedan
+            return
+
+        xs, ys, vxs, vys, vidas = self._datos
+        filas = [(x + vx, y + vy, vx, vy + gravedad, vida - 1)
+                 for x, y, vx, vy, vida in zip(xs, ys, vxs, vys, vidas)
+                 if vida > 1]
+        self._datos = ([list(fila) for fila in zip(*filas)]
+                       if filas else [[], [], [], [], []])
+        self.count = len(filas)
+
+    def _posiciones(self):
+        """
+        :return: Listas de coordenadas X e Y (enteras) de las partículas
+        """
+        n = self.count
+        if numpy is not None:
+            return (self._datos[_X, :n].astype(numpy.int64).tolist(),
+                    self._datos[_Y, :n].astype(numpy.int64).tolist())
+        return ([int(x) for x in self._datos[_X]],
+                [int(y) for y in self._datos[_Y]])
+
+    def bounds(self):
+        """
+        Rectángulo que envuelve todas las partículas vivas tal y como se
+        dibujarán.
+
+        :return: pygame.Rect o None si no hay partículas
+        """
+        if not self.count:
+            return None
+        ancho, alto = self.image.get_size()
+        xs, ys = self._posiciones()
+        izquierda = min(xs) - ancho // 2
+        arriba = min(ys) - alto // 2
+        return pygame.Rect(izquierda, arriba,
+                           max(xs) - ancho // 2 - izquierda + ancho,
+                           max(ys) - alto // 2 - arriba + alto)
+
+    def draw(self, canvas, offset=None):
+        """
+        Dibuja todas las partículas, centradas en su posición, con una
+        sola llamada a Surface.blits.
+
+        :param canvas: Superficie donde dibujar
+        :param offset: Tupla (dx, dy) a sumar a las posiciones (la cámara
+        de la habitación) o None
+        """
+        if not self.count:
+            return
+        imagen = self.image
+        ancho, alto = imagen.get_size()
+        xs, ys = self._posiciones()
+        mitad_x, mitad_y = ancho // 2, alto // 2
+        if offset is not None:
+            mitad_x -= offset[0]
+            mitad_y -= offset[1]
+        destinos = zip([x - mitad_x for x in xs], [y - mitad_y for y in ys])
+        canvas.blits(zip(repeat(imagen), destinos), doreturn=False)
+
+    def clear(self):
+        """
+        Elimina todas las partículas.
+        """
+        self.count = 0
+        if numpy is None:
+            self._datos = [[], [], [], [], []]
+
+    def stats(self):
+        return {'alive': self.count, 'capacity': self.capacity,
+                'emitted': self.emitted, 'dropped': self.dropped}
+
+    def __len__(self):
+        return self.count
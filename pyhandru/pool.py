@@ -0,0 +1,94 @@
+"""
+Reciclado de objetos de juego ('object pooling').
+
+Las clases con 'pool_size' mayor que 0 no se descartan al eliminarse de la
+habitación ('kill()'): se guardan en un pool y RoomObject.spawn las
+reutiliza llamando a su método 'reset' en lugar de crear una instancia
+nueva.
+"""
+
+__author__ = 'andriu'
+
+from collections import deque
+
+
+class ObjectPool(object):
+    """
+    Pool de instancias libres de una clase de objeto de juego.
+    """
+
+    def __init__(self, clase, capacity):
+        """
+        :param clase: Clase de los objetos del pool
+        :param capacity: Número máximo de instancias libres que se guardan
+        """
+        self.clase = clase
+        self.capacity = capacity
+        self._libres = deque()
+        # Las mismas instancias, para detectar devoluciones repetidas
+        self._en_pool = set()
+
+        # Estadísticas
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+        self.discarded = 0
+
+    def acquire(self):
+        """
+        :return: Una instancia libre o None si el pool está vacío
+        """
+        if self._libres:
+            self.reused += 1
+            objeto = self._libres.pop()
+            self._en_pool.discard(objeto)
+            return objeto
+        return None
+
+    def release(self, objeto):
+        """
+        Devuelve una instancia al pool. Si está lleno se descarta; si ya
+        estaba en el pool no se hace nada.
+
+        :param objeto: Instancia eliminada de la habitación
+        """
+        if objeto in self._en_pool:
+            return
+        if len(self._libres) < self.capacity:
+            self._libres.append(objeto)
+            self._en_pool.add(objeto)
+            self.recycled += 1
+        else:
+            self.discarded += 1
+
+    def resize(self, capacity):
+        """
+        Cambia la capacidad del pool. Las instancias libres que no caben
+        se descartan (cuentan en 'discarded', no en 'reused').
+
+        :param capacity: Número máximo de instancias libres
+        """
+        self.capacity = capacity
+        while len(self._libres) > capacity:
+            self._en_pool.discard(self._libres.popleft())
+            self.discarded += 1
+
+    def clear(self):
+        self._libres.clear()
+        self._en_pool.clear()
+
+    def stats(self):
+        """
+        :return: Diccionario con las estadísticas del pool
+        """
+        return {
+            'free': len(self._libres),
+            'capacity': self.capacity,
+            'created': self.created,
+            'reused': self.reused,
+            'recycled': self.recycled,
+            'discarded': self.discarded,
+        }
+
+    def __len__(self):
+        return len(self._libres)
@@ -0,0 +1,413 @@
+"""
+Perfilador por fotograma de una habitación.
+
+Mide el tiempo de cada fase del bucle (eventos, step, colisiones, update y
+blit) y el tiempo de 'step' y 'collision' de cada subclase de GameObject.
+Las muestras se guardan en un buffer circular de tamaño fijo y pueden
+mostrarse en pantalla o exportarse al formato 'trace event' de Chrome
+(chrome://tracing, Perfetto).
+
+La instrumentación se instala envolviendo los métodos de la habitación y
+de las clases de los objetos al activar el perfilador, y se retira al
+desactivarlo: desactivado no cuesta nada. Los métodos de las clases se
+envuelven en la propia clase, así que mientras está activo los objetos de
+esas clases en otras habitaciones también pasan por la envoltura, aunque
+sólo se miden los de la habitación perfilada. RoomManager lo desactiva al
+descartar la habitación; si la habitación se gestiona a mano hay que
+llamar a 'detach' cuando deje de usarse.
+
+    profiler = Profiler()
+    profiler.attach(room)
+    ...
+    profiler.export_chrome_trace('trace.json')
+    profiler.detach()
+"""
+
+__author__ = 'andriu'
+
+import functools
+import json
+import time
+
+import pygame
+
+from pyhandru.startup import ensure_font
+
+DEFAULT_CAPACITY = 600
+
+# Fases del fotograma, en orden de ejecución
+PHASES = ('eventos', 'step', 'colisiones', 'update', 'blit')
+
+# Métodos de la habitación que se envuelven y la fase a la que corresponden.
+# 'update' se calcula como actualiza_estado - colisiones.
+_METODOS_HABITACION = (
+    ('procesa_eventos', 'eventos'),
+    ('step', 'step'),
+    ('check_for_collisions', 'colisiones'),
+    ('actualiza_estado', '_actualiza_estado'),
+    ('blit', 'blit'),
+)
+
+# Métodos de los objetos de juego medidos por clase
+CLASS_METHODS = ('step', 'collision')
+
+OVERLAY_COLOR = (255, 255, 0)
+OVERLAY_BACKGROUND = (0, 0, 0)
+
+
+class FrameSample(object):
+    """
+    Muestra de un fotograma: instante de inicio y duración (segundos) de
+    cada fase, y tiempo y número de llamadas por (clase, método).
+    """
+    __slots__ = ('frame', 'start', 'duration', 'phases', 'classes')
+
+    def __init__(self):
+        self.frame = -1
+        self.start = 0.0
+        self.duration = 0.0
+        # fase -> [inicio, duración]
+        self.phases = {}
+        # (clase, método) -> [tiempo, llamadas]
+        self.classes = {}
+
+
+class Profiler(object):
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, overlay=False,
+                 clock=time.perf_counter):
+        """
+        :param capacity: Número de fotogramas que guarda el buffer circular
+        :param overlay: True para mostrar los tiempos en pantalla
+        :param clock: Función que devuelve el instante actual en segundos
+        """
+        assert capacity > 0, "La capacidad debe ser positiva"
+        self.capacity = capacity
+        self.overlay = overlay
+        self.clock = clock
+
+        self._muestras = [FrameSample() for _ in range(capacity)]
+        self._siguiente = 0
+        self.frames_recorded = 0
+
+        self._actual = None
+        self._origen = clock()
+
+        self.room = None
+        # clase -> {método: valor en cls.__dict__ antes de instrumentar}
+        self._clases = {}
+        self._font = None
+
+    #
+    # Instalación de la instrumentación
+    #
+    @property
+    def enabled(self):
+        return self.room is not None
+
+    def attach(self, room):
+        """
+        Activa el perfilador sobre una habitación.
+
+        :param room: RoomObject a medir
+        """
+        assert self.room is None, "El perfilador ya está activo"
+        self.room = room
+        room.profiler = self
+
+        for metodo, fase in _METODOS_HABITACION:
+            setattr(room, metodo,
+                    self._envuelve_fase(getattr(room, metodo), fase))
+        room.frame = self._envuelve_frame(room.frame)
+
+        for objeto_de_juego in room.objetos_de_juego:
+            self.instrument(type(objeto_de_juego))
+
+    def detach(self):
+        """
+        Desactiva el perfilador y retira toda la instrumentación. Las
+        muestras recogidas se conservan.
+        """
+        room = self.room
+        if room is None:
+            return
+        for metodo, _ in _METODOS_HABITACION + (('frame', None),):
+            room.__dict__.pop(metodo, None)
+        room.profiler = None
+
+        for clase, originales in self._clases.items():
+            for metodo, original in originales.items():
+                if original is None:
+                    delattr(clase, metodo)
+                else:
+                    setattr(clase, metodo, original)
+        self._clases.clear()
+        self.room = None
+        self._actual = None
+
+    def instrument(self, clase):
+        """
+        Instrumenta los métodos 'step', 'collision' y 'collision_<grupo>'
+        de una clase de objeto de juego. La habitación lo llama al añadir objetos mientras
+        el perfilador está activo.
+
+        :param clase: Subclase de GameObject
+        """
+        if clase in self._clases:
+            return
+        originales = self._clases[clase] = {}
+        metodos = list(CLASS_METHODS)
+        metodos.extend(nombre for nombre in dir(clase)
+                       if nombre.startswith('collision_')
+                       and callable(getattr(clase, nombre)))
+        for metodo in metodos:
+            funcion = self._resuelve(clase, metodo)
+            if funcion is None:
+                continue
+            originales[metodo] = clase.__dict__.get(metodo)
+            setattr(clase, metodo,
+                    self._envuelve_metodo(funcion, clase.__name__, metodo))
+
+    @staticmethod
+    def _resuelve(clase, metodo):
+        # Busca la implementación real, ignorando las envolturas que ya
+        # se hayan instalado en clases padre
+        for base in clase.__mro__:
+            funcion = base.__dict__.get(metodo)
+            if funcion is not None:
+                return getattr(funcion, '__wrapped__', funcion)
+        return None
+
+    def _envuelve_fase(self, metodo, fase):
+        reloj = self.clock
+        profiler = self
+
+        @functools.wraps(metodo)
+        def envoltura(*args, **kwargs):
+            t0 = reloj()
+            try:
+                return metodo(*args, **kwargs)
+            finally:
+                muestra = profiler._actual
+                if muestra is not None:
+                    # En modo de paso fijo una fase puede ejecutarse varias
+                    # veces por fotograma: se acumula
+                    acumulado = muestra.phases.get(fase)
+                    if acumulado is None:
+                        muestra.phases[fase] = [t0, reloj() - t0]
+                    else:
+                        acumulado[1] += reloj() - t0
+        return envoltura
+
+    def _envuelve_frame(self, metodo):
+        profiler = self
+
+        @functools.wraps(metodo)
+        def envoltura(*args, **kwargs):
+            profiler.begin_frame()
+            try:
+                return metodo(*args, **kwargs)
+            finally:
+                profiler.end_frame()
+        return envoltura
+
+    def _envuelve_metodo(self, funcion, nombre_clase, metodo):
+        reloj = self.clock
+        profiler = self
+        clave = (nombre_clase, metodo)
+
+        @functools.wraps(funcion)
+        def envoltura(objeto, *args, **kwargs):
+            # La envoltura está en la clase: sólo se miden los objetos de
+            # la habitación perfilada
+            if objeto.room is not profiler.room:
+                return funcion(objeto, *args, **kwargs)
+            t0 = reloj()
+            try:
+                return funcion(objeto, *args, **kwargs)
+            finally:
+                muestra = profiler._actual
+                if muestra is not None:
+                    acumulado = muestra.classes.get(clave)
+                    if acumulado is None:
+                        muestra.classes[clave] = [reloj() - t0, 1]
+                    else:
+                        acumulado[0] += reloj() - t0
+                        acumulado[1] += 1
+        return envoltura
+
+    #
+    # Muestras
+    #
+    def begin_frame(self):
+        """
+        Empieza la muestra de un nuevo fotograma, reutilizando la entrada
+        más antigua del buffer circular.
+        """
+        muestra = self._muestras[self._siguiente]
+        muestra.frame = self.room.frame_count if self.room else -1
+        muestra.start = self.clock()
+        muestra.duration = 0.0
+        muestra.phases.clear()
+        muestra.classes.clear()
+        self._actual = muestra
+
+    def end_frame(self):
+        """
+        Cierra la muestra del fotograma actual.
+        """
+        muestra = self._actual
+        if muestra is None:
+            return
+        muestra.duration = self.clock() - muestra.start
+
+        # 'update' es lo que queda de actualiza_estado sin las colisiones
+        actualiza = muestra.phases.pop('_actualiza_estado', None)
+        if actualiza is not None:
+            colisiones = muestra.phases.get('colisiones', (0.0, 0.0))[1]
+            muestra.phases['update'] = [actualiza[0] + colisiones,
+                                        actualiza[1] - colisiones]
+
+        self._actual = None
+        self._siguiente = (self._siguiente + 1) % self.capacity
+        self.frames_recorded += 1
+
+        if self.overlay and self.room is not None:
+            self.draw_overlay(self.room.canvas, muestra)
+
+    def samples(self):
+        """
+        :return: Lista de muestras guardadas, de la más antigua a la más
+        reciente
+        """
+        guardadas = min(self.frames_recorded, self.capacity)
+        inicio = (self._siguiente - guardadas) % self.capacity
+        return [self._muestras[(inicio + i) % self.capacity]
+                for i in range(guardadas)]
+
+    def last_sample(self):
+        """
+        :return: Última muestra completa o None
+        """
+        if not self.frames_recorded:
+            return None
+        return self._muestras[(self._siguiente - 1) % self.capacity]
+
+    def summary(self):
+        """
+        Calcula el tiempo medio por fotograma (milisegundos) de cada fase y
+        de cada (clase, método) en las muestras guardadas.
+
+        :return: Diccionario con 'frame_ms', 'phases' y 'classes'
+        """
+        muestras = self.samples()
+        n = float(len(muestras)) or 1.0
+        fases = dict((fase, 0.0) for fase in PHASES)
+        clases = {}
+        total = 0.0
+        for muestra in muestras:
+            total += muestra.duration
+            for fase, (inicio, duracion) in muestra.phases.items():
+                fases[fase] = fases.get(fase, 0.0) + duracion
+            for clave, (tiempo, llamadas) in muestra.classes.items():
+                acumulado = clases.setdefault(clave, [0.0, 0])
+                acumulado[0] += tiempo
+                acumulado[1] += llamadas
+        return {
+            'frames': len(muestras),
+            'frame_ms': 1000.0 * total / n,
+            'phases': dict((fase, 1000.0 * t / n) for fase, t in fases.items()),
+            'classes': dict(('%s.%s' % clave, {'ms': 1000.0 * t / n,
+                                               'calls': llamadas / n})
+                            for clave, (t, llamadas) in clases.items()),
+        }
+
+    #
+    # Exportación y visualización
+    #
+    def chrome_trace_events(self):
+        """
+        Genera los eventos en formato 'trace event' de Chrome. Los tiempos
+        por clase son acumulados del fotograma, así que se dibujan como
+        bloques consecutivos dentro de su fase.
+
+        :return: Lista de diccionarios de evento
+        """
+        def us(segundos):
+            return (segundos - self._origen) * 1e6
+
+        eventos = []
+        for muestra in self.samples():
+            eventos.append({
+                'name': 'frame', 'cat': 'frame', 'ph': 'X',
+                'ts': us(muestra.start), 'dur': muestra.duration * 1e6,
+                'pid': 1, 'tid': 1, 'args': {'frame': muestra.frame}})
+            for fase, (inicio, duracion) in muestra.phases.items():
+                eventos.append({
+                    'name': fase, 'cat': 'phase', 'ph': 'X',
+                    'ts': us(inicio), 'dur': duracion * 1e6,
+                    'pid': 1, 'tid': 1})
+            desplazamiento = {}
+            for (clase, metodo), (tiempo, llamadas) in sorted(
+                    muestra.classes.items()):
+                fase = 'step' if metodo == 'step' else 'colisiones'
+                inicio = muestra.phases.get(fase, (muestra.start, 0.0))[0]
+                offset = desplazamiento.get(fase, 0.0)
+                desplazamiento[fase] = offset + tiempo
+                eventos.append({
+                    'name': '%s.%s' % (clase, metodo), 'cat': 'class',
+                    'ph': 'X', 'ts': us(inicio + offset), 'dur': tiempo * 1e6,
+                    'pid': 1, 'tid': 1, 'args': {'calls': llamadas}})
+        return eventos
+
+    def export_chrome_trace(self, path):
+        """
+        Guarda las muestras en un fichero JSON para chrome://tracing.
+
+        :param path: Ruta del fichero
+        """
+        with open(path, 'w') as fichero:
+            json.dump({'traceEvents': self.chrome_trace_events(),
+                       'displayTimeUnit': 'ms'}, fichero)
+
+    def draw_overlay(self, canvas, muestra=None):
+        """
+        Dibuja los tiempos del último fotograma en la esquina superior
+        izquierda de la pantalla.
+
+        :param canvas: Superficie donde dibujar
+        :param muestra: Muestra a mostrar, por defecto la última
+        """
+        muestra = muestra or self.last_sample()
+        if muestra is None:
+            return
+        if self._font is None:
+            ensure_font()
+            self._font = pygame.font.Font(None, 18)
+
+        lineas = ['frame %.2f ms' % (muestra.duration * 1000.0)]
+        lineas.append('  '.join(
+            '%s %.2f' % (fase, muestra.phases[fase][1] * 1000.0)
+            for fase in PHASES if fase in muestra.phases))
+        mas_costosas = sorted(muestra.classes.items(),
+                              key=lambda item: item[1][0], reverse=True)[:3]
+        for (clase, metodo), (tiempo, llamadas) in mas_costosas:
+            lineas.append('%s.%s %.2f ms (%d)' % (clase, metodo,
+                                                  tiempo * 1000.0, llamadas))
+
+        superficies = [self._font.render(linea, True, OVERLAY_COLOR,
+                                         OVERLAY_BACKGROUND)
+                       for linea in lineas]
+        zona = pygame.Rect(0, 0, max(s.get_width() for s in superficies),
+                           sum(s.get_height() for s in superficies))
+        y = 0
+        for superficie in superficies:
+            canvas.blit(superficie, (0, y))
+            y += superficie.get_height()
+        pygame.display.update(zona)
+
+        # Con rectángulos sucios hay que restaurar el fondo en el
+        # siguiente fotograma
+        renderer = getattr(self.room, 'dirty_renderer', None)
+        if renderer is not None:
+            renderer.damage(zona)
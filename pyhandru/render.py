@@ -0,0 +1,219 @@
+"""
+Renderizado por rectángulos sucios ('dirty rectangles').
+
+En lugar de redibujar toda la pantalla en cada fotograma, sólo se
+restaura el fondo y se redibujan los objetos en las zonas que han
+cambiado, y se envían a pantalla únicamente esas zonas con
+pygame.display.update(rects).
+
+Con cámara (ver pyhandru.camera) las zonas se calculan en coordenadas de
+pantalla y sólo se tienen en cuenta los objetos visibles; si la cámara se
+mueve se redibuja todo, porque cambia la pantalla entera.
+"""
+
+__author__ = 'andriu'
+
+import pygame
+
+# Si la superficie dañada supera esta fracción de la pantalla se redibuja
+# todo y se usa pygame.display.flip()
+DEFAULT_FULL_REDRAW_RATIO = 0.5
+
+
+class DirtyRectRenderer(object):
+    """
+    Renderizador por rectángulos sucios para una habitación.
+
+    Recuerda el rect y la imagen con la que se dibujó cada objeto en el
+    fotograma anterior. Un objeto ha cambiado si se ha movido, ha cambiado
+    de imagen, acaba de entrar en la habitación o ha salido de ella.
+    """
+
+    def __init__(self, room, full_redraw_ratio=DEFAULT_FULL_REDRAW_RATIO):
+        """
+        :param room: Habitación a dibujar
+        :type room: RoomObject
+
+        :param full_redraw_ratio: Fracción de la pantalla a partir de la
+        cual se redibuja todo
+        :type full_redraw_ratio: float
+        """
+        self.room = room
+        self.full_redraw_ratio = full_redraw_ratio
+
+        # objeto -> (rect dibujado, imagen dibujada)
+        self._dibujados = {}
+
+        # Zonas de objetos que han salido de la habitación
+        self._zonas_liberadas = []
+
+        # Zona que ocupaban las partículas en el último fotograma
+        self._zona_efectos = None
+
+        self._redibujar_todo = True
+
+        # Posición de la cámara en el último fotograma
+        self._vista = None
+
+        # Estadísticas del último fotograma
+        self.last_rects = 0
+        self.last_full_redraw = True
+
+    def invalidate(self):
+        """
+        Fuerza un redibujado completo en el siguiente fotograma.
+        """
+        self._redibujar_todo = True
+
+    def forget(self, objeto):
+        """
+        Se llama cuando un objeto sale de la habitación; su última zona
+        dibujada debe restaurarse con el fondo.
+
+        :param objeto: GameObject eliminado
+        """
+        dibujado = self._dibujados.pop(objeto, None)
+        if dibujado is not None:
+            self._zonas_liberadas.append(dibujado[0])
+
+    def damage(self, rect):
+        """
+        Marca una zona de la pantalla para restaurarla con el fondo en el
+        siguiente fotograma (p.ej. tras dibujar encima algo ajeno a la
+        habitación).
+
+        :param rect: pygame.Rect de la zona dañada
+        """
+        self._zonas_liberadas.append(pygame.Rect(rect))
+
+    @staticmethod
+    def _zona(objeto, collision_visible, desplazamiento=None):
+        if collision_visible:
+            zona = objeto.rect.union(objeto.bound_rect)
+        else:
+            zona = objeto.rect.copy()
+        if desplazamiento is not None:
+            zona.move_ip(desplazamiento)
+        return zona
+
+    def _zona_de_efectos(self, desplazamiento):
+        zona = self.room.effects_bounds()
+        if zona is not None and desplazamiento is not None:
+            zona.move_ip(desplazamiento)
+        return zona
+
+    def _dibuja_todo(self, collision_visible, desplazamiento=None):
+        room = self.room
+        canvas = room.canvas
+        vista = room.camera.view if room.camera is not None else None
+        canvas.blit(room.background(), (0, 0), vista)
+        room.draw_tilemaps(canvas, vista, desplazamiento)
+        dibujados = self._dibujados
+        dibujados.clear()
+        for objeto_de_juego in room.visible_objects():
+            objeto_de_juego.draw(canvas, collision_visible, desplazamiento)
+            dibujados[objeto_de_juego] = (
+                self._zona(objeto_de_juego, collision_visible,
+                           desplazamiento),
+                objeto_de_juego.image)
+        room.draw_effects(canvas, desplazamiento)
+        self._zona_efectos = self._zona_de_efectos(desplazamiento)
+        del self._zonas_liberadas[:]
+        self._redibujar_todo = False
+        self.last_rects = 0
+        self.last_full_redraw = True
+        pygame.display.flip()
+
+    def render(self, collision_visible=False):
+        """
+        Dibuja el fotograma actual.
+
+        :param collision_visible: True para dibujar también los bound_rect
+        """
+        room = self.room
+        camara = room.camera
+        desplazamiento = None
+        if camara is not None:
+            vista = camara.update()
+            desplazamiento = camara.offset
+            if vista.topleft != self._vista:
+                self._vista = vista.topleft
+                self._redibujar_todo = True
+
+        if self._redibujar_todo:
+            self._dibuja_todo(collision_visible, desplazamiento)
+            return
+
+        canvas = room.canvas
+        dibujados = self._dibujados
+
+        # Calcula las zonas dañadas: la zona anterior y la nueva de cada
+        # objeto que ha cambiado, y la de cada objeto que ha salido
+        sucias = self._zonas_liberadas
+        self._zonas_liberadas = []
+        objetos = room.visible_objects()
+        if camara is not None:
+            # Los objetos que han salido de la vista también dejan zona
+            visibles = set(objetos)
+            for objeto_de_juego in [objeto_de_juego
+                                    for objeto_de_juego in dibujados
+                                    if objeto_de_juego not in visibles]:
+                sucias.append(dibujados.pop(objeto_de_juego)[0])
+        for objeto_de_juego in objetos:
+            dibujado = dibujados.get(objeto_de_juego)
+            zona = self._zona(objeto_de_juego, collision_visible,
+                              desplazamiento)
+            if dibujado is None:
+                sucias.append(zona)
+            elif dibujado[0] != zona or dibujado[1] is not objeto_de_juego.image:
+                zona_anterior = dibujado[0]
+                if zona_anterior.colliderect(zona):
+                    sucias.append(zona_anterior.union(zona))
+                else:
+                    sucias.append(zona_anterior)
+                    sucias.append(zona)
+            else:
+                continue
+            dibujados[objeto_de_juego] = (zona, objeto_de_juego.image)
+
+        # Las partículas cambian en cada paso: se restaura la zona que
+        # ocupaban y se redibuja la que ocupan ahora
+        zona_efectos = self._zona_de_efectos(desplazamiento)
+        if self._zona_efectos is not None:
+            sucias.append(self._zona_efectos)
+        if zona_efectos is not None:
+            sucias.append(zona_efectos)
+        self._zona_efectos = zona_efectos
+
+        pantalla = canvas.get_rect()
+        sucias = [zona.clip(pantalla) for zona in sucias]
+        sucias = [zona for zona in sucias if zona.width and zona.height]
+        if not sucias:
+            self.last_rects = 0
+            self.last_full_redraw = False
+            return
+
+        area = sum(zona.width * zona.height for zona in sucias)
+        if area > self.full_redraw_ratio * pantalla.width * pantalla.height:
+            self._dibuja_todo(collision_visible, desplazamiento)
+            return
+
+        # Restaura el fondo y redibuja, recortando a cada zona sucia, los
+        # objetos que la tocan. Así se respeta el orden de dibujado.
+        fondo = room.background()
+        origen = camara.view.topleft if camara is not None else (0, 0)
+        rects = [dibujados[objeto_de_juego][0] for objeto_de_juego in objetos]
+        clip_anterior = canvas.get_clip()
+        for zona in sucias:
+            canvas.set_clip(zona)
+            canvas.blit(fondo, zona, zona.move(origen))
+            room.draw_tilemaps(canvas, zona.move(origen), desplazamiento)
+            for indice in zona.collidelistall(rects):
+                objetos[indice].draw(canvas, collision_visible,
+                                     desplazamiento)
+        canvas.set_clip(clip_anterior)
+        room.draw_effects(canvas, desplazamiento)
+
+        self.last_rects = len(sucias)
+        self.last_full_redraw = False
+        pygame.display.update(sucias)
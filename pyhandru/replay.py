@@ -0,0 +1,299 @@
+"""
+Grabación y reproducción determinista de partidas.
+
+InputRecorder guarda, fotograma a fotograma, los eventos de entrada que
+procesa la habitación y el tiempo que devolvió su reloj, junto con la
+semilla de 'random' del juego. InputReplay vuelve a inyectar esa misma
+secuencia: la habitación recibe los eventos grabados en lugar de los
+reales y un reloj que devuelve los tiempos grabados sin esperar, así que
+la partida se repite exactamente y tan rápido como se pueda ejecutar.
+
+Desde la línea de comandos, sin tocar el juego:
+
+    PYHANDRU_RECORD=partida.replay python evil_clutches.py
+    PYHANDRU_REPLAY=partida.replay python evil_clutches.py
+
+o desde código:
+
+    from pyhandru import replay
+    game = replay.run(GameEvilClutches, 'partida.replay')
+    print(game.input_replay.stats())
+"""
+
+__author__ = 'andriu'
+
+import gzip
+import json
+import os
+import time
+
+import pygame
+from pygame.locals import (QUIT, KEYDOWN, KEYUP, MOUSEMOTION,
+                           MOUSEBUTTONDOWN, MOUSEBUTTONUP, USEREVENT)
+
+MAGIC = 'PYMKREPLAY'
+VERSION = 1
+
+# Variables de entorno para grabar / reproducir cualquier juego
+RECORD_ENV = 'PYHANDRU_RECORD'
+REPLAY_ENV = 'PYHANDRU_REPLAY'
+
+# Tipos de evento que se graban, además de los de usuario (USEREVENT en
+# adelante). Los de ventana no afectan a la lógica del juego.
+RECORDED_TYPES = frozenset((QUIT, KEYDOWN, KEYUP, MOUSEMOTION,
+                            MOUSEBUTTONDOWN, MOUSEBUTTONUP))
+
+# Sesión a reproducir por el siguiente Game que se cree (ver 'run')
+_pendiente = None
+
+
+def _serializable(valor):
+    if valor is None or isinstance(valor, (bool, int, float, str)):
+        return True
+    if isinstance(valor, (tuple, list)):
+        return all(_serializable(elemento) for elemento in valor)
+    return False
+
+
+class _RelojGrabador(object):
+    """
+    Envuelve el reloj de la habitación y anota lo que devuelve 'tick'.
+    """
+
+    def __init__(self, reloj, dts):
+        self.reloj = reloj
+        self._dts = dts
+
+    def tick(self, framerate=0):
+        dt = self.reloj.tick(framerate)
+        self._dts.append(dt)
+        return dt
+
+    def get_time(self):
+        return self.reloj.get_time()
+
+    def get_fps(self):
+        return self.reloj.get_fps()
+
+
+class _RelojReproductor(object):
+    """
+    Reloj que devuelve los tiempos grabados, sin esperar.
+    """
+
+    def __init__(self, sesion):
+        self._sesion = sesion
+        self._ultimo = 0
+
+    def tick(self, framerate=0):
+        self._ultimo = self._sesion._siguiente_dt()
+        return self._ultimo
+
+    def get_time(self):
+        return self._ultimo
+
+    def get_fps(self):
+        return 1000.0 / self._ultimo if self._ultimo else 0.0
+
+
+class InputRecorder(object):
+    """
+    Graba los eventos de entrada y los tiempos de fotograma de las
+    habitaciones a las que se engancha.
+    """
+
+    def __init__(self, seed, path=None):
+        """
+        :param seed: Semilla de 'random' usada por el juego
+        :param path: Fichero donde guardar la grabación con 'save'
+        """
+        self.seed = seed
+        self.path = path
+        self.room = None
+        self.dts = []
+        # fotograma -> lista de [tipo, atributos]
+        self.events = {}
+
+    @property
+    def frame(self):
+        """
+        Fotograma actual de la grabación
+        """
+        return len(self.dts)
+
+    def attach(self, room):
+        """
+        Engancha la grabación a una habitación (desengancha la anterior).
+        """
+        self.detach()
+        self.room = room
+        room.clock = _RelojGrabador(room.clock, self.dts)
+        room.input_recorder = self
+
+    def detach(self):
+        room = self.room
+        if room is None:
+            return
+        room.clock = room.clock.reloj
+        room.input_recorder = None
+        self.room = None
+
+    def record_events(self, eventos):
+        """
+        Anota los eventos que procesa la habitación en este fotograma.
+
+        :param eventos: Lista de pygame.event.Event
+        """
+        grabados = [[evento.type,
+                     {clave: valor for clave, valor in evento.dict.items()
+                      if _serializable(valor)}]
+                    for evento in eventos
+                    if evento.type in RECORDED_TYPES or
+                    evento.type >= USEREVENT]
+        if grabados:
+            self.events.setdefault(self.frame, []).extend(grabados)
+
+    def save(self, path=None):
+        """
+        Guarda la grabación en un fichero JSON comprimido con gzip.
+
+        :param path: Fichero de destino, por defecto el del constructor
+        """
+        path = path or self.path
+        datos = {
+            'magic': MAGIC,
+            'version': VERSION,
+            'seed': self.seed,
+            'frames': len(self.dts),
+            'dt': self.dts,
+            'events': {str(fotograma): eventos
+                       for fotograma, eventos in self.events.items()},
+        }
+        with gzip.open(path, 'wt', encoding='utf-8') as fichero:
+            json.dump(datos, fichero, separators=(',', ':'))
+
+
+class InputReplay(object):
+    """
+    Reproduce una grabación de InputRecorder.
+    """
+
+    def __init__(self, seed, dts, events):
+        self.seed = seed
+        self.dts = dts
+        self.events = events
+        self.frames = len(dts)
+        self.room = None
+        self._frame = 0
+        self._inicio = None
+        self.elapsed = 0.0
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: Fichero de grabación
+        :return: InputReplay
+        """
+        with gzip.open(path, 'rt', encoding='utf-8') as fichero:
+            datos = json.load(fichero)
+        if datos.get('magic') != MAGIC or datos.get('version') != VERSION:
+            raise ValueError("%s no es una grabación válida" % path)
+        eventos = {int(fotograma): lista
+                   for fotograma, lista in datos['events'].items()}
+        return cls(datos['seed'], datos['dt'], eventos)
+
+    @property
+    def remaining(self):
+        """
+        Fotogramas que quedan por reproducir
+        """
+        return max(0, self.frames - self._frame)
+
+    @property
+    def done(self):
+        return self._frame >= self.frames
+
+    def attach(self, room):
+        """
+        Engancha la reproducción a una habitación (desengancha la
+        anterior).
+        """
+        self.detach()
+        self.room = room
+        room.clock = _RelojReproductor(self)
+        room.input_source = self
+        if self._inicio is None:
+            self._inicio = time.perf_counter()
+
+    def detach(self):
+        room = self.room
+        if room is None:
+            return
+        room.clock = pygame.time.Clock()
+        room.input_source = None
+        self.room = None
+
+    def events_for_frame(self):
+        """
+        :return: Eventos grabados para el fotograma actual
+        """
+        return [pygame.event.Event(tipo, atributos)
+                for tipo, atributos in self.events.get(self._frame, ())]
+
+    def _siguiente_dt(self):
+        dt = self.dts[self._frame] if self._frame < self.frames else 0
+        self._frame += 1
+        self.elapsed = time.perf_counter() - self._inicio
+        return dt
+
+    def stats(self):
+        """
+        :return: Diccionario con fotogramas reproducidos, segundos y FPS
+        """
+        return {
+            'frames': self._frame,
+            'seconds': self.elapsed,
+            'fps': self._frame / self.elapsed if self.elapsed else 0.0,
+        }
+
+
+def pending_replay():
+    """
+    Devuelve la sesión que debe reproducir el juego que se está creando:
+    la indicada con 'run' o la de la variable de entorno
+    PYHANDRU_REPLAY. None si no hay que reproducir nada.
+    """
+    if _pendiente is not None:
+        return _pendiente
+    path = os.environ.get(REPLAY_ENV)
+    if path:
+        return InputReplay.load(path)
+    return None
+
+
+def recording_path():
+    """
+    :return: Fichero donde grabar según PYHANDRU_RECORD, o None
+    """
+    return os.environ.get(REPLAY_ENV) is None and os.environ.get(
+        RECORD_ENV) or None
+
+
+def run(game_factory, path, max_frames=None):
+    """
+    Crea un juego en modo reproducción y ejecuta la grabación completa,
+    sin ventana ni sonido y sin límite de FPS.
+
+    :param game_factory: Clase o función sin argumentos que crea el juego
+    :param path: Fichero de grabación
+    :param max_frames: Máximo de fotogramas a reproducir, None para todos
+    :return: El juego, con las estadísticas en 'game.input_replay'
+    """
+    global _pendiente
+    _pendiente = InputReplay.load(path)
+    try:
+        game = game_factory()
+    finally:
+        _pendiente = None
+    game.loop(max_frames)
+    return game
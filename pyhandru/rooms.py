@@ -0,0 +1,224 @@
+"""
+Gestor de habitaciones.
+
+Permite que un juego tenga varias habitaciones (niveles, menús...) y
+cambie entre ellas sin tirones:
+
+- Los recursos de la siguiente habitación se decodifican en segundo plano
+  con 'preload' mientras se juega la actual.
+- Las habitaciones reutilizan la pantalla existente si tiene el mismo
+  modo (ver game.get_display).
+- Los recursos de las habitaciones que ya no están activas se liberan de
+  las cachés, empezando por la que lleva más tiempo inactiva, mientras la
+  caché de imágenes supere el presupuesto de memoria.
+
+    game.rooms.register('nivel1', Nivel1, MANIFEST_NIVEL1)
+    game.rooms.register('nivel2', Nivel2, MANIFEST_NIVEL2)
+    game.rooms.goto('nivel1')
+    game.rooms.preload('nivel2')
+"""
+
+__author__ = 'andriu'
+
+from collections import OrderedDict
+
+from pyhandru.images import image_cache
+from pyhandru.sound import sound_cache
+from pyhandru.loader import AssetLoader, DEFAULT_WORKERS
+
+# Memoria de imágenes que se permite conservar de habitaciones inactivas
+# (bytes de la caché de imágenes)
+DEFAULT_ROOM_BUDGET = 32 * 1024 * 1024
+
+
+class _Registro(object):
+    __slots__ = ('factory', 'manifest', 'loader', 'images', 'sounds')
+
+    def __init__(self, factory, manifest):
+        self.factory = factory
+        self.manifest = manifest
+        self.loader = None
+        # Recursos usados por la habitación (los del manifest y los que
+        # se observan al desactivarla)
+        self.images = set()
+        self.sounds = set()
+        if manifest is not None:
+            self.images.update(path for path, _, _ in manifest.images)
+            self.sounds.update(manifest.sounds)
+            self.sounds.update(manifest.music)
+
+
+class RoomManager(object):
+    """
+    Pila de habitaciones de un juego. La habitación de la cima es la
+    activa y se asigna a 'game.room'.
+    """
+
+    def __init__(self, game, memory_budget=DEFAULT_ROOM_BUDGET,
+                 workers=DEFAULT_WORKERS):
+        """
+        :param game: Juego cuyas habitaciones se gestionan
+        :param memory_budget: Bytes de la caché de imágenes a partir de
+        los cuales se liberan los recursos de habitaciones inactivas
+        :param workers: Hilos de carga para 'preload'
+        """
+        self.game = game
+        self.memory_budget = memory_budget
+        self.workers = workers
+        self._registros = {}
+        # Pila de (nombre, habitación)
+        self._pila = []
+        # Habitaciones inactivas con recursos en caché, de la más antigua
+        # a la más reciente
+        self._inactivas = OrderedDict()
+
+        # Estadísticas
+        self.evicted_rooms = 0
+
+    def register(self, name, factory, manifest=None):
+        """
+        Registra una habitación.
+
+        :param name: Nombre de la habitación
+        :param factory: Clase o función sin argumentos que crea la
+        habitación
+        :param manifest: AssetManifest con sus recursos, para 'preload'
+        """
+        self._registros[name] = _Registro(factory, manifest)
+
+    @property
+    def current(self):
+        """
+        :return: Nombre de la habitación activa o None
+        """
+        return self._pila[-1][0] if self._pila else None
+
+    def preload(self, name):
+        """
+        Empieza a decodificar en segundo plano los recursos de una
+        habitación. No bloquea; los recursos se pasan a las cachés con
+        'poll' o, como tarde, al entrar en la habitación.
+
+        :param name: Nombre de la habitación
+        """
+        registro = self._registros[name]
+        if registro.manifest is None or registro.loader is not None:
+            return
+        registro.loader = AssetLoader(registro.manifest, self.workers)
+        registro.loader.start()
+
+    def poll(self):
+        """
+        Pasa a las cachés los recursos ya decodificados de las
+        habitaciones en precarga. No bloquea.
+        """
+        for registro in self._registros.values():
+            if registro.loader is not None and not registro.loader.done:
+                registro.loader.poll()
+
+    def goto(self, name):
+        """
+        Sustituye la habitación activa por otra.
+
+        :param name: Nombre de la habitación
+        :return: La nueva habitación
+        """
+        if self._pila:
+            self._desactiva(*self._pila.pop())
+        return self.push(name)
+
+    def push(self, name):
+        """
+        Activa una habitación encima de la actual, que queda en pausa
+        (p.ej. un menú). 'pop' vuelve a ella.
+
+        :param name: Nombre de la habitación
+        :return: La nueva habitación
+        """
+        registro = self._registros[name]
+        self.preload(name)
+        if registro.loader is not None:
+            registro.loader.wait()
+            registro.loader = None
+        self._inactivas.pop(name, None)
+        habitacion = registro.factory()
+        self._pila.append((name, habitacion))
+        self.game.room = habitacion
+        self._libera()
+        return habitacion
+
+    def pop(self):
+        """
+        Descarta la habitación activa y vuelve a la anterior.
+
+        :return: La habitación que queda activa o None
+        """
+        self._desactiva(*self._pila.pop())
+        habitacion = self._pila[-1][1] if self._pila else None
+        self.game.room = habitacion
+        if habitacion is not None:
+            habitacion.resume()
+        self._libera()
+        return habitacion
+
+    @staticmethod
+    def _imagenes_en_uso(habitacion):
+        """
+        :return: Conjunto de rutas de las imágenes que usan el fondo, los
+        objetos, los emisores y las capas de tiles de una habitación
+        """
+        imagenes = set()
+        if habitacion.img_path_background is not None:
+            imagenes.add(habitacion.img_path_background)
+        for grupo in (habitacion.objetos_de_juego,
+                      habitacion.objetos_estaticos):
+            for objeto_de_juego in grupo:
+                imagenes.add(objeto_de_juego.img_path)
+        for emisor in habitacion.emitters:
+            imagenes.add(emisor.img_path)
+        for capa in habitacion.tilemaps:
+            imagenes.add(capa.tileset_path)
+        return imagenes
+
+    def _desactiva(self, name, habitacion):
+        # Retira la instrumentación que el perfilador deja en las clases
+        # de los objetos (ver Profiler.detach)
+        if getattr(habitacion, 'profiler', None) is not None:
+            habitacion.profiler.detach()
+        registro = self._registros[name]
+        registro.images |= self._imagenes_en_uso(habitacion)
+        if all(nombre != name for nombre, _ in self._pila):
+            self._inactivas[name] = None
+
+    def _libera(self):
+        """
+        Libera los recursos de las habitaciones inactivas, de la más
+        antigua a la más reciente, hasta quedar dentro del presupuesto.
+        Nunca libera recursos que use alguna habitación de la pila o en
+        precarga, estén o no en su manifest.
+        """
+        activas = {nombre for nombre, _ in self._pila}
+        activas.update(nombre for nombre, registro in self._registros.items()
+                       if registro.loader is not None)
+        imagenes_activas = set()
+        sonidos_activos = set()
+        for nombre in activas:
+            imagenes_activas |= self._registros[nombre].images
+            sonidos_activos |= self._registros[nombre].sounds
+        # Imágenes que usan ahora los objetos de las habitaciones de la
+        # pila, incluidos los creados después de cargar el manifest
+        for _, habitacion in self._pila:
+            imagenes_activas |= self._imagenes_en_uso(habitacion)
+
+        while (self._inactivas and
+               image_cache.used_bytes > self.memory_budget):
+            nombre, _ = self._inactivas.popitem(last=False)
+            registro = self._registros[nombre]
+            for path in registro.images - imagenes_activas:
+                image_cache.invalidate(path)
+            for file_name in registro.sounds - sonidos_activos:
+                sound_cache.invalidate(file_name)
+            self.evicted_rooms += 1
+
+    def __len__(self):
+        return len(self._pila)
@@ -0,0 +1,297 @@
+"""
+Simulación sin pantalla y ejecución masiva de partidas.
+
+Simulation crea un juego en modo headless, sin sonido y sin dibujar, con
+un reloj que no espera: cada fotograma avanza un tiempo fijo y se ejecuta
+tan rápido como permita la lógica. Permite avanzar N fotogramas, inyectar
+eventos de entrada y consultar el estado del juego, y nunca sale al
+sistema: 'on_close' sólo marca la simulación como terminada.
+
+    sim = Simulation(GameEvilClutches, seed=42)
+    sim.post(KEYDOWN, key=K_SPACE)
+    sim.step(300)
+    print(sim.state())
+
+BatchRunner reparte muchas simulaciones independientes, una por semilla,
+entre un pool de procesos y mide el rendimiento total. La factoría, la
+función de entradas y la de resultados deben poder enviarse a otro
+proceso (funciones de módulo o functools.partial de ellas):
+
+    resultado = BatchRunner(GameEvilClutches, frames=900,
+                            observe=puntuacion).run(range(1000))
+    print(resultado.summary())
+"""
+
+__author__ = 'andriu'
+
+import os
+import time
+from collections import Counter
+from concurrent import futures
+
+import pygame
+
+from pyhandru.sound import set_silent, is_silent
+
+# Fotogramas por segundo con los que se simula una habitación sin límite
+# de FPS
+DEFAULT_SIMULATION_FPS = 60
+
+# Simulación que se está creando (ver Game.__init__)
+_pendiente = None
+
+
+def pending_simulation():
+    """
+    :return: La Simulation cuyo juego se está creando, o None
+    """
+    return _pendiente
+
+
+class _RelojSimulado(object):
+    """
+    Reloj que avanza un tiempo fijo por fotograma, sin esperar.
+    """
+
+    def __init__(self, frame_ms):
+        self.frame_ms = frame_ms
+
+    def tick(self, framerate=0):
+        return self.frame_ms
+
+    def get_time(self):
+        return self.frame_ms
+
+    def get_fps(self):
+        return 1000.0 / self.frame_ms
+
+
+class Simulation(object):
+    """
+    Juego ejecutado sin pantalla, fotograma a fotograma.
+    """
+
+    def __init__(self, game_factory, seed=None, draw=False, silent=True):
+        """
+        :param game_factory: Clase o función sin argumentos que crea el
+        juego (un Game con su habitación)
+        :param seed: Semilla de 'random', None para una aleatoria (queda
+        en 'seed')
+        :param draw: True para dibujar cada fotograma en la pantalla
+        'dummy', p.ej. para capturarla
+        :param silent: True para no cargar ni reproducir sonidos. Sólo
+        afecta a los SoundObject creados mientras se construye o se avanza
+        la simulación; al terminar se restaura el estado anterior de
+        sound.set_silent
+        """
+        global _pendiente
+        self.seed = seed
+        self.draw = draw
+        self.silent = silent
+        self.frame = 0
+        self.finished = False
+        self.room = None
+        self._cola = []
+
+        anterior = self._silencia()
+        _pendiente = self
+        try:
+            self.game = game_factory()
+        finally:
+            _pendiente = None
+            set_silent(anterior)
+        self.seed = self.game.seed
+
+    def _silencia(self):
+        """
+        Aplica 'silent' y devuelve el estado anterior para restaurarlo.
+        """
+        anterior = is_silent()
+        if self.silent:
+            set_silent()
+        return anterior
+
+    def post(self, event_type, **attributes):
+        """
+        Inyecta un evento de entrada que la habitación procesará en el
+        siguiente fotograma.
+
+        :param event_type: Tipo de evento, p.ej. KEYDOWN
+        :param attributes: Atributos del evento, p.ej. key=K_SPACE
+        """
+        self._cola.append(pygame.event.Event(event_type, attributes))
+
+    def events_for_frame(self):
+        """
+        Eventos del fotograma actual (ver RoomObject.procesa_eventos)
+        """
+        eventos = self._cola
+        self._cola = []
+        return eventos
+
+    def _engancha(self, room):
+        """
+        Prepara la habitación activa para la simulación.
+        """
+        self.room = room
+        room.input_source = self
+        room.draw_enabled = self.draw
+        fps = room.frames_per_second or DEFAULT_SIMULATION_FPS
+        room.clock = _RelojSimulado(1000.0 / fps)
+        # Termina la simulación en lugar de salir al sistema
+        room.on_close = self.stop
+
+    def stop(self):
+        """
+        Termina la simulación. Se llama en lugar de 'on_close'.
+        """
+        self.finished = True
+
+    def step(self, frames=1, inputs=None):
+        """
+        Avanza la simulación.
+
+        :param frames: Fotogramas a ejecutar
+        :param inputs: Función a la que se llama antes de cada fotograma
+        con la simulación; devuelve los eventos a inyectar (lista de
+        pygame.event.Event o de tuplas (tipo, atributos)) o None. Permite
+        controlar el juego con un bot.
+        :return: Fotogramas ejecutados; menos que 'frames' si el juego ha
+        terminado
+        """
+        ejecutados = 0
+        anterior = self._silencia()
+        try:
+            while ejecutados < frames and not self.finished:
+                if self.game.room is not self.room:
+                    self._engancha(self.game.room)
+                if inputs is not None:
+                    for evento in inputs(self) or ():
+                        if not isinstance(evento, pygame.event.EventType):
+                            evento = pygame.event.Event(*evento)
+                        self._cola.append(evento)
+                self.room.frame()
+                self.frame += 1
+                ejecutados += 1
+        finally:
+            set_silent(anterior)
+        return ejecutados
+
+    def state(self):
+        """
+        Estado básico del juego.
+
+        :return: Diccionario con el fotograma, la semilla, si ha
+        terminado y el número de objetos vivos por clase
+        """
+        room = self.game.room
+        return {
+            'frame': self.frame,
+            'seed': self.seed,
+            'finished': self.finished,
+            'objects': dict(Counter(type(objeto).__name__
+                                    for objeto in room.objetos_de_juego)),
+        }
+
+    def run(self, frames, inputs=None, observe=None):
+        """
+        Ejecuta la simulación hasta 'frames' fotogramas o hasta que el
+        juego termine.
+
+        :param frames: Máximo de fotogramas
+        :param inputs: Función de entradas (ver 'step')
+        :param observe: Función a la que se llama al terminar con la
+        simulación y que devuelve el resultado; por defecto 'state'
+        :return: Resultado de 'observe'
+        """
+        self.step(frames, inputs)
+        if observe is None:
+            return self.state()
+        return observe(self)
+
+
+def _simula(tarea):
+    game_factory, seed, frames, inputs, observe = tarea
+    simulacion = Simulation(game_factory, seed)
+    resultado = simulacion.run(frames, inputs, observe)
+    return simulacion.frame, resultado
+
+
+class BatchResult(object):
+    """
+    Resultados de un BatchRunner, en el orden de las semillas.
+    """
+
+    def __init__(self, seeds, results, frames, seconds, workers):
+        self.seeds = seeds
+        self.results = results
+        self.frames = frames
+        self.seconds = seconds
+        self.workers = workers
+
+    @property
+    def simulations_per_second(self):
+        return len(self.results) / self.seconds if self.seconds else 0.0
+
+    @property
+    def frames_per_second(self):
+        return self.frames / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return ('%d simulaciones, %d fotogramas en %.2f s con %d procesos: '
+                '%.1f simulaciones/s, %.0f fotogramas/s' % (
+                    len(self.results), self.frames, self.seconds,
+                    self.workers, self.simulations_per_second,
+                    self.frames_per_second))
+
+    def __iter__(self):
+        return iter(zip(self.seeds, self.results))
+
+    def __len__(self):
+        return len(self.results)
+
+
+class BatchRunner(object):
+    """
+    Ejecuta simulaciones independientes en un pool de procesos.
+    """
+
+    def __init__(self, game_factory, frames, inputs=None, observe=None,
+                 workers=None):
+        """
+        :param game_factory: Factoría del juego (ver Simulation)
+        :param frames: Máximo de fotogramas de cada simulación
+        :param inputs: Función de entradas (ver Simulation.step)
+        :param observe: Función de resultado (ver Simulation.run)
+        :param workers: Número de procesos, por defecto uno por CPU. Con
+        0 se ejecuta todo en este proceso
+        """
+        self.game_factory = game_factory
+        self.frames = frames
+        self.inputs = inputs
+        self.observe = observe
+        self.workers = ((os.cpu_count() or 1) if workers is None
+                        else workers)
+
+    def run(self, seeds):
+        """
+        Ejecuta una simulación por semilla.
+
+        :param seeds: Semillas de las simulaciones
+        :return: BatchResult
+        """
+        seeds = list(seeds)
+        tareas = [(self.game_factory, seed, self.frames, self.inputs,
+                   self.observe) for seed in seeds]
+        inicio = time.perf_counter()
+        if self.workers:
+            # Lotes grandes para repartir el coste de enviar cada tarea
+            lote = max(1, len(tareas) // (self.workers * 4))
+            with futures.ProcessPoolExecutor(self.workers) as pool:
+                salidas = list(pool.map(_simula, tareas, chunksize=lote))
+        else:
+            salidas = [_simula(tarea) for tarea in tareas]
+        segundos = time.perf_counter() - inicio
+        return BatchResult(seeds, [resultado for _, resultado in salidas],
+                           sum(frames for frames, _ in salidas), segundos,
+                           self.workers or 1)
@@ -0,0 +1,245 @@
+"""
+Caché de sonidos decodificados y gestor de voces.
+
+Los ficheros de efectos se decodifican una sola vez por proceso y se
+comparten entre todos los SoundObject. Las reproducciones pasan por un
+gestor de voces que limita cuántas instancias de cada sonido suenan a la
+vez y, cuando no quedan canales libres, roba el canal de la voz menos
+prioritaria.
+"""
+
+__author__ = 'andriu'
+
+import io
+import os
+
+import pygame
+
+from pyhandru.startup import ensure_mixer
+
+# Canales del mixer que usa por defecto el gestor de voces
+DEFAULT_VOICES = 16
+
+# Instancias simultáneas por defecto de un mismo sonido
+DEFAULT_MAX_INSTANCES = 4
+
+# Si es True los SoundObject no cargan ni reproducen nada (ver
+# 'set_silent')
+_silencio = False
+
+
+def set_silent(silent=True):
+    """
+    Desactiva (o vuelve a activar) todo el sonido del proceso: los
+    SoundObject que se creen no cargan sus ficheros ni arrancan el mixer,
+    y 'play' no hace nada. Pensado para simulaciones masivas (ver
+    pyhandru.simulation).
+
+    :param silent: True para desactivar el sonido
+    """
+    global _silencio
+    _silencio = silent
+
+
+def is_silent():
+    return _silencio
+
+
+class SoundCache(object):
+    """
+    Caché de pygame.mixer.Sound por ruta de fichero.
+    """
+
+    def __init__(self):
+        self._sonidos = {}
+        # Contenido de ficheros de música leídos por adelantado (ver
+        # 'put_music')
+        self._musica = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file_name):
+        """
+        Obtiene el sonido decodificado de un fichero, decodificándolo sólo
+        la primera vez.
+
+        :param file_name: Ruta del fichero de sonido
+        :return: pygame.mixer.Sound compartido
+        """
+        sonido = self._sonidos.get(file_name)
+        if sonido is None:
+            self.misses += 1
+            ensure_mixer()
+            sonido = self._sonidos[file_name] = pygame.mixer.Sound(file_name)
+        else:
+            self.hits += 1
+        return sonido
+
+    def put(self, file_name, sound):
+        """
+        Añade a la caché un sonido ya decodificado (p.ej. por
+        pyhandru.loader en otro hilo). Si ya estaba no hace nada.
+        """
+        self._sonidos.setdefault(file_name, sound)
+
+    def put_music(self, file_name, data):
+        """
+        Guarda el contenido de un fichero de música para que
+        'music_source' lo sirva desde memoria.
+
+        :param file_name: Ruta del fichero
+        :param data: bytes del fichero
+        """
+        self._musica[file_name] = data
+
+    def music_source(self, file_name):
+        """
+        Devuelve los argumentos para pygame.mixer.music.load: el fichero
+        en memoria si se leyó por adelantado, o su ruta.
+
+        :return: Tupla de argumentos
+        """
+        data = self._musica.get(file_name)
+        if data is None:
+            return (file_name,)
+        extension = os.path.splitext(file_name)[1][1:].lower()
+        return (io.BytesIO(data), extension)
+
+    def invalidate(self, file_name=None):
+        """
+        Elimina un sonido de la caché, o todos si no se indica ninguno.
+        """
+        if file_name is None:
+            self._sonidos.clear()
+            self._musica.clear()
+        else:
+            self._sonidos.pop(file_name, None)
+            self._musica.pop(file_name, None)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self._sonidos), 'music': len(self._musica)}
+
+    def __contains__(self, file_name):
+        return file_name in self._sonidos
+
+    def __len__(self):
+        return len(self._sonidos)
+
+
+class _Voz(object):
+    __slots__ = ('channel', 'sound', 'priority', 'started')
+
+    def __init__(self, channel, sound, priority, started):
+        self.channel = channel
+        self.sound = sound
+        self.priority = priority
+        self.started = started
+
+
+class VoiceManager(object):
+    """
+    Reparte los canales del mixer entre los sonidos que se reproducen.
+
+    - Cada sonido tiene un máximo de instancias simultáneas; al superarlo
+      se sustituye la instancia más antigua de ese mismo sonido.
+    - Si no quedan canales libres se roba el de la voz de menor prioridad
+      (y, a igual prioridad, la más antigua), siempre que su prioridad no
+      sea mayor que la del sonido nuevo. Si no, el sonido nuevo se descarta.
+    """
+
+    def __init__(self, voices=DEFAULT_VOICES):
+        """
+        :param voices: Número de canales del mixer a usar
+        """
+        self.voices = voices
+        self._activas = []
+        self._configurado = False
+        self._orden = 0
+
+        # Estadísticas
+        self.played = 0
+        self.stolen = 0
+        self.dropped = 0
+
+    def _configura(self):
+        if not self._configurado:
+            ensure_mixer()
+            pygame.mixer.set_num_channels(self.voices)
+            self._configurado = True
+
+    def _limpia(self):
+        # Descarta las voces que ya han terminado
+        self._activas = [voz for voz in self._activas
+                         if voz.channel.get_busy()
+                         and voz.channel.get_sound() is voz.sound]
+
+    def play(self, sound, loops=0, priority=0,
+             max_instances=DEFAULT_MAX_INSTANCES, volume=1.0):
+        """
+        Reproduce un sonido respetando los límites de voces.
+
+        :param sound: pygame.mixer.Sound a reproducir
+        :param loops: Repeticiones adicionales (-1 para bucle infinito)
+        :param priority: Prioridad del sonido; los de mayor prioridad
+        pueden robar el canal a los de menor
+        :param max_instances: Máximo de instancias simultáneas de este
+        sonido, None para no limitar
+        :param volume: Volumen del canal, entre 0.0 y 1.0
+        :return: pygame.mixer.Channel usado o None si se ha descartado
+        """
+        self._configura()
+        self._limpia()
+
+        canal = None
+        if max_instances is not None:
+            mismas = [voz for voz in self._activas if voz.sound is sound]
+            if len(mismas) >= max_instances:
+                canal = self._roba(min(mismas, key=lambda voz: voz.started))
+
+        if canal is None:
+            canal = pygame.mixer.find_channel(False)
+        if canal is None:
+            candidatas = [voz for voz in self._activas
+                          if voz.priority <= priority]
+            if not candidatas:
+                self.dropped += 1
+                return None
+            canal = self._roba(min(candidatas,
+                                   key=lambda voz: (voz.priority,
+                                                    voz.started)))
+
+        canal.play(sound, loops)
+        canal.set_volume(volume)
+        self._orden += 1
+        self._activas.append(_Voz(canal, sound, priority, self._orden))
+        self.played += 1
+        return canal
+
+    def _roba(self, voz):
+        voz.channel.stop()
+        self._activas.remove(voz)
+        self.stolen += 1
+        return voz.channel
+
+    def stop_all(self):
+        for voz in self._activas:
+            voz.channel.stop()
+        self._activas = []
+
+    def active_voices(self):
+        """
+        :return: Número de voces sonando en este momento
+        """
+        self._limpia()
+        return len(self._activas)
+
+    def stats(self):
+        return {'voices': self.voices, 'active': len(self._activas),
+                'played': self.played, 'stolen': self.stolen,
+                'dropped': self.dropped}
+
+
+# Caché y gestor de voces compartidos por todos los SoundObject
+sound_cache = SoundCache()
+voice_manager = VoiceManager()
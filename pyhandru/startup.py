@@ -0,0 +1,120 @@
+"""
+Arranque perezoso de los subsistemas de pygame y cronología de arranque.
+
+En lugar de pygame.init(), que arranca todos los subsistemas, pyhandru
+arranca vídeo, mixer y fuentes la primera vez que se necesitan
+('ensure_video', 'ensure_mixer', 'ensure_font'). Una ejecución sin
+sonido no llega a abrir el dispositivo de audio.
+
+Además se registra una cronología desde que se importa pyhandru hasta
+que se muestra el primer fotograma, para detectar regresiones en el
+tiempo de arranque:
+
+    from pyhandru import startup
+    print(startup.report())
+
+Con la variable de entorno PYHANDRU_STARTUP_REPORT definida, la
+cronología se imprime automáticamente al mostrar el primer fotograma.
+"""
+
+__author__ = 'andriu'
+
+import os
+import sys
+import time
+
+# Instante en que se importó pyhandru (pyhandru/__init__.py importa este
+# módulo antes que ningún otro)
+START = time.perf_counter()
+
+import pygame
+
+# Lista de (etiqueta, segundos desde START, duración en segundos)
+_cronologia = [('import pygame', time.perf_counter() - START,
+                time.perf_counter() - START)]
+_primer_fotograma = False
+
+
+def mark(label, duration=0.0):
+    """
+    Añade un hito a la cronología de arranque.
+
+    :param label: Nombre del hito
+    :param duration: Duración de la tarea que termina en este hito
+    """
+    _cronologia.append((label, time.perf_counter() - START, duration))
+
+
+def _arranca(label, init):
+    t0 = time.perf_counter()
+    init()
+    mark(label, time.perf_counter() - t0)
+
+
+def ensure_video():
+    """
+    Arranca el subsistema de vídeo (y con él los eventos) si no lo está.
+    """
+    if not pygame.display.get_init():
+        _arranca('init video', pygame.display.init)
+
+
+def ensure_mixer():
+    """
+    Arranca el mixer si no lo está, con los parámetros indicados en
+    pygame.mixer.pre_init.
+    """
+    if not pygame.mixer.get_init():
+        _arranca('init mixer', pygame.mixer.init)
+
+
+def ensure_font():
+    """
+    Arranca el subsistema de fuentes si no lo está.
+    """
+    if not pygame.font.get_init():
+        _arranca('init font', pygame.font.init)
+
+
+def first_frame():
+    """
+    Marca que se ha mostrado el primer fotograma. Sólo cuenta la primera
+    llamada.
+    """
+    global _primer_fotograma
+    if _primer_fotograma:
+        return
+    _primer_fotograma = True
+    mark('first flip')
+    if os.environ.get('PYHANDRU_STARTUP_REPORT'):
+        sys.stderr.write(report() + '\n')
+
+
+def timeline():
+    """
+    :return: Lista de tuplas (hito, segundos desde la importación,
+    duración)
+    """
+    return list(_cronologia)
+
+
+def time_to_first_frame():
+    """
+    :return: Segundos desde la importación hasta el primer fotograma, o
+    None si todavía no se ha mostrado
+    """
+    for label, instante, _ in _cronologia:
+        if label == 'first flip':
+            return instante
+    return None
+
+
+def report():
+    """
+    :return: Texto con la cronología de arranque
+    """
+    lineas = ['%10s %10s  %s' % ('t (ms)', 'dur (ms)', 'hito')]
+    for label, instante, duracion in _cronologia:
+        lineas.append('%10.1f %10.1f  %s' % (instante * 1000.0,
+                                             duracion * 1000.0, label))
+    return '\n'.join(lineas)
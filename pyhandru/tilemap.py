@@ -0,0 +1,287 @@
+"""
+Capa de fondo formada por tiles.
+
+Un TileMap dibuja una rejilla de tiles recortados de una hoja (ver
+ImageCache.frames). En lugar de dibujar cada tile en cada fotograma, la
+rejilla se divide en bloques ('chunks') de chunk_tiles x chunk_tiles
+tiles que se pintan una sola vez en una superficie propia; al dibujar
+sólo se copian los bloques visibles. Al cambiar un tile sólo se vuelve a
+pintar su bloque.
+
+Los tiles sólidos se consultan indexando directamente la rejilla, sin
+sprites ni fase amplia:
+
+    nivel = TileMap('images/Tiles.png', (32, 32), NIVEL_1, solid={1, 2})
+    room.add_tilemap(nivel)
+    ...
+    if room.place_free(self.bound_rect.move(self.despl_x, 0)):
+        self.pos_x += self.despl_x
+"""
+
+__author__ = 'andriu'
+
+import pygame
+
+from pyhandru.images import image_cache
+
+# Lado en tiles de cada bloque pre-renderizado
+DEFAULT_CHUNK_TILES = 16
+
+# Valor de la rejilla para las celdas sin tile
+EMPTY = -1
+
+
+class TileMap(object):
+    """
+    Rejilla de tiles con bloques pre-renderizados y consulta de tiles
+    sólidos.
+    """
+
+    def __init__(self, tileset_path, tile_size, grid, solid=(),
+                 color_key=None, alpha=False,
+                 chunk_tiles=DEFAULT_CHUNK_TILES):
+        """
+        :param tileset_path: Ruta de la hoja de tiles; los tiles se
+        numeran por filas desde 0, como los fotogramas de una animación
+        :param tile_size: Tupla (ancho, alto) de cada tile en pixels
+        :param grid: Lista de filas, cada una una lista con el número de
+        tile de cada columna, o EMPTY / None si no hay tile
+        :param solid: Números de los tiles sólidos
+        :param color_key: Tupla (R, G, B) usada como transparencia o None
+        :param alpha: True si la hoja usa canal alpha
+        :param chunk_tiles: Lado en tiles de cada bloque
+        """
+        self.tileset_path = tileset_path
+        self.tile_width, self.tile_height = tile_size
+        self.color_key = color_key
+        self.alpha = alpha
+        self.chunk_tiles = chunk_tiles
+        self.solid = frozenset(solid)
+        self.grid = [[EMPTY if tile is None else tile for tile in fila]
+                     for fila in grid]
+        self.rows = len(self.grid)
+        self.columns = max(len(fila) for fila in self.grid) if grid else 0
+        for fila in self.grid:
+            fila.extend([EMPTY] * (self.columns - len(fila)))
+
+        # Habitación en la que está la capa (ver RoomObject.add_tilemap)
+        self.room = None
+
+        # (columna, fila) del bloque -> superficie pre-renderizada
+        self._bloques = {}
+
+        # Estadísticas
+        self.chunks_rendered = 0
+
+    @property
+    def width(self):
+        return self.columns * self.tile_width
+
+    @property
+    def height(self):
+        return self.rows * self.tile_height
+
+    @property
+    def tiles(self):
+        """
+        Tiles de la hoja, preparados para la pantalla actual
+        """
+        return image_cache.frames(self.tileset_path,
+                                  (self.tile_width, self.tile_height),
+                                  self.color_key, self.alpha)
+
+    #
+    # Consulta y edición de la rejilla
+    #
+    def get_tile(self, column, row):
+        """
+        :return: Número de tile de la celda, o EMPTY si está vacía o fuera
+        de la rejilla
+        """
+        if 0 <= row < self.rows and 0 <= column < self.columns:
+            return self.grid[row][column]
+        return EMPTY
+
+    def set_tile(self, column, row, tile):
+        """
+        Cambia el tile de una celda. Sólo se vuelve a pintar el bloque que
+        la contiene.
+
+        :param column: Columna de la celda
+        :param row: Fila de la celda
+        :param tile: Número de tile, o EMPTY / None para vaciarla
+        """
+        if tile is None:
+            tile = EMPTY
+        if self.grid[row][column] == tile:
+            return
+        self.grid[row][column] = tile
+        self._bloques.pop((column // self.chunk_tiles,
+                           row // self.chunk_tiles), None)
+        self._dana(pygame.Rect(column * self.tile_width,
+                               row * self.tile_height,
+                               self.tile_width, self.tile_height))
+
+    def cell_at(self, x, y):
+        """
+        :return: Tupla (columna, fila) de la celda que contiene el punto
+        """
+        return int(x) // self.tile_width, int(y) // self.tile_height
+
+    def tile_at(self, x, y):
+        """
+        :return: Número de tile en un punto de la habitación
+        """
+        return self.get_tile(*self.cell_at(x, y))
+
+    def is_solid(self, column, row):
+        """
+        :return: True si la celda tiene un tile sólido
+        """
+        return self.get_tile(column, row) in self.solid
+
+    def solid_at(self, x, y):
+        """
+        :return: True si hay un tile sólido en un punto de la habitación
+        """
+        return self.get_tile(*self.cell_at(x, y)) in self.solid
+
+    def _celdas(self, rect):
+        """
+        :return: Rango de columnas y de filas que toca un rectángulo,
+        recortado a la rejilla
+        """
+        columnas = range(max(0, rect.left // self.tile_width),
+                         min(self.columns,
+                             (rect.right - 1) // self.tile_width + 1))
+        filas = range(max(0, rect.top // self.tile_height),
+                      min(self.rows,
+                          (rect.bottom - 1) // self.tile_height + 1))
+        return columnas, filas
+
+    def solid_cells(self, rect):
+        """
+        Celdas sólidas que se solapan con un rectángulo.
+
+        :param rect: pygame.Rect en coordenadas de la habitación
+        :return: Lista de tuplas (columna, fila)
+        """
+        columnas, filas = self._celdas(rect)
+        solidos = self.solid
+        grid = self.grid
+        return [(columna, fila) for fila in filas for columna in columnas
+                if grid[fila][columna] in solidos]
+
+    def collides(self, rect):
+        """
+        :param rect: pygame.Rect en coordenadas de la habitación
+        :return: True si el rectángulo toca algún tile sólido
+        """
+        columnas, filas = self._celdas(rect)
+        solidos = self.solid
+        for fila in filas:
+            tiles = self.grid[fila]
+            for columna in columnas:
+                if tiles[columna] in solidos:
+                    return True
+        return False
+
+    #
+    # Dibujado
+    #
+    def invalidate(self):
+        """
+        Descarta todos los bloques pre-renderizados (p.ej. al cambiar el
+        modo de pantalla o la hoja de tiles).
+        """
+        self._bloques.clear()
+        self._dana(None)
+
+    def _dana(self, rect):
+        room = self.room
+        if room is None or room.dirty_renderer is None:
+            return
+        if rect is None:
+            room.dirty_renderer.invalidate()
+        elif room.camera is not None:
+            room.dirty_renderer.damage(rect.move(room.camera.offset))
+        else:
+            room.dirty_renderer.damage(rect)
+
+    def _bloque(self, columna_bloque, fila_bloque):
+        clave = (columna_bloque, fila_bloque)
+        bloque = self._bloques.get(clave)
+        if bloque is not None:
+            return bloque
+
+        lado = self.chunk_tiles
+        ancho, alto = self.tile_width, self.tile_height
+        tiles = self.tiles
+        columnas = range(columna_bloque * lado,
+                         min(self.columns, (columna_bloque + 1) * lado))
+        filas = range(fila_bloque * lado,
+                      min(self.rows, (fila_bloque + 1) * lado))
+        celdas = [(self.grid[fila][columna], columna, fila)
+                  for fila in filas for columna in columnas]
+
+        tamano = (len(columnas) * ancho, len(filas) * alto)
+        pantalla = pygame.display.get_surface() is not None
+        if self.color_key is not None and not self.alpha:
+            # Se rellena con el color_key de los tiles, que es
+            # transparente tanto en los tiles como en el bloque (RLE)
+            bloque = pygame.Surface(tamano)
+            if pantalla:
+                bloque = bloque.convert()
+            bloque.fill(self.color_key)
+            bloque.set_colorkey(self.color_key, pygame.RLEACCEL)
+        elif self.alpha or any(tile == EMPTY for tile, _, _ in celdas):
+            bloque = pygame.Surface(tamano, pygame.SRCALPHA)
+            if pantalla:
+                bloque = bloque.convert_alpha()
+            bloque.fill((0, 0, 0, 0))
+        else:
+            bloque = pygame.Surface(tamano)
+            if pantalla:
+                bloque = bloque.convert()
+
+        x0 = columna_bloque * lado * ancho
+        y0 = fila_bloque * lado * alto
+        bloque.blits([(tiles[tile], (columna * ancho - x0, fila * alto - y0))
+                      for tile, columna, fila in celdas if tile != EMPTY],
+                     doreturn=False)
+        self._bloques[clave] = bloque
+        self.chunks_rendered += 1
+        return bloque
+
+    def draw(self, canvas, area=None, offset=None):
+        """
+        Dibuja los bloques que se solapan con una zona de la habitación.
+
+        :param canvas: Superficie donde dibujar
+        :param area: pygame.Rect de la zona en coordenadas de la
+        habitación, None para la de la superficie
+        :param offset: Tupla (dx, dy) a sumar a las posiciones (la cámara
+        de la habitación) o None
+        """
+        if area is None:
+            area = canvas.get_rect()
+        dx, dy = offset if offset is not None else (0, 0)
+        lado_x = self.chunk_tiles * self.tile_width
+        lado_y = self.chunk_tiles * self.tile_height
+        columnas = range(max(0, area.left // lado_x),
+                         min((self.columns + self.chunk_tiles - 1) //
+                             self.chunk_tiles,
+                             (area.right - 1) // lado_x + 1))
+        filas = range(max(0, area.top // lado_y),
+                      min((self.rows + self.chunk_tiles - 1) //
+                          self.chunk_tiles,
+                          (area.bottom - 1) // lado_y + 1))
+        canvas.blits([(self._bloque(columna, fila),
+                       (columna * lado_x + dx, fila * lado_y + dy))
+                      for fila in filas for columna in columnas],
+                     doreturn=False)
+
+    def stats(self):
+        return {'columns': self.columns, 'rows': self.rows,
+                'chunks_cached': len(self._bloques),
+                'chunks_rendered': self.chunks_rendered}
@@ -0,0 +1,260 @@
+"""
+Motor de movimiento vectorizado con NumPy (opcional).
+
+Guarda las posiciones, desplazamientos y desfases del 'bound_rect' de los
+objetos de una habitación en arrays contiguos de NumPy (estructura de
+arrays). En cada fotograma integra el movimiento y evalúa las condiciones
+de 'intersect_boundary' y 'out_of_bounds' con operaciones vectoriales, y
+sólo llama a código Python para los objetos marcados.
+
+Diferencia con GameObject.update: todos los objetos evalúan la condición
+de 'intersect_boundary' antes de que ninguno se mueva, y todos se mueven
+antes de evaluar 'out_of_bounds'. Los objetos cuya clase redefine
+'update' se siguen actualizando uno a uno.
+
+Requiere NumPy:
+
+    room.enable_vectorized_movement()
+"""
+
+__author__ = 'andriu'
+
+try:
+    import numpy
+except ImportError:  # NumPy es opcional
+    numpy = None
+
+DEFAULT_CAPACITY = 256
+
+
+def _redondea(valores):
+    """
+    Redondea como pygame.Rect al asignar un float (la mitad se aleja del
+    cero), para que las posiciones coincidan con las de GameObject.update.
+    """
+    return numpy.copysign(numpy.floor(numpy.abs(valores) + 0.5),
+                          valores).astype(numpy.int64)
+
+
+class VectorMovementEngine(object):
+
+    def __init__(self, room, capacity=DEFAULT_CAPACITY):
+        """
+        :param room: Habitación cuyos objetos se mueven
+        :param capacity: Capacidad inicial de los arrays
+        """
+        if numpy is None:
+            raise ImportError("VectorMovementEngine necesita NumPy")
+        self.room = room
+        self._capacidad = 0
+        self.count = 0
+        self.objects = []
+
+        self.x = self.y = None
+        self.dx = self.dy = None
+        self.bound_dx = self.bound_dy = None
+        self.height = None
+        self.alive = None
+        self.has_intersect = self.has_out_of_bounds = None
+        self._reserva(max(1, capacity))
+
+        # Objetos que redefinen 'update' y se actualizan uno a uno
+        self._manuales = {}
+
+        self._actualizando = False
+        self._bajas_pendientes = []
+
+    def _reserva(self, capacidad):
+        """
+        Amplía los arrays a la capacidad indicada, conservando los datos.
+        """
+        def amplia(array, dtype):
+            nuevo = numpy.zeros(capacidad, dtype=dtype)
+            if array is not None:
+                nuevo[:self.count] = array[:self.count]
+            return nuevo
+
+        self.x = amplia(self.x, numpy.int64)
+        self.y = amplia(self.y, numpy.int64)
+        self.dx = amplia(self.dx, numpy.float64)
+        self.dy = amplia(self.dy, numpy.float64)
+        self.bound_dx = amplia(self.bound_dx, numpy.int64)
+        self.bound_dy = amplia(self.bound_dy, numpy.int64)
+        self.height = amplia(self.height, numpy.int64)
+        self.alive = amplia(self.alive, numpy.bool_)
+        self.has_intersect = amplia(self.has_intersect, numpy.bool_)
+        self.has_out_of_bounds = amplia(self.has_out_of_bounds, numpy.bool_)
+        self._capacidad = capacidad
+
+    #
+    # Alta y baja de objetos
+    #
+    def add(self, objeto, base_class):
+        """
+        Registra un objeto. A partir de ese momento sus desplazamientos
+        viven en los arrays del motor.
+
+        :param objeto: GameObject a registrar
+        :param base_class: Clase base (GameObject) para detectar qué
+        eventos redefine la clase del objeto
+        """
+        clase = type(objeto)
+        if clase.update is not base_class.update:
+            self._manuales[objeto] = None
+            return
+        if objeto._motor is self:
+            return
+
+        if self.count == self._capacidad:
+            self._reserva(self._capacidad * 2)
+        i = self.count
+        self.count += 1
+        self.objects.append(objeto)
+
+        self.x[i] = objeto.rect.x
+        self.y[i] = objeto.rect.y
+        self.dx[i] = objeto._despl_x
+        self.dy[i] = objeto._despl_y
+        self.alive[i] = True
+        self.has_intersect[i] = (
+            clase.intersect_boundary is not base_class.intersect_boundary)
+        self.has_out_of_bounds[i] = (
+            clase.out_of_bounds is not base_class.out_of_bounds)
+        objeto._motor = self
+        objeto._indice_motor = i
+        self.refresh(objeto)
+
+    def refresh(self, objeto):
+        """
+        Vuelve a leer del objeto los datos que no cambian con el
+        movimiento (desfase del bound_rect y altura). Debe llamarse si se
+        modifican 'bound_rect' o la imagen de un objeto ya registrado.
+
+        :param objeto: GameObject registrado
+        """
+        if objeto._motor is not self:
+            return
+        i = objeto._indice_motor
+        self.bound_dx[i] = objeto.bound_rect.left - objeto.rect.left
+        self.bound_dy[i] = objeto.bound_rect.top - objeto.rect.top
+        self.height[i] = objeto.height
+
+    def remove(self, objeto):
+        """
+        Da de baja un objeto. Sus desplazamientos siguen en '_despl_x' y
+        '_despl_y', con el tipo con el que se asignaron.
+
+        :param objeto: GameObject a eliminar
+        """
+        if objeto in self._manuales:
+            del self._manuales[objeto]
+            return
+        if objeto._motor is not self:
+            return
+        i = objeto._indice_motor
+        objeto._motor = None
+        objeto._indice_motor = -1
+        self.alive[i] = False
+        if self._actualizando:
+            # No se pueden mover índices a mitad de 'update'
+            self._bajas_pendientes.append(i)
+        else:
+            self._compacta([i])
+
+    def _compacta(self, indices):
+        """
+        Elimina los huecos indicados moviendo a ellos los últimos objetos.
+        """
+        for i in sorted(indices, reverse=True):
+            ultimo = self.count - 1
+            if i != ultimo:
+                objeto = self.objects[ultimo]
+                self.objects[i] = objeto
+                for array in (self.x, self.y, self.dx, self.dy,
+                              self.bound_dx, self.bound_dy, self.height,
+                              self.alive, self.has_intersect,
+                              self.has_out_of_bounds):
+                    array[i] = array[ultimo]
+                if objeto._motor is self:
+                    objeto._indice_motor = i
+            self.objects.pop()
+            self.count -= 1
+
+    #
+    # Actualización
+    #
+    def update(self, width, height):
+        """
+        Equivalente vectorizado de llamar a 'update' en todos los objetos.
+
+        :param width: Ancho de la habitación
+        :param height: Alto de la habitación
+        """
+        for objeto in list(self._manuales):
+            objeto.update(width, height)
+
+        n = self.count
+        if not n:
+            return
+        objetos = self.objects
+        self._actualizando = True
+        try:
+            # intersect_boundary: con la posición que se alcanzaría
+            x, y = self.x[:n], self.y[:n]
+            nx = x + self.dx[:n]
+            ny = y + self.dy[:n]
+            toca = ((nx >= width) | (nx <= 0) |
+                    (ny + self.height[:n] >= height) | (ny <= 0))
+            toca &= self.has_intersect[:n]
+            toca &= self.alive[:n]
+            for i in numpy.flatnonzero(toca).tolist():
+                if self.alive[i]:
+                    objetos[i].intersect_boundary()
+
+            # Integra el movimiento con los desplazamientos actualizados.
+            # Los callbacks pueden haber ampliado los arrays: se vuelven a
+            # tomar las vistas.
+            dx, dy = self.dx[:n], self.dy[:n]
+            x, y = self.x[:n], self.y[:n]
+            movidos = ((dx != 0) | (dy != 0)) & self.alive[:n]
+            x[:] = _redondea(x + dx)
+            y[:] = _redondea(y + dy)
+            self._vuelca(numpy.flatnonzero(movidos).tolist())
+
+            # out_of_bounds
+            fuera = ((x >= width) | (x <= 0) | (y >= height) | (y <= 0))
+            fuera &= self.has_out_of_bounds[:n]
+            fuera &= self.alive[:n]
+            for i in numpy.flatnonzero(fuera).tolist():
+                if self.alive[i]:
+                    objetos[i].out_of_bounds()
+        finally:
+            self._actualizando = False
+            if self._bajas_pendientes:
+                pendientes = self._bajas_pendientes
+                self._bajas_pendientes = []
+                self._compacta(pendientes)
+
+    def _vuelca(self, indices):
+        """
+        Copia las posiciones de los arrays a los 'rect' y 'bound_rect' de
+        los objetos indicados.
+        """
+        if not indices:
+            return
+        objetos = self.objects
+        broad_phase = self.room.broad_phase
+        xs = self.x[indices].tolist()
+        ys = self.y[indices].tolist()
+        bxs = self.bound_dx[indices].tolist()
+        bys = self.bound_dy[indices].tolist()
+        for i, x, y, bx, by in zip(indices, xs, ys, bxs, bys):
+            objeto = objetos[i]
+            objeto.rect.x = x
+            objeto.rect.y = y
+            objeto.bound_rect.x = x + bx
+            objeto.bound_rect.y = y + by
+            broad_phase.move(objeto)
+
+    def __len__(self):
+        return self.count + len(self._manuales)